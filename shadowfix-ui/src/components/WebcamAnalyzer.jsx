@@ -19,6 +19,7 @@ const WebcamAnalyzer = () => {
     const mediaRecorderRef = useRef(null);
     const chunksRef = useRef([]);
     const liveIntervalRef = useRef(null);
+    const liveSocketRef = useRef(null);
 
     // Stop all streams and intervals on cleanup
     const stopEverything = useCallback(() => {
@@ -30,6 +31,10 @@ const WebcamAnalyzer = () => {
             clearInterval(liveIntervalRef.current);
             liveIntervalRef.current = null;
         }
+        if (liveSocketRef.current) {
+            liveSocketRef.current.close();
+            liveSocketRef.current = null;
+        }
         setActive(false);
         setLiveAnalysis(false);
         setRecording(false);
@@ -41,6 +46,7 @@ const WebcamAnalyzer = () => {
     useEffect(() => {
         return () => {
             if (liveIntervalRef.current) clearInterval(liveIntervalRef.current);
+            if (liveSocketRef.current) liveSocketRef.current.close();
         };
     }, []);
 
@@ -135,38 +141,62 @@ const WebcamAnalyzer = () => {
         if (liveAnalysis) {
             if (liveIntervalRef.current) clearInterval(liveIntervalRef.current);
             liveIntervalRef.current = null;
+            if (liveSocketRef.current) liveSocketRef.current.close();
+            liveSocketRef.current = null;
             setLiveAnalysis(false);
             setLiveStatus(null);
         } else {
+            setError(null);
             setLiveAnalysis(true);
-            liveIntervalRef.current = setInterval(async () => {
-                if (!videoRef.current || loading) return;
-
-                const canvas = document.createElement('canvas');
-                canvas.width = 400;
-                canvas.height = 300;
-                canvas.getContext('2d').drawImage(videoRef.current, 0, 0, 400, 300);
-
-                canvas.toBlob(async (blob) => {
-                    if (!blob) return;
-                    try {
-                        const token = await getToken();
-                        const formData = new FormData();
-                        formData.append('file', blob, 'live_frame.jpg');
-                        let apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000';
-                        apiUrl = apiUrl.replace(/\/$/, '');
-                        const response = await fetch(`${apiUrl}/analyze-image`, {
-                            method: 'POST',
-                            headers: { 'Authorization': `Bearer ${token}` },
-                            body: formData,
-                        });
-                        const data = await response.json();
-                        setLiveStatus(data);
-                    } catch (e) {
-                        console.error("Live Analysis failed", e);
-                    }
-                }, 'image/jpeg', 0.5);
-            }, 3000);
+            openLiveSocket();
+        }
+    };
+
+    // One authenticated WebSocket per live session; the server keeps only the latest frame.
+    const openLiveSocket = async () => {
+        try {
+            const token = await getToken();
+            let apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+            apiUrl = apiUrl.replace(/\/$/, '');
+            const wsUrl = `${apiUrl.replace(/^http/, 'ws')}/ws/live?token=${encodeURIComponent(token)}`;
+            const socket = new WebSocket(wsUrl);
+            socket.binaryType = 'arraybuffer';
+            liveSocketRef.current = socket;
+
+            socket.onmessage = (event) => {
+                const data = JSON.parse(event.data);
+                if (data.type === 'result') setLiveStatus(data);
+            };
+            socket.onclose = (event) => {
+                if (liveIntervalRef.current) clearInterval(liveIntervalRef.current);
+                liveIntervalRef.current = null;
+                // Still the current socket: the server (or network) ended the session, not the user
+                if (liveSocketRef.current === socket) {
+                    liveSocketRef.current = null;
+                    setLiveAnalysis(false);
+                    setLiveStatus(null);
+                    setError(`LIVE_SESSION_CLOSED: ${event.reason || 'Connection lost'}. Restart live analysis to reconnect.`);
+                }
+            };
+            socket.onopen = () => {
+                liveIntervalRef.current = setInterval(() => {
+                    // Skip capture while the previous frame is still being sent
+                    if (!videoRef.current || socket.readyState !== WebSocket.OPEN || socket.bufferedAmount > 0) return;
+
+                    const canvas = document.createElement('canvas');
+                    canvas.width = 400;
+                    canvas.height = 300;
+                    canvas.getContext('2d').drawImage(videoRef.current, 0, 0, 400, 300);
+
+                    canvas.toBlob((blob) => {
+                        if (blob && socket.readyState === WebSocket.OPEN) socket.send(blob);
+                    }, 'image/jpeg', 0.5);
+                }, 250);
+            };
+        } catch (e) {
+            console.error("Live Analysis failed", e);
+            setLiveAnalysis(false);
+            setError("LIVE_SESSION_FAILED: Could not connect to the live analysis server.");
         }
     };
 
@@ -0,0 +1,194 @@
+import asyncio
+import gc
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import AsyncIterator, Optional
+
+from fastapi import Request
+
+from app.config import settings
+from app.ingest import INGEST_KINDS, MULTIPART_OVERHEAD_BYTES
+from app.metrics import ADMISSION_BYTES, ADMISSION_REJECTED, current_rss_bytes
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+class AdmissionRejected(Exception):
+    """The worker's memory budget stayed exhausted for the whole queueing window."""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+
+class Reservation:
+    """Bytes held against the budget; release() is idempotent."""
+
+    def __init__(self, budget: "MemoryBudget", nbytes: int):
+        self.budget = budget
+        self.nbytes = nbytes
+
+    def release(self):
+        if self.nbytes:
+            self.budget._release(self.nbytes)
+            self.nbytes = 0
+
+class MemoryBudget:
+    """
+    Per-worker admission control by memory instead of request count.
+    Requests reserve their worst-case footprint (upload bytes + decode headroom) before the body is read;
+    when the budget is exhausted they queue FIFO for a bounded time, then get 503 + Retry-After.
+    A single request larger than the whole budget is still admitted when the worker is otherwise idle.
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.reserved = 0
+        self.tracked = 0
+        self._waiters = deque()  # (nbytes, future)
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def _fits(self, nbytes: int) -> bool:
+        used = self.reserved + self.tracked
+        return used == 0 or used + nbytes <= self.budget_bytes
+
+    def _publish(self):
+        ADMISSION_BYTES.set(self.reserved + self.tracked)
+
+    async def reserve(self, nbytes: int) -> Reservation:
+        if not self._waiters and self._fits(nbytes):
+            self.reserved += nbytes
+            self.admitted += 1
+            self._publish()
+            return Reservation(self, nbytes)
+
+        self.queued += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((nbytes, waiter))
+        try:
+            await asyncio.wait_for(waiter, timeout=settings.ADMISSION_QUEUE_TIMEOUT_S)
+        except asyncio.CancelledError:
+            # Client went away; give back bytes granted in the same tick
+            if waiter.done() and not waiter.cancelled():
+                self._release(nbytes)
+            raise
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            ADMISSION_REJECTED.inc()
+            logger.warning(
+                "Admission rejected: %.1f MB requested, %.1f/%.1f MB in use",
+                nbytes / MB, (self.reserved + self.tracked) / MB, self.budget_bytes / MB,
+            )
+            raise AdmissionRejected(settings.ADMISSION_RETRY_AFTER_S)
+        self.admitted += 1
+        return Reservation(self, nbytes)
+
+    def _release(self, nbytes: int):
+        self.reserved -= nbytes
+        self._wake()
+
+    def _wake(self):
+        # FIFO: a large request at the head is not starved by smaller ones behind it
+        while self._waiters:
+            nbytes, waiter = self._waiters[0]
+            if waiter.done():  # timed out / cancelled
+                self._waiters.popleft()
+                continue
+            if not self._fits(nbytes):
+                break
+            self._waiters.popleft()
+            self.reserved += nbytes
+            waiter.set_result(None)
+        self._publish()
+
+    @contextmanager
+    def track(self, nbytes: int):
+        """Accounts memory that is already allocated (e.g. decoded frames); never blocks."""
+        self.tracked += nbytes
+        self._publish()
+        try:
+            yield
+        finally:
+            self.tracked -= nbytes
+            self._wake()
+
+    def stats(self) -> dict:
+        return {
+            "budget_mb": round(self.budget_bytes / MB, 1),
+            "reserved_mb": round(self.reserved / MB, 1),
+            "decoded_frames_mb": round(self.tracked / MB, 1),
+            "waiting": sum(1 for _, waiter in self._waiters if not waiter.done()),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "forced_gc": gc_policy.collections,
+        }
+
+def request_footprint(request: Request, kinds) -> int:
+    """Worst-case bytes for an upload: declared body size (capped by the kind limits) + decode headroom."""
+    limit = max(getattr(settings, INGEST_KINDS[kind][0]) for kind in kinds)
+    declared = request.headers.get("content-length", "")
+    body = min(int(declared), limit + MULTIPART_OVERHEAD_BYTES) if declared.isdigit() else limit
+    headroom = settings.ADMISSION_VIDEO_DECODE_MB if "video" in kinds else settings.ADMISSION_IMAGE_DECODE_MB
+    return body + headroom * MB
+
+async def admit(request: Request, *kinds: str) -> Reservation:
+    """Reserves an upload's footprint before its body is read (raises AdmissionRejected)."""
+    return await memory_budget.reserve(request_footprint(request, kinds))
+
+async def release_after(stream: AsyncIterator[str], reservation: Reservation) -> AsyncIterator[str]:
+    """Keeps a reservation for the lifetime of a streamed response."""
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        reservation.release()
+
+class GCPolicy:
+    """
+    Explicit collection off the request path: a background check runs a full collection only
+    when RSS crosses the threshold, at most once per GC_MIN_INTERVAL_S. Media buffers are freed
+    by reference counting as soon as requests drop them; this only reclaims leftover cycles.
+    """
+
+    def __init__(self):
+        self.collections = 0
+        self._last = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def threshold_bytes(self) -> int:
+        if settings.GC_RSS_THRESHOLD_MB > 0:
+            return settings.GC_RSS_THRESHOLD_MB * MB
+        return int(settings.ADMISSION_MEMORY_BUDGET_MB * MB * 1.25)
+
+    def maybe_collect(self):
+        now = time.monotonic()
+        if now - self._last < settings.GC_MIN_INTERVAL_S or current_rss_bytes() < self.threshold_bytes():
+            return
+        self._last = now
+        started = time.perf_counter()
+        freed = gc.collect()
+        self.collections += 1
+        logger.info("Background GC: %d objects in %.1f ms (RSS %.0f MB)", freed, (time.perf_counter() - started) * 1000, current_rss_bytes() / MB)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.GC_CHECK_INTERVAL_S)
+            self.maybe_collect()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+# Global admission setup (per worker)
+memory_budget = MemoryBudget(settings.ADMISSION_MEMORY_BUDGET_MB * MB)
+gc_policy = GCPolicy()
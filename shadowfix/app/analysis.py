@@ -0,0 +1,176 @@
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, List, Union
+
+from app.config import settings
+from app.cache import verdict_cache, cache_key
+from app.ingest import IngestedUpload, RejectedUpload, expand_archive
+from app.model import predict_image, MODEL_ID
+from app.singleflight import image_flights, video_flights
+from app.scheduler import inference_scheduler, SlotUnavailable
+from app.utils import MediaBuffer, bytes_to_pil, classify_risk
+from app.metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+# 120s Inference Timeout (Allow for local model loading)
+INFERENCE_TIMEOUT_S = 120.0
+SECURITY_NOTE = "Zero-retention: media discarded."
+
+def build_verdict(probability: float) -> dict:
+    """Shared verdict schema for every analysis endpoint."""
+    risk, flag = classify_risk(probability)
+    return {
+        "verdict": "FAKE" if flag else "REAL",
+        "probability": round(probability, 4),
+        "risk_level": risk,
+        "security_note": SECURITY_NOTE,
+    }
+
+async def analyze_image_content(data, digest: str, face_tracker=None) -> float:
+    """
+    Cached image inference for already-ingested bytes (face_tracker: see predict_image).
+    Concurrent requests for the same content share one in-flight run (live sessions excepted:
+    their face tracker is per session).
+    """
+    key = cache_key(MODEL_ID, digest)
+    probability = await verdict_cache.get(key) if settings.VERDICT_CACHE_ENABLED else None
+    if probability is not None:
+        logger.info("Verdict cache hit for image %s", key)
+        return probability
+
+    if face_tracker is not None or not settings.SINGLEFLIGHT_ENABLED:
+        return await _infer_image(data, key, face_tracker)
+    # The shared run may outlive the request that started it, so it gets its own copy of the bytes
+    return await image_flights.do(key, lambda: _infer_image(bytes(data), key))
+
+async def _infer_image(data, key: str, face_tracker=None) -> float:
+    with observe_stage("image", "decode"):
+        pil_img = bytes_to_pil(data)
+    try:
+        probability = await predict_image(pil_img, source=data, face_tracker=face_tracker)
+    finally:
+        pil_img.close()
+    if settings.VERDICT_CACHE_ENABLED:
+        await verdict_cache.put(key, probability)
+    return probability
+
+async def analyze_video_content(video, suffix: str, digest: str, on_extracted=None, on_progress=None) -> float:
+    """Cached video inference for an already-ingested clip (bytes or MediaBuffer). Callbacks as in predict_video."""
+    # Lazy: OpenCV is only loaded by workers that actually see video traffic (or the "video" warm-up hook)
+    from app.video_model import VIDEO_MODEL_ID
+
+    key = cache_key(VIDEO_MODEL_ID, digest)
+    probability = await verdict_cache.get(key) if settings.VERDICT_CACHE_ENABLED else None
+    if probability is not None:
+        logger.info("Verdict cache hit for video %s", key)
+        return probability
+
+    # Jobs report per-frame progress to their own caller, so only callback-free requests are coalesced
+    if on_extracted or on_progress or not settings.SINGLEFLIGHT_ENABLED:
+        return await _infer_video(video, suffix, key, on_extracted, on_progress)
+    if isinstance(video, MediaBuffer):
+        # Own handle on the clip (no copy): the shared run may outlive the request that started it
+        return await video_flights.do(key, lambda: _infer_shared_video(video.share(), suffix, key))
+    return await video_flights.do(key, lambda: _infer_video(video, suffix, key))
+
+async def _infer_shared_video(buffer: MediaBuffer, suffix: str, key: str) -> float:
+    with buffer:
+        return await _infer_video(buffer, suffix, key)
+
+async def _infer_video(video, suffix: str, key: str, on_extracted=None, on_progress=None) -> float:
+    from app.video_model import predict_video
+
+    result = await predict_video(video, suffix=suffix, on_extracted=on_extracted, on_progress=on_progress)
+    probability = result["overall_probability"]
+    # Degraded runs (no frame scored) are never cached
+    if settings.VERDICT_CACHE_ENABLED and result["frames_analyzed"]:
+        await verdict_cache.put(key, probability)
+    return probability
+
+class BatchRun:
+    """
+    Bounded-parallel batch analysis whose results stream back as NDJSON, one line per item as it finishes.
+    submit() blocks while BATCH_CONCURRENCY items are in flight, which back-pressures the upload/archive reader.
+    Each item also takes an inference slot of the caller's tier, so a large batch can't crowd out interactive traffic.
+    """
+
+    def __init__(self, tier: str):
+        self._tier = tier
+        self._limit = asyncio.Semaphore(max(1, settings.BATCH_CONCURRENCY))
+        self._lines: asyncio.Queue = asyncio.Queue()
+        self._tasks = set()
+        self._next_index = 0
+
+    async def submit(self, item: Union[IngestedUpload, RejectedUpload]):
+        index = self._next_index
+        self._next_index += 1
+        if isinstance(item, RejectedUpload):
+            self._emit({"index": index, "filename": item.filename, "error": item.error})
+            return
+        await self._limit.acquire()
+        task = asyncio.create_task(self._analyze(index, item))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _analyze(self, index: int, item: IngestedUpload):
+        line = {"index": index, "filename": item.filename}
+        try:
+            async with inference_scheduler.slot(self._tier):
+                probability = await asyncio.wait_for(
+                    analyze_image_content(item.data, item.digest),
+                    timeout=INFERENCE_TIMEOUT_S,
+                )
+            line.update(build_verdict(probability))
+        except asyncio.TimeoutError:
+            line["error"] = "Processing timeout"
+        except SlotUnavailable:
+            line["error"] = "Server busy: no inference slot available."
+        except ValueError as e:
+            line["error"] = str(e)
+        except Exception:
+            logger.error("Batch item %d failed", index, exc_info=True)
+            line["error"] = "An internal server error occurred."
+        finally:
+            item.close()
+            self._limit.release()
+        self._emit(line)
+
+    def _emit(self, line: dict):
+        self._lines.put_nowait(json.dumps(line) + "\n")
+
+    async def _expand_archives(self, archives: List[IngestedUpload]):
+        try:
+            for archive in archives:
+                members = expand_archive(archive, settings.BATCH_MAX_ITEMS - self._next_index)
+                while True:
+                    # Members are read one at a time, after a slot is free, so memory stays bounded
+                    item = await asyncio.to_thread(next, members, None)
+                    if item is None:
+                        break
+                    await self.submit(item)
+                archive.close()
+            if self._tasks:
+                await asyncio.gather(*list(self._tasks))
+        finally:
+            for archive in archives:
+                archive.close()
+            self._lines.put_nowait(None)
+
+    async def stream(self, archives: List[IngestedUpload]) -> AsyncIterator[str]:
+        producer = asyncio.create_task(self._expand_archives(archives))
+        try:
+            while True:
+                line = await self._lines.get()
+                if line is None:
+                    break
+                yield line
+        finally:
+            # Client disconnected or stream finished: nothing may outlive the response
+            producer.cancel()
+            self.cancel()
+
+    def cancel(self):
+        for task in list(self._tasks):
+            task.cancel()
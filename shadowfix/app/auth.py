@@ -1,5 +1,10 @@
+import asyncio
 import logging
+import threading
+import time
 import bcrypt
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -26,16 +31,40 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         hashed_password.encode('utf-8')
     )
 
-# Minimal Mock User Data
+# bcrypt is deliberately slow (~250 ms at cost 12): it runs on a small dedicated pool, never on the event loop
+_bcrypt_executor = ThreadPoolExecutor(max_workers=max(1, settings.AUTH_BCRYPT_WORKERS), thread_name_prefix="bcrypt")
+_bcrypt_pending = 0
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    verify_password off the event loop. At most AUTH_BCRYPT_MAX_PENDING checks wait or run at
+    once per worker; beyond that a login flood gets 503 instead of an ever-growing queue.
+    """
+    global _bcrypt_pending
+    if _bcrypt_pending >= settings.AUTH_BCRYPT_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent logins. Retry later.",
+            headers={"Retry-After": "1"},
+        )
+    _bcrypt_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            _bcrypt_executor, verify_password, plain_password, hashed_password
+        )
+    finally:
+        _bcrypt_pending -= 1
+
+# Minimal Mock User Data (hashes precomputed: hashing at import cost every worker ~0.5 s of boot)
 MOCK_USERS = {
     "user@shadowfix.ai": {
         "username": "user",
-        "hashed_password": get_password_hash("shadow_password_123"),
+        "hashed_password": "$2b$12$kt.K37HwoupzaRZmANdQLeMLYXckZtt/gg0ndOJrNCHkVdYR1mJya",  # shadow_password_123
         "role": "user"
     },
     "admin@shadowfix.ai": {
         "username": "admin",
-        "hashed_password": get_password_hash("admin_secure_99"),
+        "hashed_password": "$2b$12$fBqbyG46CdsC7WjTbmR9nOp6Mpg8B1hWExPtfdZFj2Lz3EW35Cpve",  # admin_secure_99
         "role": "admin"
     }
 }
@@ -58,26 +87,76 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        email: str = payload.get("sub")
-        role: str = payload.get("role")
-        if email is None:
-            raise credentials_exception
-        token_data = TokenData(email=email, role=role)
-    except JWTError:
-        raise credentials_exception
-    
-    user = MOCK_USERS.get(token_data.email)
-    if user is None:
-        raise credentials_exception
-    return {"email": token_data.email, "role": user["role"]}
+class VerifiedTokenCache:
+    """
+    Bounded LRU of signature-verified token -> identity (per worker), so repeat requests skip
+    jwt.decode. Entries expire with the token's own `exp`; unverified (Clerk) claims are never cached.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # token -> (identity, expires)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry[1] > time.time():
+                self._entries.move_to_end(token)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[token]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, identity: dict, expires: float):
+        with self._lock:
+            self._entries[token] = (identity, expires)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+# Global verified-token cache (per worker)
+token_cache = VerifiedTokenCache(settings.AUTH_TOKEN_CACHE_SIZE)
+
+_UNPARSED = object()
+
+def request_identity(request) -> Optional[dict]:
+    """
+    The request's bearer identity, parsed once and kept on request.state, so rate-limit
+    key functions and auth dependencies share one decode per request.
+    """
+    identity = getattr(request.state, "identity", _UNPARSED)
+    if identity is _UNPARSED:
+        auth_header = request.headers.get("Authorization") or ""
+        identity = identity_from_token(auth_header[7:]) if auth_header.startswith("Bearer ") else None
+        request.state.identity = identity
+    return identity
+
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)):
+    """Strict auth: only locally signed (mock user) tokens."""
+    identity = request_identity(request)
+    if identity is None or identity["type"] != "mock_auth":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return {"email": identity["email"], "role": identity["role"]}
 
 async def get_optional_user(request: Request):
     """
@@ -85,12 +164,13 @@ async def get_optional_user(request: Request):
     Manually extracts token to avoid framework-level 401s on optional auth.
     Supports both local mock JWTs and Clerk JWTs (via unverified claims for ID tracking).
     """
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        logger.debug("No valid Authorization header found for optional auth.")
-        return None
-    
-    token = auth_header.split(" ")[1]
+    return request_identity(request)
+
+def identity_from_token(token: str):
+    """Resolves a bearer token to a mock or guest (Clerk) identity, or None."""
+    identity = token_cache.get(token)
+    if identity is not None:
+        return identity
     try:
         # 1. Try local verified decode (for mock users)
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
@@ -98,7 +178,10 @@ async def get_optional_user(request: Request):
         user = MOCK_USERS.get(email)
         if user:
             logger.info("Authenticated via local JWT: %s", email)
-            return {"email": email, "role": user["role"], "type": "mock_auth"}
+            identity = {"email": email, "role": user["role"], "type": "mock_auth"}
+            expires = payload.get("exp") or time.time() + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+            token_cache.put(token, identity, float(expires))
+            return identity
     except JWTError:
         # 2. Try unverified extraction (for Clerk tokens) purely for rate-limit ID tracking
         try:
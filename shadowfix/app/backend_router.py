@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from app.config import settings
+from app.metrics import BACKEND_ROUTED, BREAKER_STATE
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitOpenError(ConnectionError):
+    """Cloud inference skipped: the breaker is open and no local fallback is available."""
+
+class _HedgeFailed(Exception):
+    """Both the cloud call and its local hedge failed (no further fallback is worth trying)."""
+
+class BackendRouter:
+    """
+    Chooses cloud or local inference per call, shared by image and video analysis (per worker).
+    Tracks rolling cloud latency/error rate; repeated failures open a circuit breaker that sends
+    traffic to the local engine. While open, a background task probes the cloud (never a user
+    request) and closes the breaker once it answers again. Slow cloud calls can optionally be
+    hedged with a local run after the rolling latency percentile.
+    """
+
+    def __init__(self, name: str = "cloud"):
+        self.name = name
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._window = deque(maxlen=max(1, settings.BREAKER_WINDOW_SIZE))  # (ok, latency seconds)
+        self._probe: Optional[Callable[[], Awaitable[None]]] = None
+        self._probe_task: Optional[asyncio.Task] = None
+        BREAKER_STATE.labels(name).set(_STATE_VALUES[CLOSED])
+
+    # --- Breaker ---
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning("Inference circuit breaker (%s): %s -> %s", self.name, self.state, state)
+        self.state = state
+        BREAKER_STATE.labels(self.name).set(_STATE_VALUES[state])
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+
+    def _cooled_down(self) -> bool:
+        return time.monotonic() - self.opened_at >= settings.BREAKER_OPEN_SECONDS
+
+    def error_rate(self) -> float:
+        if not self._window:
+            return 0.0
+        return sum(1 for ok, _ in self._window if not ok) / len(self._window)
+
+    def latency_percentile(self, q: float) -> Optional[float]:
+        latencies = sorted(latency for ok, latency in self._window if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def record_success(self, latency: float):
+        self._window.append((True, latency))
+        self.consecutive_failures = 0
+
+    def record_failure(self, latency: float):
+        self._window.append((False, latency))
+        self.consecutive_failures += 1
+        if self.state != CLOSED:
+            return
+        tripped = self.consecutive_failures >= settings.BREAKER_FAILURE_THRESHOLD or (
+            len(self._window) >= settings.BREAKER_MIN_SAMPLES and self.error_rate() >= settings.BREAKER_ERROR_RATE
+        )
+        if tripped:
+            self.times_opened += 1
+            self._set_state(OPEN)
+
+    def allow_cloud(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self._probe_task is None and self.state == OPEN and self._cooled_down():
+            # No background prober (e.g. lifespan not run): let one request through as the probe
+            self._set_state(HALF_OPEN)
+            return True
+        return False
+
+    # --- Background Probing ---
+
+    def start(self, probe: Callable[[], Awaitable[None]]):
+        """probe() must raise when the cloud is unhealthy. Runs only while the breaker is open."""
+        self._probe = probe
+        if self._probe_task is None:
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def stop(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+            self._probe_task = None
+
+    async def _probe_loop(self):
+        while True:
+            await asyncio.sleep(1.0)
+            if self.state != OPEN or not self._cooled_down():
+                continue
+            self._set_state(HALF_OPEN)
+            started = time.perf_counter()
+            try:
+                await self._probe()
+            except Exception as e:
+                logger.warning("Inference cloud probe failed: %s", e)
+                self._set_state(OPEN)
+                continue
+            # Healthy again: forget the outage so stale errors don't re-trip the breaker
+            self._window.clear()
+            self.record_success(time.perf_counter() - started)
+            self._set_state(CLOSED)
+
+    # --- Routing ---
+
+    async def _timed_cloud(self, cloud: Callable[[], Awaitable[T]]) -> T:
+        started = time.perf_counter()
+        try:
+            result = await cloud()
+        except asyncio.CancelledError:
+            raise  # hedged away or request cancelled: says nothing about cloud health
+        except Exception:
+            self.record_failure(time.perf_counter() - started)
+            if self.state == HALF_OPEN:
+                self._set_state(OPEN)
+            raise
+        self.record_success(time.perf_counter() - started)
+        if self.state == HALF_OPEN:
+            self._set_state(CLOSED)
+        return result
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not settings.HEDGE_ENABLED or sum(1 for ok, _ in self._window if ok) < settings.HEDGE_MIN_SAMPLES:
+            return None
+        return self.latency_percentile(settings.HEDGE_PERCENTILE)
+
+    async def _hedged(self, cloud: Callable[[], Awaitable[T]], local: Callable[[], Awaitable[T]], delay: float) -> T:
+        cloud_task = asyncio.create_task(self._timed_cloud(cloud))
+        pending = {cloud_task}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return cloud_task.result()
+            self.hedges += 1
+            BACKEND_ROUTED.labels("hedge").inc()
+            pending.add(asyncio.create_task(local()))
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not cloud_task:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise _HedgeFailed() from error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def run(self, cloud: Callable[[], Awaitable[T]], local: Optional[Callable[[], Awaitable[T]]] = None) -> T:
+        """
+        cloud()/local() perform one inference and raise on failure.
+        Without a local fallback, an open breaker fails fast instead of waiting on a dead upstream.
+        """
+        if not self.allow_cloud():
+            if local is None:
+                raise CircuitOpenError("Cloud inference unavailable (circuit open) and no local engine configured.")
+            BACKEND_ROUTED.labels("local").inc()
+            return await local()
+
+        delay = self._hedge_delay() if local is not None else None
+        try:
+            BACKEND_ROUTED.labels("cloud").inc()
+            if delay is not None:
+                return await self._hedged(cloud, local, delay)
+            return await self._timed_cloud(cloud)
+        except _HedgeFailed as e:
+            raise e.__cause__
+        except Exception as e:
+            if local is None:
+                raise
+            logger.warning("Cloud inference failed (%s), using local inference engine.", e)
+            BACKEND_ROUTED.labels("local_fallback").inc()
+            return await local()
+
+    def stats(self) -> dict:
+        p50, p95 = self.latency_percentile(0.5), self.latency_percentile(0.95)
+        return {
+            "state": self.state,
+            "error_rate": round(self.error_rate(), 4),
+            "window": len(self._window),
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "latency_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "latency_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+# Global router (per worker)
+cloud_router = BackendRouter("cloud")
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import List, Optional
+
+from PIL import Image
+from app.config import settings
+from app.local_engine import local_engine
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """
+    Cross-request dynamic micro-batching in front of the local engine.
+    Pending images from concurrent requests are dispatched together once
+    max_batch_size is reached or max_wait_ms has elapsed, whichever comes first.
+    """
+
+    def __init__(self, max_batch_size: int, max_wait_ms: float):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batch_sizes = Counter()
+        self.max_queue_depth = 0
+        self.items = 0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._dispatch_loop(), name="local-batcher")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Fail anything still waiting so callers don't hang on shutdown
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Local batcher stopped"))
+
+    async def submit(self, image: Image.Image) -> list:
+        """Queues one image and waits for its pipeline-style label list."""
+        return (await self.submit_many([image]))[0]
+
+    async def submit_many(self, images: List[Image.Image]) -> List[list]:
+        """Queues several images (e.g. video frames); results come back in input order."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for image in images:
+            future = loop.create_future()
+            self._queue.put_nowait((image, future))
+            futures.append(future)
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return list(await asyncio.gather(*futures))
+
+    async def _dispatch_loop(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Still drain whatever is already queued
+                    if self._queue.empty():
+                        break
+                    batch.append(self._queue.get_nowait())
+                    continue
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Waiters that gave up (timeout/disconnect) don't need a forward pass
+            batch = [(image, future) for image, future in batch if not future.done()]
+            if not batch:
+                continue
+            self.batch_sizes[len(batch)] += 1
+            self.items += len(batch)
+            try:
+                results = await asyncio.to_thread(local_engine.classify, [image for image, _ in batch])
+            except Exception as e:
+                logger.error("Local batch of %d failed: %s", len(batch), e)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> dict:
+        batches = sum(self.batch_sizes.values())
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "batches": batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / batches, 2) if batches else 0.0,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+        }
+
+# Global batcher (one per worker process)
+local_batcher = MicroBatcher(settings.BATCHER_MAX_BATCH_SIZE, settings.BATCHER_MAX_WAIT_MS)
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+class VerdictCache:
+    """
+    Content-addressed verdict cache.
+    Tier 1: in-process LRU with TTL. Tier 2 (optional): SQLite file shared by all workers.
+    Only the content hash and the probability are stored. Media never touches the cache.
+    Disk reads and writes run in a thread: SQLite lock waits across workers must not stall the event loop.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl_seconds: float, disk_path: str = ""):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_path:
+            self._init_disk()
+
+    # --- Disk Tier ---
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_disk(self):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.disk_path)), exist_ok=True)
+            self._connect().execute(
+                "CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, value REAL NOT NULL, expires REAL NOT NULL)"
+            )
+        except sqlite3.Error as e:
+            logger.warning("Verdict cache disk tier disabled (%s): %s", self.disk_path, e)
+            self.disk_path = ""
+
+    def _disk_get(self, key: str) -> Optional[float]:
+        try:
+            row = self._connect().execute(
+                "SELECT value, expires FROM verdicts WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Verdict cache disk read failed: %s", e)
+            return None
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def _disk_put(self, key: str, value: float, expires: float):
+        try:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO verdicts (key, value, expires) VALUES (?, ?, ?)",
+                (key, value, expires),
+            )
+        except sqlite3.Error as e:
+            logger.warning("Verdict cache disk write failed: %s", e)
+
+    def purge_expired(self):
+        """Drops expired rows from the disk tier."""
+        if self.disk_path:
+            try:
+                self._connect().execute("DELETE FROM verdicts WHERE expires < ?", (time.time(),))
+            except sqlite3.Error as e:
+                logger.warning("Verdict cache purge failed: %s", e)
+
+    # --- Public API ---
+
+    def _memory_get(self, key: str, now: float) -> Optional[float]:
+        """Tier 1 lookup (counted as a hit when found; misses are counted once both tiers are checked)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+        return None
+
+    def _disk_get_many(self, keys: List[str]) -> List[Optional[float]]:
+        return [self._disk_get(key) for key in keys]
+
+    async def get(self, key: str) -> Optional[float]:
+        return (await self.get_many([key]))[0]
+
+    async def get_many(self, keys: List[str]) -> List[Optional[float]]:
+        """Looks up several keys; memory misses go to the disk tier in one thread hop."""
+        now = time.time()
+        values = [self._memory_get(key, now) for key in keys]
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing and self.disk_path:
+            found = await asyncio.to_thread(self._disk_get_many, [keys[i] for i in missing])
+        else:
+            found = [None] * len(missing)
+        with self._lock:
+            for i, value in zip(missing, found):
+                if value is None:
+                    self.misses += 1
+                    continue
+                self.disk_hits += 1
+                self._store(keys[i], value, now + self.ttl_seconds)
+                values[i] = value
+        return values
+
+    async def put(self, key: str, value: float):
+        expires = time.time() + self.ttl_seconds
+        with self._lock:
+            self._store(key, value, expires)
+        if self.disk_path:
+            await asyncio.to_thread(self._disk_put, key, value, expires)
+
+    def _store(self, key: str, value: float, expires: float):
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "disk_tier": bool(self.disk_path),
+            }
+
+def _crop_mode() -> str:
+    """What the model is shown: full frames, or face crops from a given detector, model file and padding."""
+    if not settings.FACE_CROP_ENABLED:
+        return "full"
+    return f"face/{settings.FACE_DETECTOR}/{os.path.basename(settings.FACE_DETECTOR_MODEL)}/{settings.FACE_CROP_PADDING}"
+
+def cache_key(model_id: str, digest: str) -> str:
+    """Namespaces a content hash by model and crop mode so a model swap or FACE_CROP change never serves stale verdicts."""
+    return f"{model_id}:{_crop_mode()}:{digest}"
+
+# Global cache setup
+verdict_cache = VerdictCache(
+    "verdict",
+    max_entries=settings.VERDICT_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.VERDICT_CACHE_TTL_SECONDS,
+    disk_path=settings.VERDICT_CACHE_PATH,
+)
+frame_cache = VerdictCache(
+    "frame",
+    max_entries=settings.FRAME_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.VERDICT_CACHE_TTL_SECONDS,
+)
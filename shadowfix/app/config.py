@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -12,14 +13,142 @@ class Settings(BaseSettings):
     SECRET_KEY: str = os.getenv("SECRET_KEY", "7d4a5b4e2f3c1a9d8e7f6b5a4d3c2b1a0f9e8d7c6b5a4d3c2b1a0f9e8d7c6b5a")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
+    AUTH_BCRYPT_WORKERS: int = 2         # dedicated password-check threads per worker
+    AUTH_BCRYPT_MAX_PENDING: int = 32    # waiting + running checks before /login answers 503
+    AUTH_TOKEN_CACHE_SIZE: int = 4096    # verified token -> identity LRU (per worker)
     
     # API Key for M2M integrations
     X_API_KEY: str = os.getenv("X_API_KEY", "shadowfix_internal_key_v2")
     HF_API_TOKEN: str = os.getenv("HF_API_TOKEN", "")
-    
+    # Inference endpoint root; point at bench/fake_hf.py for load tests
+    HF_API_BASE_URL: str = "https://router.huggingface.co/hf-inference/models"
+
+    # Inference HTTP Client (shared keep-alive pool per worker)
+    HF_HTTP2: bool = False
+    HF_POOL_MAX_CONNECTIONS: int = 32
+    HF_POOL_MAX_KEEPALIVE: int = 16
+    HF_KEEPALIVE_EXPIRY: float = 30.0
+    HF_CONNECT_TIMEOUT: float = 5.0
+    HF_READ_TIMEOUT: float = 60.0
+    HF_POOL_TIMEOUT: float = 10.0
+    HF_IMAGE_TIMEOUT: float = 60.0
+    HF_FRAME_TIMEOUT: float = 30.0
+    HF_MAX_CONCURRENCY: int = 32       # in-flight upstream calls per worker
+    VIDEO_FRAME_CONCURRENCY: int = 6   # in-flight frame calls per video request
+
+    # Backend Routing (cloud circuit breaker + optional hedging to the local engine)
+    BREAKER_FAILURE_THRESHOLD: int = 5   # consecutive cloud failures that open the breaker
+    BREAKER_ERROR_RATE: float = 0.5      # ...or this error rate over the rolling window
+    BREAKER_MIN_SAMPLES: int = 10
+    BREAKER_WINDOW_SIZE: int = 100
+    BREAKER_OPEN_SECONDS: float = 30.0   # time before a background probe is sent
+    HEDGE_ENABLED: bool = False          # start local inference when the cloud is slower than usual
+    HEDGE_PERCENTILE: float = 0.95
+    HEDGE_MIN_SAMPLES: int = 20
+
+    # Local Inference Engine (CPU fallback, warmed in lifespan when enabled)
+    LOCAL_ENGINE_ENABLED: bool = False
+    LOCAL_MODEL_ID: str = "umm-maybe/AI-image-detector"
+    LOCAL_BATCH_SIZE: int = 8
+    LOCAL_TORCH_THREADS: int = 0  # 0 = torch default
+    LOCAL_ENGINE_BACKEND: str = "transformers"  # transformers (fp32 torch) | onnx (int8, onnxruntime)
+    LOCAL_ONNX_MODEL_PATH: str = ""      # <out>.onnx from `python -m app.onnx_export --out <out>`
+    LOCAL_ONNX_THREADS: int = 0          # 0 = onnxruntime default (one per core)
+    LOCAL_ONNX_SHARE_WEIGHTS: bool = True  # run from the mmapped weights file (shared by workers); false = private prepacked copy, faster GEMMs
+    BATCHER_MAX_BATCH_SIZE: int = 16   # cross-request micro-batch cap
+    BATCHER_MAX_WAIT_MS: float = 10.0  # max time the first queued image waits for company
+
+    # Image Preprocessing (shared by image uploads and video frames)
+    PREPROCESS_ENABLED: bool = True
+    MODEL_INPUT_SIZE: int = 224         # shorter side sent upstream; the classifier works at ~224px
+    PREPROCESS_JPEG_QUALITY: int = 90
+
+    # Metrics
+    METRICS_SAMPLE_INTERVAL_S: float = 5.0  # RSS / thread-pool queue gauge refresh per worker
+
+    # Video Decode Pool
+    VIDEO_DECODE_WORKERS: int = 2  # decode processes per web worker (pool created in lifespan); 0 = decode in a thread
+    VIDEO_DECODE_PRESPAWN: bool = False  # spawn (and import OpenCV in) every decode process at startup, not on the first video
+
+    # Video Frame Sampling
+    VIDEO_SAMPLING_MODE: str = "adaptive"  # adaptive | uniform | keyframe | timestamp
+    VIDEO_SAMPLE_INTERVAL_S: float = 1.0  # timestamp mode spacing
+    VIDEO_FRAME_BUDGET: int = 10          # max frames classified per video request (incl. refinement)
+    VIDEO_MIN_FRAMES: int = 3             # adaptive: representative frames for a very short clip...
+    VIDEO_FRAMES_PER_MINUTE: float = 6.0  # ...plus this many per minute of footage
+    VIDEO_FRAME_WAVE: int = 3             # frames classified per round before the early-exit check
+    VIDEO_EARLY_EXIT: bool = True         # stop once any frame scores HIGH (the verdict is max())
+
+    # Frame Deduplication (perceptual hash, video frames and live sessions)
+    PHASH_DEDUPE_ENABLED: bool = True
+    PHASH_MAX_DISTANCE: int = 4  # differing bits (of 304) up to which a frame reuses an already-scored frame's score
+
+    # Verdict Cache (content hash -> probability, never media)
+    VERDICT_CACHE_ENABLED: bool = True
+    VERDICT_CACHE_MAX_ENTRIES: int = 10000
+    VERDICT_CACHE_TTL_SECONDS: int = 6 * 60 * 60
+    VERDICT_CACHE_PATH: str = ""  # e.g. /tmp/shadowfix/verdicts.db to share across workers
+    FRAME_CACHE_MAX_ENTRIES: int = 50000
+    SINGLEFLIGHT_ENABLED: bool = True  # concurrent uploads of the same content share one in-flight analysis
+
     # Rate Limiting
+    # sqlite: counters shared by all workers on the host | memory: per worker | redis: multi-host
+    RATE_LIMIT_BACKEND: str = "sqlite"
+    RATE_LIMIT_SQLITE_PATH: str = os.path.join(tempfile.gettempdir(), "shadowfix-ratelimit.db")
+    RATE_LIMIT_REDIS_URL: str = "redis://localhost:6379/0"
     RATE_LIMIT_AUTH: str = "10 per minute"
     RATE_LIMIT_GUEST: str = "5 per minute"
+    RATE_LIMIT_BATCH: str = "5 per minute"
+    RATE_LIMIT_LIVE_SESSIONS: str = "10 per minute"  # charged per /ws/live session, not per frame
+    STORE_PURGE_INTERVAL_S: float = 300.0  # expired rate-limit windows, cached verdicts and jobs are deleted this often
+
+    # Face Crop (optional: send padded face regions instead of full frames)
+    FACE_CROP_ENABLED: bool = False
+    FACE_DETECTOR: str = "haar"         # haar (bundled with OpenCV 4.x) | yunet (DNN, OpenCV >= 4.8)
+    FACE_DETECTOR_MODEL: str = ""       # face_detection_yunet_*.onnx, required for yunet
+    FACE_CROP_PADDING: float = 0.4      # margin on each side, as a fraction of the face box
+    FACE_MIN_SIZE_RATIO: float = 0.08   # ignore faces smaller than this fraction of the shorter side
+    FACE_REDETECT_EVERY: int = 8        # video / live: full detection every N frames, template tracking between
+
+    # Startup
+    WARMUP_HOOKS: str = ""  # comma list run in the background at boot: video, local, cloud, face (/ready waits for them)
+
+    # Inference Scheduling (per worker; tiers: admin, mock_auth, guest_auth, anonymous)
+    SCHEDULER_SLOTS: int = 16                # analyses running at once across all tiers
+    SCHEDULER_TIER_WEIGHTS: str = "admin=8,mock_auth=4,guest_auth=2,anonymous=1"  # fair share while contended
+    SCHEDULER_TIER_LIMITS: str = "admin=16,mock_auth=12,guest_auth=6,anonymous=4"  # max slots per tier
+    SCHEDULER_QUEUE_TIMEOUT_S: float = 3.0   # wait for a slot before 503 (well under the 120s inference timeout)
+    SCHEDULER_RETRY_AFTER_S: int = 2
+
+    # Admission Control (per worker memory budget)
+    ADMISSION_MEMORY_BUDGET_MB: int = 512
+    ADMISSION_IMAGE_DECODE_MB: int = 16   # decode headroom reserved per image request
+    ADMISSION_VIDEO_DECODE_MB: int = 64   # decoder buffers + full-resolution frame reservoir
+    ADMISSION_QUEUE_TIMEOUT_S: float = 5.0
+    ADMISSION_RETRY_AFTER_S: float = 2.0
+    GC_CHECK_INTERVAL_S: float = 5.0
+    GC_MIN_INTERVAL_S: float = 30.0
+    GC_RSS_THRESHOLD_MB: int = 0          # 0 = 1.25 x the admission budget
+
+    # Live Analysis (/ws/live)
+    LIVE_MAX_SESSIONS_PER_USER: int = 2
+    LIVE_MAX_FPS: float = 4.0
+    LIVE_SMOOTHING_ALPHA: float = 0.4
+    LIVE_FRAME_TIMEOUT_S: float = 15.0
+
+    # Video Jobs (/jobs/video)
+    JOB_WORKERS: int = 2         # background video workers per web worker
+    JOB_QUEUE_MAX: int = 32      # queued jobs per web worker before 503
+    JOB_TTL_SECONDS: int = 3600  # job status/verdict retention
+    JOB_STORE_PATH: str = os.path.join(tempfile.gettempdir(), "shadowfix-jobs.db")
+    JOB_SSE_POLL_S: float = 0.5
+    JOB_SSE_HEARTBEAT_S: float = 15.0
+    JOB_PROGRESS_INTERVAL_S: float = 0.25  # progress writes per job are coalesced to at most one per interval
+
+    # Batch Analysis (/analyze-batch)
+    BATCH_MAX_ITEMS: int = 500
+    BATCH_CONCURRENCY: int = 8
+    BATCH_MAX_ARCHIVE_BYTES: int = 200 * 1024 * 1024  # 200MB
     
     # File Limits
     MAX_IMAGE_SIZE_BYTES: int = 5 * 1024 * 1024  # 5MB
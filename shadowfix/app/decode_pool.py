@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from app.config import settings
+from app.metrics import STAGE_SECONDS, VIDEO_DECODE_QUEUE, observe_stage
+from app.utils import MediaBuffer
+
+logger = logging.getLogger(__name__)
+
+# What a decode process hands back: shared memory block name (None when nothing decoded),
+# (offset, width, height) per RGB frame, classification order, (decode, preprocess) seconds,
+# face crop counters for this video (empty when FACE_CROP_ENABLED is off)
+Handoff = Tuple[Optional[str], List[Tuple[int, int, int]], List[int], Tuple[float, float], Dict[str, int]]
+
+def extract_model_frames(video, suffix: str) -> Tuple[List[Image.Image], List[int]]:
+    """(candidate frames downscaled to model resolution right after decode, classification order)."""
+    from app.frames import extract_candidates
+    from app.preprocess import downscale
+
+    with observe_stage("video", "decode"):
+        frames, order = extract_candidates(video, suffix=suffix)
+    with observe_stage("video", "preprocess"):
+        return [downscale(frame) for frame in frames], order
+
+# --- Pool Processes ---
+
+def _warm_worker():
+    import app.frames  # noqa: F401  (OpenCV, NumPy and the face detector load once per process)
+
+def _decode_worker(path: str) -> Handoff:
+    """Decode + downscale in a pool process; all frames go into one shared memory block."""
+    import numpy as np
+    from app.frames import candidates_at
+    from app.preprocess import downscale
+
+    crop_counts = {}
+    if settings.FACE_CROP_ENABLED:
+        from app.face_crop import face_crop_stats
+        crop_counts = face_crop_stats.counts()
+
+    started = time.perf_counter()
+    frames, order = candidates_at(path)
+    decoded = time.perf_counter()
+    if crop_counts:
+        # Counters in this process never reach /admin/metrics: hand this video's share to the web worker
+        crop_counts = {name: value - crop_counts[name] for name, value in face_crop_stats.counts().items()}
+    pixels = [np.asarray(downscale(frame)) for frame in frames]
+    if not pixels:
+        return None, [], order, (decoded - started, 0.0), crop_counts
+
+    block = shared_memory.SharedMemory(create=True, size=sum(p.nbytes for p in pixels))
+    try:
+        layout = []
+        offset = 0
+        for p in pixels:
+            np.ndarray(p.shape, dtype=np.uint8, buffer=block.buf, offset=offset)[...] = p
+            layout.append((offset, p.shape[1], p.shape[0]))
+            offset += p.nbytes
+    except BaseException:
+        block.close()
+        block.unlink()
+        raise
+    block.close()  # the parent unlinks it once the frames are copied out
+    return block.name, layout, order, (decoded - started, time.perf_counter() - decoded), crop_counts
+
+# --- Web Worker Side ---
+
+def _collect(handoff: Handoff) -> List[Image.Image]:
+    name, layout = handoff[0], handoff[1]
+    if name is None:
+        return []
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return [Image.frombytes("RGB", (width, height), block.buf[offset:offset + width * height * 3]) for offset, width, height in layout]
+    finally:
+        block.close()
+        block.unlink()
+
+def _discard(future: Future):
+    """A decode the caller stopped waiting for still hands back a block: free it."""
+    if not future.cancelled() and future.exception() is None:
+        name = future.result()[0]
+        if name is not None:
+            block = shared_memory.SharedMemory(name=name)
+            block.close()
+            block.unlink()
+
+class DecodePool:
+    """
+    Dedicated processes for video decode and frame downscaling (per web worker, created in
+    lifespan; processes spawn on the first videos unless VIDEO_DECODE_PRESPAWN), so OpenCV neither holds this worker's GIL nor queues behind other blocking calls
+    in the default thread pool. Frames come back through one shared memory block per video
+    instead of pickled images. With VIDEO_DECODE_WORKERS=0, or before the pool is started,
+    decoding runs in a thread as before.
+    """
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.workers = 0
+        self.pending = 0
+        self.decoded = 0
+        self.restarts = 0
+
+    def _create(self):
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),  # never fork a process running an event loop and threads
+            initializer=_warm_worker,
+        )
+        if settings.VIDEO_DECODE_PRESPAWN:
+            for _ in range(self.workers):
+                self._executor.submit(_warm_worker)  # spawn every process now, not on the first video
+
+    def start(self):
+        if settings.VIDEO_DECODE_WORKERS > 0 and self._executor is None:
+            self.workers = settings.VIDEO_DECODE_WORKERS
+            self._create()
+            logger.info("Video decode pool: %d processes (%s)", self.workers, "prespawned" if settings.VIDEO_DECODE_PRESPAWN else "spawned on demand")
+
+    async def stop(self):
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+    def _publish(self):
+        VIDEO_DECODE_QUEUE.set(max(0, self.pending - self.workers))
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        if self._executor is broken:
+            self.restarts += 1
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._create()
+
+    async def extract(self, video, suffix: str) -> Tuple[List[Image.Image], List[int]]:
+        """extract_model_frames() in a pool process (bytes or MediaBuffer)."""
+        if self._executor is None:
+            return await asyncio.to_thread(extract_model_frames, video, suffix)
+        if not isinstance(video, MediaBuffer):
+            with MediaBuffer(suffix) as buffer:
+                buffer.write(video)
+                return await self.extract(buffer, suffix)
+
+        executor = self._executor
+        started = time.perf_counter()
+        self.pending += 1
+        self._publish()
+        try:
+            future = executor.submit(_decode_worker, video.process_path)
+            try:
+                handoff = await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                future.add_done_callback(_discard)
+                raise
+        except BrokenProcessPool:
+            # A decoder crash (e.g. a malformed stream) takes down its process, not this worker
+            logger.error("Video decode process died; restarting the pool.")
+            self._restart(executor)
+            return [], []
+        finally:
+            self.pending -= 1
+            self._publish()
+
+        decode_s, preprocess_s = handoff[3]
+        if any(handoff[4].values()):
+            from app.face_crop import face_crop_stats  # only reached (and OpenCV only imported) with face cropping on
+
+            face_crop_stats.merge(handoff[4])
+        STAGE_SECONDS.labels("video", "decode").observe(decode_s)
+        STAGE_SECONDS.labels("video", "preprocess").observe(preprocess_s)
+        STAGE_SECONDS.labels("video", "decode_queue").observe(max(0.0, time.perf_counter() - started - decode_s - preprocess_s))
+        with observe_stage("video", "decode_handoff"):
+            frames = _collect(handoff)
+        self.decoded += 1
+        return frames, handoff[2]
+
+    def stats(self) -> dict:
+        return {
+            "mode": "process" if self._executor is not None else "thread",
+            "workers": self.workers if self._executor is not None else 0,
+            "in_flight": self.pending,
+            "queue_depth": max(0, self.pending - self.workers) if self._executor is not None else 0,
+            "decoded": self.decoded,
+            "restarts": self.restarts,
+        }
+
+# Global decode pool (per worker; processes are started in lifespan)
+decode_pool = DecodePool()
@@ -0,0 +1,239 @@
+import io
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# (x, y, width, height) in detection-view pixels
+Box = Tuple[int, int, int, int]
+
+DETECT_MAX_SIDE = 480       # detectors run on a copy no larger than this
+TRACK_SEARCH_MARGIN = 0.5   # template search window around the last box, as a fraction of its size
+TRACK_MIN_SCORE = 0.6       # normalized cross-correlation needed to trust a tracked box
+CROP_SOURCE_SCALE = 3       # large JPEGs are decoded at >= 3x MODEL_INPUT_SIZE so face crops stay sharp
+
+class FaceCropStats:
+    """Face crop accounting (per worker; video decode processes report theirs back through merge())."""
+
+    COUNTERS = ("detected", "tracked", "no_face", "source_pixels", "crop_pixels")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.detected = 0
+        self.tracked = 0
+        self.no_face = 0
+        self.source_pixels = 0
+        self.crop_pixels = 0
+
+    def record(self, kind: str):
+        with self._lock:
+            setattr(self, kind, getattr(self, kind) + 1)
+
+    def record_crop(self, source_pixels: int, crop_pixels: int):
+        with self._lock:
+            self.source_pixels += source_pixels
+            self.crop_pixels += crop_pixels
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {name: getattr(self, name) for name in self.COUNTERS}
+
+    def merge(self, counts: Dict[str, int]):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": settings.FACE_CROP_ENABLED,
+                "detector": settings.FACE_DETECTOR,
+                "detected": self.detected,
+                "tracked": self.tracked,
+                "no_face_fallbacks": self.no_face,
+                "crop_pixel_ratio": round(self.crop_pixels / self.source_pixels, 4) if self.source_pixels else None,
+            }
+
+class FaceDetector:
+    """
+    Largest face in a BGR image: the Haar cascade bundled with OpenCV 4.x, or the YuNet DNN
+    detector (FaceDetectorYN) from FACE_DETECTOR_MODEL. OpenCV detectors keep per-call state,
+    so each thread gets its own instance. When no detector can be built every frame falls back
+    to full-frame inference.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._failed = False
+
+    def _create(self):
+        if settings.FACE_DETECTOR == "yunet":
+            if not settings.FACE_DETECTOR_MODEL:
+                raise RuntimeError("FACE_DETECTOR=yunet needs FACE_DETECTOR_MODEL (a face_detection_yunet ONNX file)")
+            return cv2.FaceDetectorYN.create(settings.FACE_DETECTOR_MODEL, "", (320, 320), 0.8)
+        if settings.FACE_DETECTOR != "haar":
+            raise ValueError(f"Unknown FACE_DETECTOR: {settings.FACE_DETECTOR}")
+        if not hasattr(cv2, "CascadeClassifier"):
+            raise RuntimeError("this OpenCV build has no Haar cascades (moved out in OpenCV 5); use FACE_DETECTOR=yunet")
+        cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+        if cascade.empty():
+            raise RuntimeError("bundled Haar cascade could not be loaded")
+        return cascade
+
+    def load(self):
+        """Builds this thread's detector, raising when none can be built (startup check for FACE_CROP_ENABLED)."""
+        if getattr(self._local, "detector", None) is None:
+            self._local.detector = self._create()
+
+    def _get(self):
+        detector = getattr(self._local, "detector", None)
+        if detector is None and not self._failed:
+            try:
+                detector = self._local.detector = self._create()
+            except Exception as e:
+                self._failed = True
+                logger.error("Face detector unavailable (%s); face crop falls back to full frames.", e)
+        return detector
+
+    def detect(self, image: np.ndarray) -> Optional[Box]:
+        detector = self._get()
+        if detector is None:
+            return None
+        height, width = image.shape[:2]
+        min_side = max(1, int(min(height, width) * settings.FACE_MIN_SIZE_RATIO))
+        if settings.FACE_DETECTOR == "yunet":
+            detector.setInputSize((width, height))
+            _, faces = detector.detect(image)
+            boxes = [] if faces is None else [tuple(int(v) for v in face[:4]) for face in faces]
+            boxes = [box for box in boxes if min(box[2], box[3]) >= min_side]
+        else:
+            grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            boxes = detector.detectMultiScale(grey, scaleFactor=1.1, minNeighbors=5, minSize=(min_side, min_side))
+        if len(boxes) == 0:
+            return None
+        x, y, w, h = max(boxes, key=lambda box: box[2] * box[3])
+        return int(x), int(y), int(w), int(h)
+
+class FaceTracker:
+    """
+    Face box across consecutive frames of one video or live session. Between full detections
+    (every FACE_REDETECT_EVERY frames, or when tracking is lost) the previous face patch is
+    template-matched in a window around its last position instead of re-running the detector.
+    """
+
+    def __init__(self):
+        self.box: Optional[Box] = None
+        self._template: Optional[np.ndarray] = None
+        self._since_detect = 0
+        self._shape = None
+
+    def _remember(self, grey: np.ndarray, box: Optional[Box]):
+        self.box = box
+        if box is None:
+            self._template = None
+        else:
+            x, y, w, h = box
+            self._template = grey[y:y + h, x:x + w].copy()
+
+    def _track(self, grey: np.ndarray) -> Optional[Box]:
+        x, y, w, h = self.box
+        margin_x, margin_y = int(w * TRACK_SEARCH_MARGIN), int(h * TRACK_SEARCH_MARGIN)
+        left, top = max(0, x - margin_x), max(0, y - margin_y)
+        window = grey[top:y + h + margin_y, left:x + w + margin_x]
+        if window.shape[0] < h or window.shape[1] < w:
+            return None
+        _, score, _, (dx, dy) = cv2.minMaxLoc(cv2.matchTemplate(window, self._template, cv2.TM_CCOEFF_NORMED))
+        if score < TRACK_MIN_SCORE:
+            return None
+        return left + dx, top + dy, w, h
+
+    def locate(self, image: np.ndarray) -> Optional[Box]:
+        """Face box in a BGR detection view (all frames of a session must share one size)."""
+        grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if grey.shape != self._shape:
+            self._shape = grey.shape  # e.g. a webcam switching resolution: boxes no longer apply
+            self.box = None
+        if self.box is not None and self._since_detect < settings.FACE_REDETECT_EVERY:
+            box = self._track(grey)
+            if box is not None:
+                self._since_detect += 1
+                self._remember(grey, box)
+                face_crop_stats.record("tracked")
+                return box
+        box = face_detector.detect(image)
+        self._since_detect = 0
+        self._remember(grey, box)
+        if box is not None:
+            face_crop_stats.record("detected")
+        return box
+
+def _detection_view(image: np.ndarray) -> Tuple[np.ndarray, float]:
+    """(copy no larger than DETECT_MAX_SIDE, scale back to the original)."""
+    height, width = image.shape[:2]
+    scale = max(height, width) / DETECT_MAX_SIDE
+    if scale <= 1.0:
+        return image, 1.0
+    size = (max(1, round(width / scale)), max(1, round(height / scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA), scale
+
+def _padded(box: Box, scale: float, width: int, height: int) -> Tuple[int, int, int, int]:
+    """(left, top, right, bottom) in original pixels, padded by FACE_CROP_PADDING and clipped."""
+    x, y, w, h = (v * scale for v in box)
+    pad_x, pad_y = w * settings.FACE_CROP_PADDING, h * settings.FACE_CROP_PADDING
+    return (
+        max(0, int(x - pad_x)),
+        max(0, int(y - pad_y)),
+        min(width, int(x + w + pad_x)),
+        min(height, int(y + h + pad_y)),
+    )
+
+def _locate(pixels: np.ndarray, tracker: Optional[FaceTracker], is_rgb: bool):
+    """Padded face region of a full-size frame, or None."""
+    view, scale = _detection_view(pixels)
+    if is_rgb:
+        view = cv2.cvtColor(view, cv2.COLOR_RGB2BGR)
+    box = (tracker or FaceTracker()).locate(view)
+    if box is None:
+        face_crop_stats.record("no_face")
+        return None
+    height, width = pixels.shape[:2]
+    return _padded(box, scale, width, height)
+
+def crop_frame(frame: np.ndarray, tracker: Optional[FaceTracker] = None) -> np.ndarray:
+    """Decoded BGR video frame -> padded face crop, or the frame itself when no face is found."""
+    region = _locate(frame, tracker, is_rgb=False)
+    if region is None:
+        return frame
+    left, top, right, bottom = region
+    face_crop_stats.record_crop(frame.shape[0] * frame.shape[1], (right - left) * (bottom - top))
+    return frame[top:bottom, left:right]
+
+def crop_image(image: Image.Image, source=None, tracker: Optional[FaceTracker] = None) -> Optional[Image.Image]:
+    """
+    Still image -> padded face crop, or None when no face is found (the caller keeps the full frame).
+    Large JPEG uploads are re-decoded from `source` at reduced scale first; the caller's image is untouched.
+    """
+    if source is not None and image.format == "JPEG":
+        image = Image.open(io.BytesIO(source))
+        target = CROP_SOURCE_SCALE * settings.MODEL_INPUT_SIZE
+        shorter = min(image.size)
+        if shorter > target:
+            image.draft("RGB", (image.width * target // shorter, image.height * target // shorter))
+    rgb = np.asarray(image.convert("RGB"))
+    region = _locate(rgb, tracker, is_rgb=True)
+    if region is None:
+        return None
+    left, top, right, bottom = region
+    face_crop_stats.record_crop(rgb.shape[0] * rgb.shape[1], (right - left) * (bottom - top))
+    return Image.fromarray(rgb[top:bottom, left:right])
+
+# Global face crop setup (per worker)
+face_detector = FaceDetector()
+face_crop_stats = FaceCropStats()
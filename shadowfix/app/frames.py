@@ -0,0 +1,270 @@
+import logging
+import math
+from typing import Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+from app.config import settings
+from app.utils import MediaBuffer
+from app.face_crop import FaceTracker, crop_frame
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_MODES = ("adaptive", "uniform", "keyframe", "timestamp")
+MAX_SAMPLED_FRAMES = 12
+
+# Adaptive mode: candidates decoded per classification slot (extra candidates feed scene detection and refinement)
+CANDIDATES_PER_SLOT = 4
+SCENE_THUMB_SIZE = (32, 32)
+SCENE_HIST_BINS = 32
+
+def uniform_indices(total: int, n: int) -> List[int]:
+    """n evenly spaced frame indices across the WHOLE video."""
+    n = min(n, total)
+    return [int(i * (total / n)) for i in range(n)]
+
+def _to_pil(frame) -> Image.Image:
+    return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+def _grab_indices(cap, indices: List[int]):
+    """Single forward pass: grab() every frame, retrieve() only the wanted ones."""
+    wanted = set(indices)
+    last = max(indices)
+    frames = []
+    idx = 0
+    while idx <= last:
+        if not cap.grab():
+            break
+        if idx in wanted:
+            ret, frame = cap.retrieve()
+            if ret:
+                frames.append(frame)
+        idx += 1
+    return frames, idx > last
+
+def _scan(cap, n: int, is_candidate: Callable[[int], bool]):
+    """
+    Single forward pass when the frame count is unknown (or sampling is content-driven).
+    Keeps a thinned reservoir of candidate frames: whenever it holds 2n frames every
+    other one is dropped and the stride doubles, so memory stays bounded by 2n frames.
+    """
+    kept = []
+    stride = 1
+    seen = 0
+    idx = 0
+    while cap.grab():
+        if is_candidate(idx):
+            if seen % stride == 0:
+                ret, frame = cap.retrieve()
+                if ret:
+                    kept.append(frame)
+                    if len(kept) >= 2 * n:
+                        kept = kept[::2]
+                        stride *= 2
+            seen += 1
+        idx += 1
+    if len(kept) <= n:
+        return kept
+    return [kept[i] for i in uniform_indices(len(kept), n)]
+
+def _keyframe_candidate(cap) -> Callable[[int], bool]:
+    return lambda idx: idx == 0 or bool(cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME))
+
+def _timestamp_candidate(cap, interval_s: float) -> Callable[[int], bool]:
+    state = {"next_ms": 0.0}
+    interval_ms = max(1.0, interval_s * 1000.0)
+
+    def is_candidate(idx: int) -> bool:
+        pos_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+        if pos_ms >= state["next_ms"]:
+            state["next_ms"] = pos_ms + interval_ms
+            return True
+        return False
+
+    return is_candidate
+
+def sample_frames(path: str, n: int = 10, mode: Optional[str] = None) -> List[Image.Image]:
+    """Decodes sampled frames from a video file path in a single forward pass."""
+    mode = mode or settings.VIDEO_SAMPLING_MODE
+    if mode == "adaptive":
+        mode = "uniform"  # fixed-count callers (e.g. tooling) get the plain even spread
+    if mode not in SAMPLING_MODES:
+        raise ValueError(f"Unknown video sampling mode: {mode}")
+    n = min(n, MAX_SAMPLED_FRAMES)
+
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            return []
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        if mode == "keyframe" and hasattr(cv2, "CAP_PROP_LRF_HAS_KEY_FRAME"):
+            frames = _scan(cap, n, _keyframe_candidate(cap))
+            if len(frames) < 2:
+                # Backend without keyframe flags (or a single-GOP clip): sample every frame instead
+                cap.release()
+                cap = cv2.VideoCapture(path)
+                frames = _scan(cap, n, lambda idx: True)
+        elif mode == "timestamp":
+            frames = _scan(cap, n, _timestamp_candidate(cap, settings.VIDEO_SAMPLE_INTERVAL_S))
+        elif total > 0:
+            frames, complete = _grab_indices(cap, uniform_indices(total, n))
+            if not complete and len(frames) < n:
+                # Frame count metadata overstated the stream; rescan from the start
+                logger.warning("Frame count metadata (%d) is wrong, rescanning video.", total)
+                cap.release()
+                cap = cv2.VideoCapture(path)
+                frames = _scan(cap, n, lambda idx: True)
+        else:
+            # Frame count missing (common for MediaRecorder WebM)
+            frames = _scan(cap, n, lambda idx: True)
+    finally:
+        cap.release()
+
+    if settings.FACE_CROP_ENABLED:
+        tracker = FaceTracker()
+        frames = [crop_frame(frame, tracker) for frame in frames]
+    return [_to_pil(frame) for frame in frames]
+
+# --- Adaptive Sampling ---
+
+def frames_for_duration(duration_s: float, budget: int) -> int:
+    """Representative frame count: VIDEO_MIN_FRAMES plus VIDEO_FRAMES_PER_MINUTE, capped by the budget."""
+    wanted = settings.VIDEO_MIN_FRAMES + math.ceil(max(0.0, duration_s) * settings.VIDEO_FRAMES_PER_MINUTE / 60.0)
+    return max(1, min(budget, wanted))
+
+def _model_sized(frame):
+    """BGR frame resized so its shorter side is MODEL_INPUT_SIZE (candidates are held small)."""
+    height, width = frame.shape[:2]
+    scale = settings.MODEL_INPUT_SIZE / min(height, width)
+    if scale >= 1.0:
+        return frame
+    return cv2.resize(frame, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+
+def scene_change_scores(frames) -> List[float]:
+    """
+    Cheap scene-change score per BGR frame against the previous one (the first frame scores 1.0):
+    mean of the grey histogram Bhattacharyya distance and the mean absolute thumbnail difference.
+    """
+    scores = []
+    previous = None
+    for frame in frames:
+        grey = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), SCENE_THUMB_SIZE, interpolation=cv2.INTER_AREA)
+        hist = cv2.calcHist([grey], [0], None, [SCENE_HIST_BINS], [0, 256])
+        cv2.normalize(hist, hist)
+        if previous is None:
+            scores.append(1.0)
+        else:
+            hist_distance = cv2.compareHist(previous[1], hist, cv2.HISTCMP_BHATTACHARYYA)
+            pixel_distance = float(np.mean(cv2.absdiff(previous[0], grey))) / 255.0
+            scores.append((hist_distance + pixel_distance) / 2.0)
+        previous = (grey, hist)
+    return scores
+
+def coarse_to_fine(n: int) -> List[int]:
+    """0..n-1 in bisection order (middle first), so any prefix is spread across the timeline."""
+    order = []
+    spans = [(0, n)]
+    while spans:
+        lo, hi = spans.pop(0)
+        if lo >= hi:
+            continue
+        mid = (lo + hi) // 2
+        order.append(mid)
+        spans.extend(((lo, mid), (mid + 1, hi)))
+    return order
+
+def select_representatives(scene_scores: List[float], n: int) -> List[int]:
+    """
+    Splits the candidates into n contiguous segments and keeps the strongest scene change in each,
+    so every part of the video is covered but cuts win over near-duplicate frames.
+    Returned in coarse-to-fine order.
+    """
+    total = len(scene_scores)
+    n = min(n, total)
+    picks = []
+    for segment in range(n):
+        lo, hi = segment * total // n, (segment + 1) * total // n
+        picks.append(max(range(lo, hi), key=lambda i: scene_scores[i]))
+    return [picks[i] for i in coarse_to_fine(len(picks))]
+
+def sample_adaptive(path: str, budget: int) -> Tuple[List[Image.Image], List[int]]:
+    """
+    Single forward pass decoding a pool of model-sized candidate frames (CANDIDATES_PER_SLOT per
+    budget slot, evenly spaced). Returns (candidates in temporal order, representative candidate
+    positions in classification order). Candidates that are not representatives are kept for
+    refinement around suspicious frames.
+    """
+    pool_size = max(1, budget * CANDIDATES_PER_SLOT)
+    # Consecutive candidates of one clip share a tracker: the face is detected once, then followed
+    tracker = FaceTracker() if settings.FACE_CROP_ENABLED else None
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            return [], []
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        # Reservoir thinning as in _scan, but frames are shrunk before they are kept
+        kept = []
+        stride = 1
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if total > pool_size:
+            stride = total // pool_size
+        idx = 0
+        while cap.grab():
+            if idx % stride == 0:
+                ret, frame = cap.retrieve()
+                if ret:
+                    if tracker is not None:
+                        frame = crop_frame(frame, tracker)
+                    kept.append(_model_sized(frame))
+                    if len(kept) >= 2 * pool_size:
+                        kept = kept[::2]
+                        stride *= 2
+            idx += 1
+    finally:
+        cap.release()
+    if not kept:
+        return [], []
+
+    if len(kept) > pool_size:
+        kept = [kept[i] for i in uniform_indices(len(kept), pool_size)]
+    duration_s = idx / fps if fps > 0 else 0.0
+    representatives = select_representatives(scene_change_scores(kept), frames_for_duration(duration_s, budget))
+    logger.info(
+        "Adaptive sampling: %.1fs video, %d candidates, %d representative frames",
+        duration_s, len(kept), len(representatives),
+    )
+    return [_to_pil(frame) for frame in kept], representatives
+
+def extract_candidates(video, suffix=".mp4", budget: Optional[int] = None) -> Tuple[List[Image.Image], List[int]]:
+    """
+    Frames to classify plus the order to classify them in (RAM-backed, bytes or MediaBuffer).
+    Adaptive mode returns a candidate pool and its representatives; fixed modes return every
+    sampled frame in temporal order.
+    """
+    if isinstance(video, MediaBuffer):
+        return candidates_at(video.path, budget)
+    with MediaBuffer(suffix) as buffer:
+        buffer.write(video)
+        return candidates_at(buffer.path, budget)
+
+def candidates_at(path: str, budget: Optional[int] = None) -> Tuple[List[Image.Image], List[int]]:
+    """extract_candidates() for a video file path (also what decode pool processes run)."""
+    budget = max(1, budget or settings.VIDEO_FRAME_BUDGET)
+    mode = settings.VIDEO_SAMPLING_MODE
+    if mode != "adaptive":
+        frames = sample_frames(path, n=min(budget, MAX_SAMPLED_FRAMES), mode=mode)
+        return frames, list(range(len(frames)))
+    return sample_adaptive(path, budget)
+
+def extract_frames(video, n=10, suffix=".mp4", mode: Optional[str] = None) -> List[Image.Image]:
+    """
+    Extracts frames with sampling logic across the ENTIRE video (RAM-backed, no disk round-trip).
+    Accepts raw bytes or an already-filled MediaBuffer (streamed uploads).
+    """
+    if isinstance(video, MediaBuffer):
+        return sample_frames(video.path, n=n, mode=mode)
+    with MediaBuffer(suffix) as buffer:
+        buffer.write(video)
+        return sample_frames(buffer.path, n=n, mode=mode)
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from typing import Optional
+
+import httpx
+from app.config import settings
+from app.metrics import record_upstream_status
+
+logger = logging.getLogger(__name__)
+
+# Shared upstream client (owned by the app lifespan)
+_client: Optional[httpx.AsyncClient] = None
+_auth_token: str = ""
+# Worker-wide cap on concurrent upstream calls (shared by every request)
+_upstream_limit: Optional[asyncio.Semaphore] = None
+
+def sanitize_token(raw_token: str) -> str:
+    """Aggressive Token Sanitization (whitespace and stray quotes)."""
+    return "".join((raw_token or "").split()).replace('"', '').replace("'", "")
+
+def _log_token_banner(token: str):
+    """LOUD DIAGNOSTICS, emitted once per worker at startup."""
+    logger.info("***********************************************")
+    if token:
+        safe_display = f"{token[:6]}...{token[-4:]}"
+        logger.info("HF_API_TOKEN: %s (Length: %d)", safe_display, len(token))
+    else:
+        logger.error("!!! CRITICAL: HF_API_TOKEN is EMPTY!")
+    logger.info("***********************************************")
+
+def _http2_available() -> bool:
+    if not settings.HF_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logger.warning("HF_HTTP2 requested but 'h2' is not installed. Using HTTP/1.1.")
+        return False
+
+def _build_client(http2: bool) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=settings.HF_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HF_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=settings.HF_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        settings.HF_READ_TIMEOUT,
+        connect=settings.HF_CONNECT_TIMEOUT,
+        pool=settings.HF_POOL_TIMEOUT,
+    )
+    return httpx.AsyncClient(
+        limits=limits,
+        timeout=timeout,
+        http2=http2,
+        headers={"Authorization": f"Bearer {_auth_token}"} if _auth_token else None,
+    )
+
+async def init_inference_client():
+    """Creates the pooled keep-alive client. Called from the app lifespan."""
+    global _client, _auth_token, _upstream_limit
+    if _client is not None:
+        return _client
+    _upstream_limit = asyncio.Semaphore(max(1, settings.HF_MAX_CONCURRENCY))
+    _auth_token = sanitize_token(settings.HF_API_TOKEN)
+    _log_token_banner(_auth_token)
+    http2 = _http2_available()
+    _client = _build_client(http2)
+    logger.info(
+        "Inference client ready (pool=%d, keepalive=%d, http2=%s)",
+        settings.HF_POOL_MAX_CONNECTIONS, settings.HF_POOL_MAX_KEEPALIVE, http2,
+    )
+    return _client
+
+async def close_inference_client():
+    """Drains the connection pool on shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def get_inference_client() -> httpx.AsyncClient:
+    """Returns the shared client, creating it lazily outside the app lifespan (scripts, shells)."""
+    if _client is None:
+        await init_inference_client()
+    return _client
+
+async def post_jpeg(url: str, payload: bytes, timeout: Optional[float] = None) -> httpx.Response:
+    """POSTs a JPEG payload to an inference endpoint over the shared pool."""
+    client = await get_inference_client()
+    async with _upstream_limit:
+        try:
+            response = await client.post(
+                url,
+                content=payload,
+                headers={"Content-Type": "image/jpeg"},
+                timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+            )
+        except httpx.HTTPError:
+            record_upstream_status("error")
+            raise
+    record_upstream_status(response.status_code)
+    return response
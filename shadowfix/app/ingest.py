@@ -0,0 +1,358 @@
+import hashlib
+import logging
+import tarfile
+import zipfile
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Union
+
+from fastapi import Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from app.config import settings
+from app.utils import (
+    ALLOWED_ARCHIVE_TYPES,
+    ALLOWED_IMAGE_TYPES,
+    ALLOWED_VIDEO_TYPES,
+    MediaBuffer,
+    sniff_media_type,
+    validate_archive_file,
+    validate_image_file,
+    validate_video_file,
+)
+
+logger = logging.getLogger(__name__)
+
+SNIFF_BYTES = 262  # enough for every signature in sniff_media_type (tar is the longest)
+MULTIPART_OVERHEAD_BYTES = 64 * 1024  # boundaries + part headers allowance
+
+# kind -> (size limit setting, filename/MIME validator, magic-byte whitelist)
+INGEST_KINDS = {
+    "image": ("MAX_IMAGE_SIZE_BYTES", validate_image_file, ALLOWED_IMAGE_TYPES),
+    "video": ("MAX_VIDEO_SIZE_BYTES", validate_video_file, ALLOWED_VIDEO_TYPES),
+    "archive": ("BATCH_MAX_ARCHIVE_BYTES", validate_archive_file, ALLOWED_ARCHIVE_TYPES),
+}
+
+# OpenAPI body for endpoints that stream their multipart upload instead of using UploadFile
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
+BATCH_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "files": {"type": "array", "items": {"type": "string", "format": "binary"}},
+                        "archive": {"type": "string", "format": "binary", "description": "ZIP, TAR or TAR.GZ of images"},
+                    },
+                }
+            }
+        },
+    }
+}
+
+@dataclass
+class IngestedUpload:
+    """A fully received upload: content hash, real size and sniffed type, plus the bytes."""
+    field_name: str
+    filename: str
+    content_type: str
+    media_type: str
+    size: int
+    digest: str
+    data: Optional[memoryview] = None     # images: zero-copy view over the received bytes
+    buffer: Optional[MediaBuffer] = None  # videos/archives: RAM-backed file
+
+    @property
+    def suffix(self) -> str:
+        return ".webm" if self.media_type == "video/webm" else ".mp4"
+
+    def close(self):
+        if self.data is not None:
+            self.data.release()
+            self.data = None
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+
+@dataclass
+class RejectedUpload:
+    """A part that failed validation while streaming (batch mode reports these per item)."""
+    field_name: str
+    filename: str
+    error: str
+
+    def close(self):
+        pass
+
+class _PartSink:
+    """Receives one file part chunk by chunk: size guard, magic sniffing and hashing on the fly."""
+
+    def __init__(self, kind: str, field_name: str, filename: str, content_type: str):
+        limit_name, validator, allowed = INGEST_KINDS[kind]
+        validator(filename, content_type)
+        self.kind = kind
+        self.field_name = field_name
+        self.filename = filename
+        self.content_type = content_type
+        self.max_bytes = getattr(settings, limit_name)
+        self.allowed = allowed
+        self.size = 0
+        self.media_type: Optional[str] = None
+        self._head = b""
+        self._hash = hashlib.sha256()
+        self._data = bytearray() if kind == "image" else None
+        self._buffer = MediaBuffer() if kind != "image" else None
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise ValueError("File size exceeds allowed limit")
+        if self.media_type is None:
+            self._head += chunk[:SNIFF_BYTES]
+            if len(self._head) >= SNIFF_BYTES:
+                self._sniff()
+        self._hash.update(chunk)
+        if self._data is not None:
+            self._data += chunk
+        else:
+            self._buffer.write(chunk)
+
+    def _sniff(self):
+        media_type = sniff_media_type(self._head)
+        if media_type not in self.allowed:
+            raise ValueError("File content does not match an allowed media type.")
+        self.media_type = media_type
+
+    def finish(self) -> IngestedUpload:
+        if self.media_type is None:
+            self._sniff()
+        upload = IngestedUpload(
+            field_name=self.field_name,
+            filename=self.filename,
+            content_type=self.content_type,
+            media_type=self.media_type,
+            size=self.size,
+            digest=self._hash.hexdigest(),
+            data=memoryview(self._data) if self._data is not None else None,
+            buffer=self._buffer,
+        )
+        self._data = None
+        self._buffer = None
+        return upload
+
+    def discard(self):
+        if self._buffer is not None:
+            self._buffer.close()
+            self._buffer = None
+        self._data = None
+
+class StreamingUploadParser:
+    """
+    Streams a multipart body straight off the socket.
+    File parts go directly into their sink, so nothing is spooled or buffered twice.
+    Oversized or mistyped parts abort the upload as soon as they are detected.
+    """
+
+    def __init__(self, request: Request, fields: Dict[str, str], max_files: int = 1, per_item_errors: bool = False):
+        """
+        fields maps form field name -> ingest kind ("image", "video", "archive").
+        With per_item_errors, a bad part yields a RejectedUpload instead of aborting the body.
+        """
+        self.request = request
+        self.fields = fields
+        self.max_files = max_files
+        self.per_item_errors = per_item_errors
+        self._files = 0
+        self._sink: Optional[_PartSink] = None
+        self._rejected_part = None
+        self._header_name = b""
+        self._header_value = b""
+        self._headers = {}
+        self._finished: List[Union[IngestedUpload, RejectedUpload]] = []
+
+    def _check_request(self) -> bytes:
+        content_type, params = parse_options_header(self.request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise ValueError("Expected a multipart/form-data upload.")
+        declared = self.request.headers.get("content-length")
+        if declared and declared.isdigit():
+            limit = max(getattr(settings, INGEST_KINDS[kind][0]) for kind in self.fields.values())
+            if int(declared) > limit * self.max_files + MULTIPART_OVERHEAD_BYTES:
+                raise ValueError("File size exceeds allowed limit")
+        return params[b"boundary"]
+
+    def _reject(self, field_name: str, filename: str, exc: ValueError):
+        if not self.per_item_errors:
+            raise exc
+        if self._sink is not None:
+            self._sink.discard()
+            self._sink = None
+        self._rejected_part = RejectedUpload(field_name, filename, str(exc))
+
+    # --- Parser Callbacks ---
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._sink = None
+        self._rejected_part = None
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        if b"filename" not in options or name not in self.fields:
+            # Ignore unrelated form fields
+            return
+        self._files += 1
+        if self._files > self.max_files:
+            raise ValueError(f"Too many files. Maximum is {self.max_files}.")
+        filename = options[b"filename"].decode("utf-8", "replace")
+        try:
+            self._sink = _PartSink(
+                self.fields[name],
+                name,
+                filename,
+                self._headers.get(b"content-type", b"").decode("latin-1"),
+            )
+        except ValueError as e:
+            self._reject(name, filename, e)
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._sink is not None:
+            try:
+                self._sink.write(data[start:end])
+            except ValueError as e:
+                self._reject(self._sink.field_name, self._sink.filename, e)
+
+    def _on_part_end(self):
+        if self._sink is not None:
+            try:
+                self._finished.append(self._sink.finish())
+            except ValueError as e:
+                self._reject(self._sink.field_name, self._sink.filename, e)
+            self._sink = None
+        if self._rejected_part is not None:
+            self._finished.append(self._rejected_part)
+            self._rejected_part = None
+
+    # --- Streaming ---
+
+    async def __aiter__(self) -> AsyncIterator[Union[IngestedUpload, RejectedUpload]]:
+        """Yields each upload as soon as its part is complete. Callers own (and close) yielded uploads."""
+        parser = MultipartParser(self._check_request(), {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+        try:
+            async for chunk in self.request.stream():
+                parser.write(chunk)
+                while self._finished:
+                    yield self._finished.pop(0)
+            parser.finalize()
+            while self._finished:
+                yield self._finished.pop(0)
+        finally:
+            if self._sink is not None:
+                self._sink.discard()
+                self._sink = None
+            for upload in self._finished:
+                upload.close()
+            self._finished.clear()
+
+async def ingest_upload(request: Request, kind: str, field_name: str = "file") -> IngestedUpload:
+    """Streams exactly one file part (e.g. /analyze-image, /analyze-video)."""
+    upload = None
+    async for item in StreamingUploadParser(request, {field_name: kind}, max_files=1):
+        if upload is None:
+            upload = item
+        else:
+            item.close()
+    if upload is None:
+        raise ValueError("No file uploaded.")
+    return upload
+
+def _archive_members(upload: IngestedUpload) -> Iterator[tuple]:
+    """(name, declared size, reader) for every regular file in a ZIP or TAR(.GZ) archive."""
+    if upload.media_type == "application/zip":
+        with zipfile.ZipFile(upload.buffer.path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size, lambda info=info: archive.open(info)
+    else:
+        with tarfile.open(upload.buffer.path, mode="r:*") as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, member.size, lambda member=member: archive.extractfile(member)
+
+def expand_archive(upload: IngestedUpload, max_items: int) -> Iterator[Union[IngestedUpload, RejectedUpload]]:
+    """
+    Yields the images inside a batch archive as individual uploads (blocking; run off the loop).
+    Members are size-checked before and while reading, so a compressed bomb can't exceed the image limit.
+    """
+    max_bytes = settings.MAX_IMAGE_SIZE_BYTES
+    count = 0
+    try:
+        for name, declared_size, open_member in _archive_members(upload):
+            if name.rsplit("/", 1)[-1].startswith("."):
+                continue  # __MACOSX/._* and dotfiles
+            count += 1
+            if count > max_items:
+                yield RejectedUpload(upload.field_name, name, f"Too many files. Maximum is {max_items}.")
+                return
+            try:
+                validate_image_file(name, "image/jpeg" if name.lower().endswith((".jpg", ".jpeg")) else "image/png", declared_size)
+                with open_member() as member:
+                    content = member.read(max_bytes + 1)
+                if len(content) > max_bytes:
+                    raise ValueError("File size exceeds allowed limit")
+                media_type = sniff_media_type(content[:SNIFF_BYTES])
+                if media_type not in ALLOWED_IMAGE_TYPES:
+                    raise ValueError("File content does not match an allowed media type.")
+            except ValueError as e:
+                yield RejectedUpload(upload.field_name, name, str(e))
+                continue
+            yield IngestedUpload(
+                field_name=upload.field_name,
+                filename=name,
+                content_type=media_type,
+                media_type=media_type,
+                size=len(content),
+                digest=hashlib.sha256(content).hexdigest(),
+                data=memoryview(content),
+            )
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+        yield RejectedUpload(upload.field_name, upload.filename, f"Corrupted archive: {e}")
@@ -0,0 +1,296 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import AsyncIterator, Optional
+
+from app.config import settings
+from app.ingest import IngestedUpload
+from app.admission import Reservation
+from app.analysis import analyze_video_content, build_verdict, INFERENCE_TIMEOUT_S
+from app.scheduler import inference_scheduler, SlotUnavailable
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATES = ("done", "failed")
+
+class JobQueueFull(Exception):
+    pass
+
+class JobStore:
+    """
+    Job status in a WAL-mode SQLite file, so any worker can answer GET /jobs/{id} for a job another worker runs.
+    Only status, progress and the verdict are stored. Media never touches the store.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, owner TEXT NOT NULL, status TEXT NOT NULL, "
+            "frames_total INTEGER, frames_done INTEGER NOT NULL DEFAULT 0, "
+            "result TEXT, error TEXT, created REAL NOT NULL, updated REAL NOT NULL, expires REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, owner: str) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (id, owner, status, created, updated, expires) VALUES (?, ?, 'queued', ?, ?, ?)",
+            (job_id, owner, now, now, now + self.ttl_seconds),
+        )
+        return job_id
+
+    def update(self, job_id: str, **fields):
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"])
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._connect().execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str, owner: str) -> Optional[dict]:
+        """The job as the API reports it, or None if unknown, expired or owned by someone else."""
+        row = self._connect().execute(
+            "SELECT id, status, frames_total, frames_done, result, error, created, updated FROM jobs "
+            "WHERE id = ? AND owner = ? AND expires >= ?",
+            (job_id, owner, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        job = {
+            "job_id": row[0],
+            "status": row[1],
+            "progress": {"frames_done": row[3], "frames_total": row[2]},
+            "created_at": row[6],
+            "updated_at": row[7],
+        }
+        if row[4] is not None:
+            job["result"] = json.loads(row[4])
+        if row[5] is not None:
+            job["error"] = row[5]
+        return job
+
+    def purge_expired(self):
+        try:
+            self._connect().execute("DELETE FROM jobs WHERE expires < ?", (time.time(),))
+        except sqlite3.Error as e:
+            logger.warning("Job store purge failed: %s", e)
+
+class _ProgressWriter:
+    """
+    Coalesces one job's progress callbacks (one per scored frame) into at most one store write
+    per JOB_PROGRESS_INTERVAL_S, written off the event loop.
+    """
+
+    def __init__(self, store: JobStore, job_id: str):
+        self.store = store
+        self.job_id = job_id
+        self._pending = {}
+        self._task: Optional[asyncio.Task] = None
+        self._closed = asyncio.Event()
+
+    def update(self, **fields):
+        self._pending.update(fields)
+        if self._task is None and not self._closed.is_set():
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        try:
+            while self._pending and not self._closed.is_set():
+                fields, self._pending = self._pending, {}
+                try:
+                    await asyncio.to_thread(self.store.update, self.job_id, **fields)
+                except Exception as e:
+                    logger.warning("Job %s progress write failed: %s", self.job_id, e)
+                    # Not written: keep for the next flush (or the final write) unless newer values arrived
+                    self._pending = {**fields, **self._pending}
+                try:
+                    await asyncio.wait_for(self._closed.wait(), settings.JOB_PROGRESS_INTERVAL_S)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._task = None
+
+    async def close(self) -> dict:
+        """
+        Stops flushing and waits for a write already in flight (cancelling would not stop its thread,
+        which could then land after the final write); returns progress not yet written, for the final write.
+        """
+        self._closed.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+        fields, self._pending = self._pending, {}
+        return fields
+
+class JobRunner:
+    """
+    Bounded pool of background video workers (per web worker, sized by JOB_WORKERS).
+    Jobs wait in a bounded queue; the upload stays in RAM only until its frames are extracted.
+    """
+
+    def __init__(self, store: JobStore, workers: int, max_queue: int):
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._queue is not None:
+            while not self._queue.empty():
+                job_id, upload, reservation, _ = self._queue.get_nowait()
+                upload.close()
+                reservation.release()
+                await self._write(job_id, status="failed", error="Server shutting down")
+            self._queue = None
+
+    async def _write(self, job_id: str, **fields):
+        """Store writes run in a thread: SQLite lock waits across workers must not stall the event loop."""
+        await asyncio.to_thread(self.store.update, job_id, **fields)
+
+    async def submit(self, owner: str, upload: IngestedUpload, reservation: Reservation, tier: str) -> str:
+        """
+        Queues a video upload (ownership of it and its memory reservation passes to the runner). Raises JobQueueFull.
+        The job runs in an inference slot of the submitter's scheduling tier, like a synchronous request would.
+        """
+        self.start()
+        if self._queue.full():
+            raise JobQueueFull()
+        await asyncio.to_thread(self.store.purge_expired)
+        job_id = await asyncio.to_thread(self.store.create, owner)
+        try:
+            self._queue.put_nowait((job_id, upload, reservation, tier))
+        except asyncio.QueueFull:
+            # Filled up by another submit while the job row was being created
+            await self._write(job_id, status="failed", error="Video job queue is full")
+            raise JobQueueFull()
+        return job_id
+
+    async def _worker(self):
+        while True:
+            job_id, upload, reservation, tier = await self._queue.get()
+            try:
+                await self._run(job_id, upload, tier)
+            finally:
+                upload.close()
+                reservation.release()
+                self._queue.task_done()
+
+    async def _run(self, job_id: str, upload: IngestedUpload, tier: str):
+        try:
+            # Same tiering as synchronous requests; a job is in no hurry, so it may wait as long as an analysis may run
+            await inference_scheduler.acquire(tier, timeout=INFERENCE_TIMEOUT_S)
+        except asyncio.CancelledError:
+            await self._write(job_id, status="failed", error="Server shutting down")
+            raise
+        except SlotUnavailable:
+            await self._write(job_id, status="failed", error="Server busy. Retry later.")
+            self.failed += 1
+            return
+        try:
+            await self._analyze(job_id, upload)
+        finally:
+            inference_scheduler.release(tier)
+
+    async def _analyze(self, job_id: str, upload: IngestedUpload):
+        await self._write(job_id, status="running")
+        progress = _ProgressWriter(self.store, job_id)
+
+        def on_extracted(total: int):
+            # Frames are decoded: the media itself is no longer needed
+            upload.close()
+            progress.update(frames_total=total)
+
+        def on_progress(done: int, total: int):
+            progress.update(frames_done=done, frames_total=total)
+
+        try:
+            probability = await asyncio.wait_for(
+                analyze_video_content(
+                    upload.buffer, upload.suffix, upload.digest,
+                    on_extracted=on_extracted, on_progress=on_progress,
+                ),
+                timeout=INFERENCE_TIMEOUT_S,
+            )
+        except asyncio.CancelledError:
+            await self._write(job_id, **await progress.close(), status="failed", error="Server shutting down")
+            raise
+        except asyncio.TimeoutError:
+            await self._write(job_id, **await progress.close(), status="failed", error="Processing timeout")
+            self.failed += 1
+        except ValueError as e:
+            await self._write(job_id, **await progress.close(), status="failed", error=str(e))
+            self.failed += 1
+        except Exception:
+            logger.error("Video job %s failed", job_id, exc_info=True)
+            await self._write(job_id, **await progress.close(), status="failed", error="An internal server error occurred.")
+            self.failed += 1
+        else:
+            await self._write(job_id, **await progress.close(), status="done", result=build_verdict(probability))
+            self.completed += 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+async def job_events(job_id: str, owner: str) -> AsyncIterator[str]:
+    """
+    Server-Sent Events for one job: a `progress` event on every change, then `done` or `failed`.
+    Polls the shared store, so it works whichever worker runs the job.
+    """
+    last = None
+    last_sent = time.monotonic()
+    while True:
+        job = await asyncio.to_thread(job_store.get, job_id, owner)
+        if job is None:
+            yield "event: failed\ndata: " + json.dumps({"job_id": job_id, "error": "Job expired"}) + "\n\n"
+            return
+        state = (job["status"], job["progress"]["frames_done"], job["progress"]["frames_total"])
+        if state != last:
+            last = state
+            last_sent = time.monotonic()
+            event = job["status"] if job["status"] in FINAL_STATES else "progress"
+            yield f"event: {event}\ndata: {json.dumps(job)}\n\n"
+            if job["status"] in FINAL_STATES:
+                return
+        elif time.monotonic() - last_sent >= settings.JOB_SSE_HEARTBEAT_S:
+            # Comment line keeps proxies / load balancers from closing an idle stream
+            last_sent = time.monotonic()
+            yield ": keep-alive\n\n"
+        await asyncio.sleep(settings.JOB_SSE_POLL_S)
+
+# Global job setup
+job_store = JobStore(settings.JOB_STORE_PATH, settings.JOB_TTL_SECONDS)
+job_runner = JobRunner(job_store, settings.JOB_WORKERS, settings.JOB_QUEUE_MAX)
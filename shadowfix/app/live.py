@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import defaultdict
+from typing import Optional
+
+from fastapi import WebSocket, WebSocketDisconnect, status
+
+from app.config import settings
+from app.auth import identity_from_token
+from app.analysis import analyze_image_content, build_verdict
+from app.scheduler import inference_scheduler, tier_for, SlotUnavailable
+from app.phash import ScoreIndex, dhash_bytes
+from app.rate_limiter import client_ip, hit_limit
+from app.utils import ALLOWED_IMAGE_TYPES, sniff_media_type
+
+logger = logging.getLogger(__name__)
+
+# Open live sessions per session key (per worker)
+_open_sessions = defaultdict(int)
+
+class LiveSession:
+    """
+    One authenticated webcam stream.
+    The receiver only keeps the newest frame (latest-frame-wins); the analyzer
+    scores it, smooths the score over time and pushes the result back.
+    """
+
+    def __init__(self, websocket: WebSocket, identity: dict):
+        self.websocket = websocket
+        self.identity = identity
+        self._latest: Optional[tuple] = None  # (sequence number, frame bytes)
+        self._frame_ready = asyncio.Event()
+        self._closed = False
+        self.received = 0
+        self.analyzed = 0
+        self.dropped = 0
+        self.reused = 0
+        self.smoothed: Optional[float] = None
+        # Webcam frames are consecutive: track the face instead of re-detecting it every frame
+        self.face_tracker = None
+        if settings.FACE_CROP_ENABLED:
+            from app.face_crop import FaceTracker
+
+            self.face_tracker = FaceTracker()
+        # A still webcam sends near-identical frames: reuse the score of a recent look-alike
+        self.scores = ScoreIndex("live", capacity=64) if settings.PHASH_DEDUPE_ENABLED else None
+
+    async def _receive_loop(self):
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                frame = message.get("bytes")
+                if not frame:
+                    continue  # text messages (pings) are ignored
+                self.received += 1
+                if self._latest is not None:
+                    self.dropped += 1  # inference is behind: the older frame is stale
+                self._latest = (self.received, frame)
+                self._frame_ready.set()
+        finally:
+            self._closed = True
+            self._frame_ready.set()
+
+    def _smooth(self, probability: float) -> float:
+        """Exponential moving average across frames."""
+        alpha = settings.LIVE_SMOOTHING_ALPHA
+        self.smoothed = probability if self.smoothed is None else alpha * probability + (1 - alpha) * self.smoothed
+        return self.smoothed
+
+    async def _analyze_loop(self):
+        min_interval = 1.0 / settings.LIVE_MAX_FPS if settings.LIVE_MAX_FPS > 0 else 0.0
+        last_started = 0.0
+        while True:
+            await self._frame_ready.wait()
+            if self._closed:
+                return
+            # Per-session frame-rate cap: newer frames keep replacing the pending one meanwhile
+            wait = last_started + min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._frame_ready.clear()
+            latest, self._latest = self._latest, None
+            if latest is None:
+                continue
+            last_started = time.monotonic()
+            await self.websocket.send_json(await self._analyze(*latest))
+
+    async def _analyze(self, seq: int, frame: bytes) -> dict:
+        if len(frame) > settings.MAX_IMAGE_SIZE_BYTES:
+            return {"type": "error", "frame": seq, "error": "File size exceeds allowed limit"}
+        if sniff_media_type(frame[:16]) not in ALLOWED_IMAGE_TYPES:
+            return {"type": "error", "frame": seq, "error": "Frames must be JPEG or PNG."}
+        frame_hash = probability = None
+        if self.scores is not None:
+            try:
+                frame_hash = await asyncio.to_thread(dhash_bytes, frame)
+            except Exception:
+                pass  # undecodable: analysis reports it below
+            else:
+                probability = self.scores.lookup(frame_hash)
+        reused = probability is not None
+        if not reused:
+            try:
+                # A frame that waited longer than the frame timeout is stale anyway
+                timeout = min(settings.SCHEDULER_QUEUE_TIMEOUT_S, settings.LIVE_FRAME_TIMEOUT_S)
+                async with inference_scheduler.slot(tier_for(self.identity), timeout):
+                    probability = await asyncio.wait_for(
+                        analyze_image_content(frame, hashlib.sha256(frame).hexdigest(), face_tracker=self.face_tracker),
+                        timeout=settings.LIVE_FRAME_TIMEOUT_S,
+                    )
+            except asyncio.TimeoutError:
+                return {"type": "error", "frame": seq, "error": "Processing timeout"}
+            except SlotUnavailable:
+                return {"type": "error", "frame": seq, "error": "Server busy"}
+            except ValueError as e:
+                return {"type": "error", "frame": seq, "error": str(e)}
+            if frame_hash is not None:
+                self.scores.add(frame_hash, probability)
+        self.analyzed += 1
+        self.reused += reused
+        return {
+            "type": "result",
+            "frame": seq,
+            "frame_probability": round(probability, 4),
+            "frame_reused": reused,
+            **build_verdict(self._smooth(probability)),
+            "frames_analyzed": self.analyzed,
+            "frames_reused": self.reused,
+            "frames_dropped": self.dropped,
+        }
+
+    async def run(self):
+        receiver = asyncio.create_task(self._receive_loop())
+        analyzer = asyncio.create_task(self._analyze_loop())
+        try:
+            await asyncio.wait({receiver, analyzer}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (receiver, analyzer):
+                task.cancel()
+            await asyncio.gather(receiver, analyzer, return_exceptions=True)
+            logger.info(
+                "Live session %s closed: %d received, %d analyzed (%d reused a near-identical frame's score), %d dropped",
+                self.identity["email"], self.received, self.analyzed, self.reused, self.dropped,
+            )
+
+def _session_key(websocket: WebSocket, identity: dict) -> str:
+    """
+    What session counts and limits are charged to: a verified user's email, else the client IP.
+    Guest (Clerk) identities come from unverified claims, so a fresh email per connection must not buy a fresh budget.
+    """
+    if identity["type"] == "mock_auth":
+        return identity["email"]
+    return "GUEST_IP_" + client_ip(websocket)
+
+async def run_live_session(websocket: WebSocket):
+    """
+    Authenticates once (`?token=` since browsers can't set WebSocket headers),
+    charges rate limits per session instead of per frame, then streams.
+    """
+    identity = identity_from_token(websocket.query_params.get("token", ""))
+    if identity is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Authentication required")
+        return
+    key = _session_key(websocket, identity)
+    if _open_sessions[key] >= settings.LIVE_MAX_SESSIONS_PER_USER or not await hit_limit(settings.RATE_LIMIT_LIVE_SESSIONS, "live", key):
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Too Many Requests")
+        return
+
+    _open_sessions[key] += 1
+    try:
+        await websocket.accept()
+        logger.info("Live session opened by %s", identity["email"])
+        await LiveSession(websocket, identity).run()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        _open_sessions[key] -= 1
+        if _open_sessions[key] <= 0:
+            del _open_sessions[key]
@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import List
+
+from PIL import Image
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+LOCAL_BACKENDS = ("transformers", "onnx")
+
+class LocalInferenceEngine:
+    """
+    Warm, batched CPU classifier: the fp32 transformers + torch model, or (LOCAL_ENGINE_BACKEND=onnx)
+    its int8 ONNX export from `python -m app.onnx_export` run by onnxruntime.
+    Loaded once per worker, ideally from the app lifespan, and shared by image and video analysis.
+    """
+
+    def __init__(self, model_id: str):
+        self.model_id = model_id
+        self.backend = None
+        self._processor = None
+        self._model = None
+        self._torch = None
+        self._np = None
+        self._preprocessing = {}
+        self._labels = {}
+        self._load_lock = threading.Lock()
+        # torch already parallelises each forward pass; serialise batches per worker
+        self._run_lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._model is not None
+
+    @property
+    def available(self) -> bool:
+        """True when the engine is warm or configured to be loaded on demand."""
+        return self.ready or settings.LOCAL_ENGINE_ENABLED
+
+    def load(self):
+        """Loads the configured backend. Raises ImportError when its packages are missing."""
+        with self._load_lock:
+            if self.ready:
+                return
+            started = time.perf_counter()
+            backend = settings.LOCAL_ENGINE_BACKEND
+            if backend == "transformers":
+                threads = self._load_transformers()
+            elif backend == "onnx":
+                threads = self._load_onnx()
+            else:
+                raise ValueError(f"Unknown LOCAL_ENGINE_BACKEND: {backend} (expected one of {', '.join(LOCAL_BACKENDS)})")
+            self.backend = backend
+            logger.info(
+                "Local inference engine ready: %s via %s (batch=%d, threads=%d) in %.2fs",
+                self.model_id if backend == "transformers" else settings.LOCAL_ONNX_MODEL_PATH, backend,
+                settings.LOCAL_BATCH_SIZE, threads, time.perf_counter() - started,
+            )
+
+    def _load_transformers(self) -> int:
+        import torch
+        from transformers import AutoImageProcessor, AutoModelForImageClassification
+
+        if settings.LOCAL_TORCH_THREADS > 0:
+            torch.set_num_threads(settings.LOCAL_TORCH_THREADS)
+        processor = AutoImageProcessor.from_pretrained(self.model_id)
+        model = AutoModelForImageClassification.from_pretrained(self.model_id)
+        model.eval()
+
+        self._torch = torch
+        self._processor = processor
+        self._labels = dict(model.config.id2label)
+        self._model = model
+        return torch.get_num_threads()
+
+    def _load_onnx(self) -> int:
+        import numpy as np
+        import onnxruntime as ort
+
+        path = settings.LOCAL_ONNX_MODEL_PATH
+        if not path:
+            raise RuntimeError("LOCAL_ENGINE_BACKEND=onnx needs LOCAL_ONNX_MODEL_PATH (see python -m app.onnx_export)")
+        with open(os.path.splitext(path)[0] + ".json") as sidecar:
+            metadata = json.load(sidecar)
+
+        options = ort.SessionOptions()
+        if settings.LOCAL_ONNX_THREADS > 0:
+            options.intra_op_num_threads = settings.LOCAL_ONNX_THREADS
+        if settings.LOCAL_ONNX_SHARE_WEIGHTS:
+            # Weights are used straight from the memory-mapped, read-only .data file: clean file-backed
+            # pages that every worker on the host shares, instead of a private prepacked copy per worker
+            options.add_session_config_entry("session.disable_prepacking", "1")
+        session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+        self._np = np
+        self._preprocessing = metadata["preprocessing"]
+        self._labels = {int(i): label for i, label in metadata["id2label"].items()}
+        self._model = session
+        return settings.LOCAL_ONNX_THREADS or os.cpu_count() or 1
+
+    def classify(self, images: List[Image.Image]) -> List[list]:
+        """
+        Runs images through the model in batched forward passes.
+        Returns one pipeline-style label list ([{"label", "score"}, ...]) per image, in input order.
+        """
+        if not self.ready:
+            self.load()
+        batch_size = max(1, settings.LOCAL_BATCH_SIZE)
+        results = []
+        with self._run_lock:
+            for start in range(0, len(images), batch_size):
+                batch = [img if img.mode == "RGB" else img.convert("RGB") for img in images[start:start + batch_size]]
+                probs = self._probabilities_onnx(batch) if self.backend == "onnx" else self._probabilities_torch(batch)
+                for row in probs:
+                    ranked = sorted(
+                        ({"label": self._labels[i], "score": score} for i, score in enumerate(row)),
+                        key=lambda item: item["score"],
+                        reverse=True,
+                    )
+                    results.append(ranked)
+        return results
+
+    def _probabilities_torch(self, batch: List[Image.Image]) -> List[List[float]]:
+        with self._torch.inference_mode():
+            inputs = self._processor(images=batch, return_tensors="pt")
+            return self._model(**inputs).logits.softmax(dim=-1).tolist()
+
+    def _probabilities_onnx(self, batch: List[Image.Image]) -> List[List[float]]:
+        np = self._np
+        logits = self._model.run(["logits"], {"pixel_values": self._preprocess_onnx(batch)})[0]
+        exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return (exp / exp.sum(axis=-1, keepdims=True)).tolist()
+
+    def _preprocess_onnx(self, batch: List[Image.Image]):
+        """The exported image processor's steps (resize, center crop, rescale, normalize) in NumPy, NCHW float32."""
+        np = self._np
+        p = self._preprocessing
+        resample = Image.Resampling(p.get("resample") if p.get("resample") is not None else Image.Resampling.BILINEAR)
+        pixels = []
+        for image in batch:
+            if p.get("do_resize"):
+                size = p["size"]
+                if "height" in size:
+                    image = image.resize((size["width"], size["height"]), resample)
+                else:
+                    scale = size["shortest_edge"] / min(image.size)
+                    image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), resample)
+            if p.get("do_center_crop"):
+                crop = p["crop_size"]
+                left, top = (image.width - crop["width"]) // 2, (image.height - crop["height"]) // 2
+                image = image.crop((left, top, left + crop["width"], top + crop["height"]))
+            array = np.asarray(image, dtype=np.float32)
+            if p.get("do_rescale"):
+                array = array * np.float32(p["rescale_factor"])
+            if p.get("do_normalize"):
+                array = (array - np.array(p["image_mean"], dtype=np.float32)) / np.array(p["image_std"], dtype=np.float32)
+            pixels.append(array.transpose(2, 0, 1))
+        return np.stack(pixels)
+
+# Global engine (one per worker process)
+local_engine = LocalInferenceEngine(settings.LOCAL_MODEL_ID)
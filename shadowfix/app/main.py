@@ -1,11 +1,12 @@
 import asyncio
-import gc
 import logging
+import math
+import time
 import traceback
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, File, HTTPException, UploadFile, status, Depends, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, status, Depends, Request, WebSocket
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -17,41 +18,125 @@ from app.auth import (
     check_admin_role,
     Token,
     MOCK_USERS,
-    verify_password
+    request_identity,
+    token_cache,
+    verify_password_async
 )
 from app.security import validate_api_key, add_security_headers, api_key_header
-from app.rate_limiter import init_app_limiter, limiter
-from app.model import predict_image
-from app.video_model import predict_video
-from app.utils import (
-    bytes_to_pil,
-    classify_risk,
-    validate_image_file,
-    validate_video_file
+from app.rate_limiter import init_app_limiter, rate_limit, client_ip, store as limiter_store
+from app.inference_client import init_inference_client, close_inference_client
+from app.local_engine import local_engine
+from app.batcher import local_batcher
+from app.cache import verdict_cache, frame_cache
+from app.preprocess import preprocess_stats
+from app.metrics import (
+    CONTENT_TYPE_LATEST,
+    IN_FLIGHT,
+    REQUESTS,
+    REQUEST_SECONDS,
+    metrics_snapshot,
+    observe_stage,
+    render_prometheus,
+    start_sampler,
+    stop_sampler
 )
+from app.ingest import (
+    ingest_upload,
+    IngestedUpload,
+    StreamingUploadParser,
+    UPLOAD_OPENAPI,
+    BATCH_UPLOAD_OPENAPI
+)
+from app.analysis import (
+    analyze_image_content,
+    analyze_video_content,
+    build_verdict,
+    BatchRun,
+    INFERENCE_TIMEOUT_S
+)
+from app.live import run_live_session
+from app.model import probe_cloud
+from app.backend_router import cloud_router
+from app.jobs import job_runner, job_store, job_events, JobQueueFull
+from app.admission import admit, release_after, memory_budget, gc_policy, AdmissionRejected
+from app.readiness import readiness, warmup_hooks
+from app.decode_pool import decode_pool
+from app.singleflight import image_flights, video_flights
+from app.scheduler import inference_scheduler, tier_for, SlotUnavailable
 
 # Logging Setup
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-from slowapi.util import get_remote_address
-
 # --- Rate Limit Keys ---
 def auth_key_func(request: Request):
-    """Returns Authorization header as key if present."""
-    return request.headers.get("Authorization")
+    """Returns the caller's identity as key if the bearer token resolves to one."""
+    identity = request_identity(request)
+    if identity is None:
+        return None
+    return f"{identity['type']}:{identity['email']}"
 
 def guest_key_func(request: Request):
-    """Returns IP as key ONLY for guests (no Auth header)."""
-    if request.headers.get("Authorization"):
+    """Returns IP as key ONLY for guests (no resolvable token)."""
+    if request_identity(request) is not None:
         return None  # Skip this limit for auth users
-    return get_remote_address(request)
+    return client_ip(request)
+
+async def _load_local_engine():
+    try:
+        await asyncio.to_thread(local_engine.load)
+    except ImportError:
+        needs = "onnxruntime" if settings.LOCAL_ENGINE_BACKEND == "onnx" else "transformers/torch"
+        raise RuntimeError(f"LOCAL_ENGINE_ENABLED but {needs} is not installed.")
+
+async def _load_face_detector():
+    # Falling back to full frames on every request would go unnoticed: /ready fails instead
+    from app.face_crop import face_detector
+
+    try:
+        await asyncio.to_thread(face_detector.load)
+    except Exception as e:
+        raise RuntimeError(f"FACE_CROP_ENABLED but no face detector could be loaded: {e}")
+
+async def _purge_expired():
+    """Expired rows are only skipped on read; without a periodic sweep the SQLite files grow until restart."""
+    while True:
+        await asyncio.sleep(settings.STORE_PURGE_INTERVAL_S)
+        for purge in (limiter_store.purge_expired, verdict_cache.purge_expired, job_store.purge_expired):
+            await asyncio.to_thread(purge)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Wait for readiness."""
+    """Starts the worker; /ready passes once the configured backends are up."""
     logger.info("Initializing SHADOWFIX Featherweight Suite...")
+    await readiness.run("http_pool", init_inference_client)
+    await asyncio.to_thread(verdict_cache.purge_expired)
+    if settings.LOCAL_ENGINE_ENABLED:
+        # Loaded in the background: the worker answers /health at once, /ready waits for the model
+        readiness.start("local_engine", _load_local_engine)
+        local_batcher.start()
+    if settings.FACE_CROP_ENABLED:
+        readiness.start("face_detector", _load_face_detector)
+    for name, hook in warmup_hooks().items():
+        readiness.start(f"warmup_{name}", hook, required=False)
+    start_sampler()
+    cloud_router.start(probe_cloud)
+    job_store.purge_expired()
+    decode_pool.start()
+    job_runner.start()
+    gc_policy.start()
+    purge_task = asyncio.create_task(_purge_expired())
     yield
+    purge_task.cancel()
+    await asyncio.gather(purge_task, return_exceptions=True)
+    await readiness.stop()
+    await gc_policy.stop()
+    await job_runner.stop()
+    await decode_pool.stop()
+    await cloud_router.stop()
+    await stop_sampler()
+    await local_batcher.stop()
+    await close_inference_client()
     logger.info("SHADOWFIX shutting down securely.")
 
 app = FastAPI(
@@ -83,12 +168,21 @@ async def unified_middleware(request: Request, call_next):
         )
 
     # 3. ACTUAL REQUEST EXECUTION
+    start = time.perf_counter()
+    IN_FLIGHT.inc()
     try:
         response = await call_next(request)
+        # Route template (not the raw path) keeps metric cardinality bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        REQUEST_SECONDS.labels(route).observe(time.perf_counter() - start)
+        REQUESTS.labels(route, str(response.status_code)).inc()
         # 4. INJECT CORS HEADERS
         response.headers["Access-Control-Allow-Origin"] = "*"
         response.headers["Access-Control-Allow-Methods"] = "*"
         response.headers["Access-Control-Allow-Headers"] = "*"
+        rate_limit_ms = getattr(request.state, "rate_limit_ms", None)
+        if rate_limit_ms is not None:
+            response.headers["Server-Timing"] = f"ratelimit;dur={rate_limit_ms:.3f}"
         logger.info("Outgoing %s (Status %s)", request.url.path, response.status_code)
         return response
     except Exception as e:
@@ -98,6 +192,8 @@ async def unified_middleware(request: Request, call_next):
             content={"error": "Server Internal Error during processing"},
             headers={"Access-Control-Allow-Origin": "*"}
         )
+    finally:
+        IN_FLIGHT.dec()
 
 # 3. Rate Limiting
 init_app_limiter(app)
@@ -122,6 +218,22 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         headers=exc.headers
     )
 
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=503,
+        content={"error": "Server busy: memory budget exhausted. Retry later."},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+@app.exception_handler(SlotUnavailable)
+async def slot_unavailable_handler(request: Request, exc: SlotUnavailable):
+    return JSONResponse(
+        status_code=503,
+        content={"error": "Server busy: no inference slot available. Retry later."},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     logger.error("Unhandled Internal Error: %s", traceback.format_exc())
@@ -139,7 +251,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     Use user@shadowfix.ai / shadow_password_123
     """
     user = MOCK_USERS.get(form_data.username)
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    if not user or not await verify_password_async(form_data.password, user["hashed_password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -148,98 +260,250 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     access_token = create_access_token(data={"sub": form_data.username, "role": user["role"]})
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.post("/analyze-image", tags=["Analysis"])
-@limiter.limit(settings.RATE_LIMIT_AUTH, key_func=auth_key_func)
-@limiter.limit(settings.RATE_LIMIT_GUEST, key_func=guest_key_func)
+@app.post(
+    "/analyze-image",
+    tags=["Analysis"],
+    openapi_extra=UPLOAD_OPENAPI,
+    dependencies=[Depends(rate_limit(
+        "analyze-image",
+        (settings.RATE_LIMIT_AUTH, auth_key_func),
+        (settings.RATE_LIMIT_GUEST, guest_key_func),
+    ))],
+)
 async def analyze_image(
     request: Request,
-    file: UploadFile = File(...),
     current_user: dict = Depends(get_optional_user),
 ):
     """Forensic Image Analysis with timeout and memory protection."""
-    validate_image_file(file.filename or "unknown.jpg", file.content_type, file.size)
     user_email = current_user.get("email") if current_user else "GUEST_IP_" + (request.client.host if request.client else "UNKNOWN")
     logger.info("Image analysis request by %s", user_email)
     
-    content = None
-    pil_img = None
+    # Worst-case footprint is reserved before the body is read (503 + Retry-After when over budget)
+    reservation = await admit(request, "image")
+    upload = None
     try:
-        content = await file.read()
-        pil_img = bytes_to_pil(content)
-        
-        # 120s Inference Timeout (Allow for local model loading)
-        probability = await asyncio.wait_for(
-            asyncio.to_thread(predict_image, pil_img),
-            timeout=120.0
-        )
-        
-        risk, flag = classify_risk(probability)
-        return {
-            "verdict": "FAKE" if flag else "REAL",
-            "probability": round(probability, 4),
-            "risk_level": risk,
-            "security_note": "Zero-retention: media discarded."
-        }
+        # Streamed ingestion: size, magic bytes and SHA-256 are checked while receiving
+        with observe_stage("image", "upload_read"):
+            upload = await ingest_upload(request, "image")
+        # Slots are shared by tier (503 at the queue deadline); the inference timeout starts once one is held
+        async with inference_scheduler.slot(tier_for(current_user)):
+            probability = await asyncio.wait_for(
+                analyze_image_content(upload.data, upload.digest),
+                timeout=INFERENCE_TIMEOUT_S
+            )
+        return build_verdict(probability)
     except asyncio.TimeoutError:
         raise HTTPException(status_code=504, detail="Processing timeout")
     finally:
-        # Explicit Memory Cleanup
-        if content: del content
-        if pil_img: del pil_img
-        await file.close()
-        gc.collect()
-
-@app.post("/analyze-video", tags=["Analysis"])
-@limiter.limit(settings.RATE_LIMIT_AUTH, key_func=auth_key_func)
-@limiter.limit(settings.RATE_LIMIT_GUEST, key_func=guest_key_func)
+        if upload: upload.close()
+        reservation.release()
+
+@app.post(
+    "/analyze-video",
+    tags=["Analysis"],
+    openapi_extra=UPLOAD_OPENAPI,
+    dependencies=[Depends(rate_limit(
+        "analyze-video",
+        (settings.RATE_LIMIT_AUTH, auth_key_func),
+        (settings.RATE_LIMIT_GUEST, guest_key_func),
+    ))],
+)
 async def analyze_video(
     request: Request,
-    file: UploadFile = File(...),
     current_user: dict = Depends(get_optional_user)
 ):
     """Forensic Video Analysis with timeout and memory protection."""
-    validate_video_file(file.filename or "unknown.mp4", file.content_type, file.size)
     user_email = current_user.get("email") if current_user else "GUEST_IP_" + (request.client.host if request.client else "UNKNOWN")
     logger.info("Video analysis request by %s", user_email)
     
-    # Extract suffix for OpenCV
-    suffix = ".mp4"
-    if file.filename and file.filename.endswith(".webm"):
-        suffix = ".webm"
-    
-    content = None
+    reservation = await admit(request, "video")
+    upload = None
     try:
-        content = await file.read()
-        
-        # 120s Inference Timeout (Allow for local model loading)
-        result = await asyncio.wait_for(
-            asyncio.to_thread(predict_video, content, suffix=suffix),
-            timeout=120.0
-        )
-        
-        risk, flag = classify_risk(result["overall_probability"])
-        return {
-            "verdict": "FAKE" if flag else "REAL",
-            "probability": round(result["overall_probability"], 4),
-            "risk_level": risk,
-            "security_note": "Zero-retention: media discarded."
-        }
+        # Streamed straight into a RAM-backed buffer OpenCV decodes from
+        with observe_stage("video", "upload_read"):
+            upload = await ingest_upload(request, "video")
+        async with inference_scheduler.slot(tier_for(current_user)):
+            probability = await asyncio.wait_for(
+                analyze_video_content(upload.buffer, upload.suffix, upload.digest),
+                timeout=INFERENCE_TIMEOUT_S
+            )
+        return build_verdict(probability)
     except asyncio.TimeoutError:
         raise HTTPException(status_code=504, detail="Processing timeout")
     finally:
-        if content: del content
-        await file.close()
-        gc.collect()
+        if upload: upload.close()
+        reservation.release()
+
+def _job_owner(request: Request, current_user: dict) -> str:
+    """
+    Jobs are only visible to whoever submitted them: a verified user's email, else the client IP.
+    Guest (Clerk) identities come from unverified claims and anyone can forge one, so they never own jobs by email.
+    """
+    if current_user and current_user["type"] == "mock_auth":
+        return current_user["email"]
+    return "GUEST_IP_" + (request.client.host if request.client else "UNKNOWN")
+
+@app.post(
+    "/jobs/video",
+    tags=["Jobs"],
+    status_code=status.HTTP_202_ACCEPTED,
+    openapi_extra=UPLOAD_OPENAPI,
+    dependencies=[Depends(rate_limit(
+        "jobs-video",
+        (settings.RATE_LIMIT_AUTH, auth_key_func),
+        (settings.RATE_LIMIT_GUEST, guest_key_func),
+    ))],
+)
+async def create_video_job(
+    request: Request,
+    current_user: dict = Depends(get_optional_user)
+):
+    """
+    Asynchronous video analysis: returns a job ID as soon as the upload is received.
+    Poll `GET /jobs/{job_id}` or follow `GET /jobs/{job_id}/events` (SSE) for progress and the verdict.
+    """
+    user_email = _job_owner(request, current_user)
+    logger.info("Video job request by %s", user_email)
+
+    reservation = await admit(request, "video")
+    try:
+        with observe_stage("video", "upload_read"):
+            upload = await ingest_upload(request, "video")
+    except BaseException:
+        reservation.release()
+        raise
+    try:
+        # The runner releases the reservation once the job's frames are scored
+        job_id = await job_runner.submit(user_email, upload, reservation, tier_for(current_user))
+    except JobQueueFull:
+        upload.close()
+        reservation.release()
+        raise HTTPException(
+            status_code=503,
+            detail="Video job queue is full. Retry later.",
+            headers={"Retry-After": "5"},
+        )
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events",
+    }
+
+@app.get("/jobs/{job_id}", tags=["Jobs"])
+async def get_video_job(job_id: str, request: Request, current_user: dict = Depends(get_optional_user)):
+    """Job status, per-frame progress and (once done) the verdict."""
+    job = await asyncio.to_thread(job_store.get, job_id, _job_owner(request, current_user))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/events", tags=["Jobs"])
+async def stream_video_job(job_id: str, request: Request, current_user: dict = Depends(get_optional_user)):
+    """Server-Sent Events: `progress` on every scored frame, then `done` (with the verdict) or `failed`."""
+    owner = _job_owner(request, current_user)
+    if await asyncio.to_thread(job_store.get, job_id, owner) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(
+        job_events(job_id, owner),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post(
+    "/analyze-batch",
+    tags=["Analysis"],
+    openapi_extra=BATCH_UPLOAD_OPENAPI,
+    dependencies=[Depends(rate_limit("analyze-batch", (settings.RATE_LIMIT_BATCH, auth_key_func)))],
+)
+async def analyze_batch(
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Bulk image analysis for moderation pipelines.
+    Accepts many `files` parts and/or `archive` parts (ZIP, TAR, TAR.GZ) and streams
+    NDJSON back, one line per item as it finishes. Bad items get an `error` line
+    instead of failing the batch.
+    """
+    logger.info("Batch analysis request by %s", current_user["email"])
+    reservation = await admit(request, "image", "archive")
+    run = BatchRun(tier_for(request_identity(request)))
+    archives = []
+    parser = StreamingUploadParser(
+        request,
+        {"files": "image", "archive": "archive"},
+        max_files=settings.BATCH_MAX_ITEMS,
+        per_item_errors=True,
+    )
+    try:
+        async for item in parser:
+            if isinstance(item, IngestedUpload) and item.buffer is not None:
+                archives.append(item)
+            else:
+                await run.submit(item)
+    except BaseException:
+        run.cancel()
+        for archive in archives:
+            archive.close()
+        reservation.release()
+        raise
+    return StreamingResponse(release_after(run.stream(archives), reservation), media_type="application/x-ndjson")
+
+@app.websocket("/ws/live")
+async def live_analysis(websocket: WebSocket):
+    """
+    Live webcam analysis. Connect with `?token=<JWT>`, send binary JPEG frames,
+    receive per-frame scores plus a temporally smoothed verdict.
+    Stale frames are dropped when inference falls behind (latest frame wins).
+    """
+    await run_live_session(websocket)
+
+def _face_crop_stats() -> dict:
+    if not settings.FACE_CROP_ENABLED:
+        return {"enabled": False}  # don't load OpenCV just to report an unused stage
+    from app.face_crop import face_crop_stats
+    return face_crop_stats.snapshot()
 
 @app.get("/admin/metrics", tags=["Admin"])
 async def get_metrics(admin: dict = Depends(check_admin_role)):
-    """Admin-only system status."""
+    """Admin-only system status: live pipeline metrics (aggregated across workers) plus in-process stats."""
     return {
         "status": "Healthy",
-        "cpu_usage": "Static Load",
-        "zero_retention_active": True
+        "zero_retention_active": True,
+        **metrics_snapshot(),
+        "verdict_cache": verdict_cache.stats(),
+        "frame_cache": frame_cache.stats(),
+        "singleflight": {"image": image_flights.stats(), "video": video_flights.stats()},
+        "local_batcher": local_batcher.stats(),
+        "inference_scheduler": inference_scheduler.stats(),
+        "backend_router": cloud_router.stats(),
+        "video_jobs": job_runner.stats(),
+        "video_decode": decode_pool.stats(),
+        "admission": memory_budget.stats(),
+        "preprocess": preprocess_stats.snapshot(),
+        "face_crop": _face_crop_stats(),
+        "readiness": readiness.snapshot(),
+        "auth_token_cache": token_cache.stats(),
     }
 
+@app.get("/metrics", tags=["Admin"], include_in_schema=False)
+async def prometheus_metrics(api_key: str = Depends(validate_api_key)):
+    """Prometheus text exposition for scrapers (X-API-KEY)."""
+    return Response(content=render_prometheus(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/health")
 async def health():
+    """Liveness: the process is up (it may still be warming up, see /ready)."""
     return {"status": "ok", "service": "SHADOWFIX-SECURE"}
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once the HTTP pool (and local model / face detector, when enabled) are initialized; 503 while starting, failed or draining."""
+    if readiness.ready:
+        return readiness.snapshot(detail=False)
+    return JSONResponse(
+        status_code=503,
+        content=readiness.snapshot(detail=False),
+        headers={"Retry-After": "1"},
+    )
@@ -0,0 +1,289 @@
+import asyncio
+import logging
+import math
+import os
+import resource
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Set by gunicorn.conf.py before workers fork, so every worker writes to the same directory
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Pipeline stages: upload_read, decode, preprocess, upstream, parse, aggregate (+ local_inference on fallback,
+# face_crop when FACE_CROP_ENABLED; video face crops happen inside decode; decode_queue / decode_handoff
+# when videos are decoded in the process pool).
+# JPEG pixel decoding happens at reduced scale inside preprocess (draft mode), so image "decode" is header parsing.
+STAGE_SECONDS = Histogram(
+    "shadowfix_stage_seconds", "Time spent in each analysis pipeline stage.",
+    ["pipeline", "stage"], buckets=LATENCY_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "shadowfix_request_seconds", "HTTP request latency until response headers are sent.",
+    ["route"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter("shadowfix_requests", "HTTP requests by route and status code.", ["route", "status"])
+UPSTREAM_RESPONSES = Counter("shadowfix_upstream_responses", "Inference API responses by status code.", ["status"])
+IN_FLIGHT = Gauge("shadowfix_in_flight_requests", "Requests currently being handled.", multiprocess_mode="livesum")
+THREADPOOL_QUEUE = Gauge(
+    "shadowfix_threadpool_queue_depth", "Blocking jobs waiting for a worker thread (to_thread pool).",
+    multiprocess_mode="livesum",
+)
+VIDEO_DECODE_QUEUE = Gauge(
+    "shadowfix_video_decode_queue_depth", "Videos waiting for a decode process.", multiprocess_mode="livesum",
+)
+RATE_LIMIT_SECONDS = Histogram(
+    "shadowfix_rate_limit_seconds", "Rate limiter storage round trip per request.",
+    ["backend"], buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1),
+)
+RATE_LIMIT_DECISIONS = Counter("shadowfix_rate_limit_decisions", "Rate limiter outcomes.", ["decision"])
+BACKEND_ROUTED = Counter("shadowfix_backend_routed", "Inference calls by backend choice.", ["backend"])
+BREAKER_STATE = Gauge(
+    "shadowfix_breaker_state", "Cloud circuit breaker state (0 closed, 1 half-open, 2 open; worst worker).",
+    ["backend"], multiprocess_mode="max",
+)
+ADMISSION_BYTES = Gauge(
+    "shadowfix_admission_bytes", "Memory reserved by admitted requests plus decoded frames.", multiprocess_mode="livesum",
+)
+ADMISSION_REJECTED = Counter("shadowfix_admission_rejected", "Requests refused with 503 by the memory budget.")
+VIDEO_FRAMES_CLASSIFIED = Histogram(
+    "shadowfix_video_frames_classified", "Frames sent for classification per video request.",
+    ["outcome"], buckets=(1, 2, 3, 4, 6, 8, 10, 12, 16, 24),
+)
+SINGLEFLIGHT_CALLS = Counter(
+    "shadowfix_singleflight_calls", "Analyses that started a shared run (leader) or joined one in flight.", ["kind", "role"],
+)
+FRAME_DEDUPE = Counter(
+    "shadowfix_frame_dedupe", "Frames classified (scored) or given a near-identical frame's score (reused).", ["kind", "outcome"],
+)
+SCHEDULER_QUEUE_SECONDS = Histogram(
+    "shadowfix_scheduler_queue_seconds", "Time waiting for an inference slot, by caller tier.",
+    ["tier"], buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+SCHEDULER_REJECTED = Counter("shadowfix_scheduler_rejected", "Requests refused with 503 at the queue deadline, by tier.", ["tier"])
+RSS_BYTES = Gauge("shadowfix_rss_bytes", "Resident set size of the workers.", multiprocess_mode="livesum")
+
+@contextmanager
+def observe_stage(pipeline: str, stage: str):
+    """Times a pipeline stage (usable on the event loop and inside worker threads)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(pipeline, stage).observe(time.perf_counter() - start)
+
+def record_upstream_status(status):
+    UPSTREAM_RESPONSES.labels(str(status)).inc()
+
+# --- Process Sampling ---
+
+def current_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Non-Linux: peak RSS is the best cheap approximation
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _threadpool_queue_depth() -> int:
+    executor = getattr(asyncio.get_running_loop(), "_default_executor", None)
+    work_queue = getattr(executor, "_work_queue", None)
+    return work_queue.qsize() if work_queue is not None else 0
+
+def sample_process_metrics():
+    """Refreshes the sampled gauges for this worker (call from the event loop)."""
+    RSS_BYTES.set(current_rss_bytes())
+    THREADPOOL_QUEUE.set(_threadpool_queue_depth())
+
+_sampler_task: Optional[asyncio.Task] = None
+
+async def _sample_loop():
+    while True:
+        sample_process_metrics()
+        await asyncio.sleep(settings.METRICS_SAMPLE_INTERVAL_S)
+
+def start_sampler():
+    """Periodic sampling keeps every worker's gauges fresh, not just the one that serves the scrape."""
+    global _sampler_task
+    if _sampler_task is None:
+        _sampler_task = asyncio.create_task(_sample_loop())
+
+async def stop_sampler():
+    global _sampler_task
+    if _sampler_task is not None:
+        _sampler_task.cancel()
+        await asyncio.gather(_sampler_task, return_exceptions=True)
+        _sampler_task = None
+
+# --- Exposition ---
+
+def _registry():
+    """All workers' metrics in multiprocess mode, this process otherwise."""
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+def render_prometheus() -> bytes:
+    sample_process_metrics()
+    return generate_latest(_registry())
+
+def _quantile(buckets, count: float, q: float) -> float:
+    """Linear interpolation inside cumulative histogram buckets (same as PromQL histogram_quantile)."""
+    rank = q * count
+    prev_le, prev_count = 0.0, 0.0
+    for le, cumulative in buckets:
+        if cumulative >= rank:
+            if math.isinf(le):
+                return prev_le
+            if cumulative == prev_count:
+                return le
+            return prev_le + (le - prev_le) * (rank - prev_count) / (cumulative - prev_count)
+        prev_le, prev_count = le, cumulative
+    return prev_le
+
+def _histogram_summary(samples) -> dict:
+    """{labels tuple: {count, avg_ms, p50_ms, p95_ms, p99_ms}} from one histogram's samples."""
+    series = {}
+    for sample in samples:
+        labels = tuple(v for k, v in sorted(sample.labels.items()) if k != "le")
+        entry = series.setdefault(labels, {"buckets": {}, "count": 0.0, "sum": 0.0})
+        if sample.name.endswith("_bucket"):
+            le = float(sample.labels["le"])
+            entry["buckets"][le] = entry["buckets"].get(le, 0.0) + sample.value
+        elif sample.name.endswith("_count"):
+            entry["count"] += sample.value
+        elif sample.name.endswith("_sum"):
+            entry["sum"] += sample.value
+
+    summary = {}
+    for labels, entry in series.items():
+        count = entry["count"]
+        if not count:
+            continue
+        buckets = sorted(entry["buckets"].items())
+        summary[labels] = {
+            "count": int(count),
+            "avg_ms": round(entry["sum"] / count * 1000, 2),
+            **{f"p{int(q * 100)}_ms": round(_quantile(buckets, count, q) * 1000, 2) for q in (0.5, 0.95, 0.99)},
+        }
+    return summary
+
+def metrics_snapshot() -> dict:
+    """JSON view of the same (worker-aggregated) data /metrics exposes."""
+    sample_process_metrics()
+    snapshot = {
+        "multiprocess": bool(MULTIPROC_DIR),
+        "stages": {},
+        "requests": {},
+        "upstream_status": {},
+        "rate_limiter": {},
+        "backends": {},
+        "video_sampling": {},
+        "coalescing": {},
+        "frame_dedupe": {},
+        "scheduler": {},
+        "in_flight": 0,
+        "threadpool_queue_depth": 0,
+        "video_decode_queue_depth": 0,
+        "rss_bytes": 0,
+    }
+    for metric in _registry().collect():
+        if metric.name == "shadowfix_stage_seconds":
+            for (pipeline, stage), stats in _histogram_summary(metric.samples).items():
+                snapshot["stages"].setdefault(pipeline, {})[stage] = stats
+        elif metric.name == "shadowfix_request_seconds":
+            for (route,), stats in _histogram_summary(metric.samples).items():
+                snapshot["requests"].setdefault(route, {}).update(stats)
+        elif metric.name == "shadowfix_requests":
+            for sample in metric.samples:
+                if sample.name.endswith("_total"):
+                    by_status = snapshot["requests"].setdefault(sample.labels["route"], {}).setdefault("by_status", {})
+                    by_status[sample.labels["status"]] = by_status.get(sample.labels["status"], 0) + int(sample.value)
+        elif metric.name == "shadowfix_rate_limit_seconds":
+            for (backend,), stats in _histogram_summary(metric.samples).items():
+                snapshot["rate_limiter"].setdefault(backend, {}).update(stats)
+        elif metric.name == "shadowfix_rate_limit_decisions":
+            for sample in metric.samples:
+                if sample.name.endswith("_total"):
+                    decisions = snapshot["rate_limiter"].setdefault("decisions", {})
+                    decisions[sample.labels["decision"]] = decisions.get(sample.labels["decision"], 0) + int(sample.value)
+        elif metric.name == "shadowfix_backend_routed":
+            for sample in metric.samples:
+                if sample.name.endswith("_total"):
+                    routed = snapshot["backends"].setdefault("routed", {})
+                    routed[sample.labels["backend"]] = routed.get(sample.labels["backend"], 0) + int(sample.value)
+        elif metric.name == "shadowfix_breaker_state":
+            states = {0: "closed", 1: "half_open", 2: "open"}
+            for sample in metric.samples:
+                snapshot["backends"].setdefault("breaker", {})[sample.labels["backend"]] = states.get(int(sample.value), "unknown")
+        elif metric.name == "shadowfix_video_frames_classified":
+            totals = {}
+            for sample in metric.samples:
+                entry = totals.setdefault(sample.labels["outcome"], {"count": 0.0, "sum": 0.0})
+                if sample.name.endswith("_count"):
+                    entry["count"] += sample.value
+                elif sample.name.endswith("_sum"):
+                    entry["sum"] += sample.value
+            for outcome, entry in totals.items():
+                if entry["count"]:
+                    snapshot["video_sampling"][outcome] = {
+                        "videos": int(entry["count"]),
+                        "avg_frames": round(entry["sum"] / entry["count"], 2),
+                    }
+        elif metric.name == "shadowfix_scheduler_queue_seconds":
+            for (tier,), stats in _histogram_summary(metric.samples).items():
+                snapshot["scheduler"].setdefault(tier, {}).update({f"queue_{key}": value for key, value in stats.items()})
+        elif metric.name == "shadowfix_scheduler_rejected":
+            for sample in metric.samples:
+                if sample.name.endswith("_total"):
+                    entry = snapshot["scheduler"].setdefault(sample.labels["tier"], {})
+                    entry["rejected"] = entry.get("rejected", 0) + int(sample.value)
+        elif metric.name == "shadowfix_singleflight_calls":
+            for sample in metric.samples:
+                if sample.name.endswith("_total"):
+                    entry = snapshot["coalescing"].setdefault(sample.labels["kind"], {"leader": 0, "joined": 0})
+                    entry[sample.labels["role"]] += int(sample.value)
+            for entry in snapshot["coalescing"].values():
+                calls = entry["leader"] + entry["joined"]
+                entry["coalescing_ratio"] = round(entry["joined"] / calls, 4) if calls else 0.0
+        elif metric.name == "shadowfix_frame_dedupe":
+            for sample in metric.samples:
+                if sample.name.endswith("_total"):
+                    entry = snapshot["frame_dedupe"].setdefault(sample.labels["kind"], {"scored": 0, "reused": 0})
+                    entry[sample.labels["outcome"]] += int(sample.value)
+            for entry in snapshot["frame_dedupe"].values():
+                checked = entry["scored"] + entry["reused"]
+                entry["dedupe_ratio"] = round(entry["reused"] / checked, 4) if checked else 0.0
+        elif metric.name == "shadowfix_upstream_responses":
+            for sample in metric.samples:
+                if sample.name.endswith("_total"):
+                    status = sample.labels["status"]
+                    snapshot["upstream_status"][status] = snapshot["upstream_status"].get(status, 0) + int(sample.value)
+        elif metric.name == "shadowfix_in_flight_requests":
+            snapshot["in_flight"] = int(sum(s.value for s in metric.samples))
+        elif metric.name == "shadowfix_threadpool_queue_depth":
+            snapshot["threadpool_queue_depth"] = int(sum(s.value for s in metric.samples))
+        elif metric.name == "shadowfix_video_decode_queue_depth":
+            snapshot["video_decode_queue_depth"] = int(sum(s.value for s in metric.samples))
+        elif metric.name == "shadowfix_rss_bytes":
+            snapshot["rss_bytes"] = int(sum(s.value for s in metric.samples))
+    return snapshot
+
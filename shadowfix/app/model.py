@@ -1,85 +1,100 @@
-import requests
-import io
+import asyncio
 import logging
 from PIL import Image
 from app.config import settings
+from app.inference_client import post_jpeg
+from app.preprocess import prepare_image
+from app.metrics import observe_stage
+from app.local_engine import local_engine
+from app.batcher import local_batcher
+from app.backend_router import cloud_router
+from app.utils import label_fake_probability
 
 logger = logging.getLogger(__name__)
 
 # Model Configuration
 MODEL_ID = "umm-maybe/AI-image-detector"
-API_URL = f"https://router.huggingface.co/hf-inference/models/{MODEL_ID}"
-
-def predict_image(image: Image.Image) -> float:
-    """Uses direct requests for maximum reliability and explicit header control."""
-    
-    # 1. Aggressive Token Sanitization
-    raw_token = settings.HF_API_TOKEN or ""
-    sanitized_token = "".join(raw_token.split()).replace('"', '').replace("'", "")
-    
-    # LOUD DIAGNOSTICS
-    logger.info("***********************************************")
-    if sanitized_token:
-        safe_display = f"{sanitized_token[:6]}...{sanitized_token[-4:]}"
-        logger.info("HF_API_TOKEN: %s (Length: %d)", safe_display, len(sanitized_token))
-    else:
-        logger.error("!!! CRITICAL: HF_API_TOKEN is EMPTY!")
-    logger.info("***********************************************")
-    
-    try:
-        # 2. Prepare Binary Payload
-        img_byte_arr = io.BytesIO()
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-        image.save(img_byte_arr, format='JPEG')
-        
-        logger.info("Requesting inference for %s via direct HTTP POST", MODEL_ID)
-        
-        # 3. Direct API Call with explicit headers to prevent 400 errors
-        headers = {
-            "Authorization": f"Bearer {sanitized_token}",
-            "Content-Type": "image/jpeg"
-        }
-        
-        response = requests.post(API_URL, headers=headers, data=img_byte_arr.getvalue())
-        
-        # 4. Handle Response
-        if response.status_code != 200:
-            error_msg = response.text
-            logger.error("API Request Failed (%d): %s", response.status_code, error_msg)
-            raise ValueError(f"Hugging Face API Error ({response.status_code}): {error_msg}")
+API_URL = f"{settings.HF_API_BASE_URL.rstrip('/')}/{MODEL_ID}"
+
+async def _predict_cloud(payload: bytes) -> float:
+    logger.info("Requesting inference for %s via pooled HTTP POST", MODEL_ID)
+
+    # 1. Pooled API Call (auth header is set once on the shared client)
+    with observe_stage("image", "upstream"):
+        response = await post_jpeg(API_URL, payload, timeout=settings.HF_IMAGE_TIMEOUT)
+
+    # 2. Handle Response
+    if response.status_code != 200:
+        error_msg = response.text
+        logger.error("API Request Failed (%d): %s", response.status_code, error_msg)
+        raise ValueError(f"Hugging Face API Error ({response.status_code}): {error_msg}")
 
+    with observe_stage("image", "parse"):
         results = response.json()
         logger.info("--- INF ENGINE RAW DATA ---")
         logger.info(results)
         logger.info("---------------------------")
-        
-        # 5. Parse Results with Simple Logic (Original)
-        if not results or not isinstance(results, list):
-            raise ValueError(f"Invalid API response style: {results}")
-
-        FAKE_KEYWORDS = ("fake", "ai", "artificial", "generated")
-        REAL_KEYWORDS = ("real", "human", "authentic", "natural")
-        
-        # Try to find an explicit FAKE label first
-        for item in results:
-            label = item.get("label", "").lower()
-            if any(kw in label for kw in FAKE_KEYWORDS):
-                logger.info("Matched FAKE-positive label: %s (score: %f)", label, item["score"])
-                return float(item["score"])
-        
-        # If no fake label found, check for REAL label to calculate (1 - real_score)
-        for item in results:
-            label = item.get("label", "").lower()
-            if any(kw in label for kw in REAL_KEYWORDS):
-                fake_prob = 1.0 - float(item["score"])
-                logger.info("Matched REAL-negative label: %s (score: %f) -> Computed fake prob: %f", label, item["score"], fake_prob)
-                return fake_prob
-        
-        # Fallback to the first result as a generic probability
-        logger.warning("No forensic keywords matched. Falling back to primary result score.")
-        return float(results[0]["score"])
+        return _parse_results(results)
+
+def _parse_results(results) -> float:
+    """Parse Results with Simple Logic (Original)."""
+    if not results or not isinstance(results, list):
+        raise ValueError(f"Invalid API response style: {results}")
+
+    fake_prob = label_fake_probability(results)
+    if fake_prob is not None:
+        logger.info("Matched forensic label -> fake prob: %f", fake_prob)
+        return fake_prob
+
+    # Fallback to the first result as a generic probability
+    logger.warning("No forensic keywords matched. Falling back to primary result score.")
+    return float(results[0]["score"])
 
+_PROBE_PAYLOAD = b""
+
+async def probe_cloud():
+    """Breaker health probe (background task only): a tiny blank frame, raises unless the API answers."""
+    global _PROBE_PAYLOAD
+    if not _PROBE_PAYLOAD:
+        _, _PROBE_PAYLOAD = prepare_image(Image.new("RGB", (32, 32), (128, 128, 128)))
+    response = await post_jpeg(API_URL, _PROBE_PAYLOAD, timeout=settings.HF_IMAGE_TIMEOUT)
+    if response.status_code != 200:
+        raise ConnectionError(f"Hugging Face API Error ({response.status_code})")
+
+def _prepare(image: Image.Image, source, face_tracker):
+    """Optional face crop, then model-resolution payload (runs in a worker thread)."""
+    if settings.FACE_CROP_ENABLED:
+        from app.face_crop import crop_image  # OpenCV only when the stage is on
+
+        with observe_stage("image", "face_crop"):
+            face = crop_image(image, source, face_tracker)
+        if face is not None:
+            image, source = face, None
+    with observe_stage("image", "preprocess"):
+        return prepare_image(image, source)
+
+async def predict_image(image: Image.Image, source=None, face_tracker=None) -> float:
+    """
+    Cloud inference over the shared pooled client, with the warm local engine as fallback.
+    `source` is the original upload; small JPEGs are forwarded as-is instead of re-encoded.
+    `face_tracker` follows the face across frames of one live session (FACE_CROP_ENABLED).
+    """
+    # Face crop + downscale to model resolution + encode once (CPU-bound, off the event loop)
+    image, payload = await asyncio.to_thread(_prepare, image, source, face_tracker)
+
+    async def predict_local() -> float:
+        with observe_stage("image", "local_inference"):
+            results = await local_batcher.submit(image)
+        with observe_stage("image", "parse"):
+            return _parse_results(results)
+
+    # Cloud unless the breaker is open; the local engine covers failures and outages once it is warm
+    # (never loaded inline by a request: LOCAL_ENGINE_ENABLED loads it in the background at startup)
+    try:
+        return await cloud_router.run(
+            lambda: _predict_cloud(payload),
+            predict_local if local_engine.ready else None,
+        )
     except Exception as e:
-        logger.error("Direct Inference Error: %s", str(e), exc_info=True)
+        logger.error("Inference Error: %s", str(e), exc_info=True)
         raise ValueError(f"AI Engine Failure: {str(e)}")
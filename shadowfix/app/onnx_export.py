@@ -0,0 +1,115 @@
+"""
+Offline export of the local detector to ONNX with int8 dynamic quantization, for
+LOCAL_ENGINE_BACKEND=onnx. Needs transformers + torch + onnx + onnxruntime at export time only.
+
+    python -m app.onnx_export --out models/detector
+    python -m app.onnx_export --model umm-maybe/AI-image-detector --out models/detector --keep-fp32
+
+Writes <out>.onnx (graph), <out>.onnx.data (page-aligned weights, memory-mapped at load so every
+worker on the host shares one copy) and <out>.json (labels + preprocessing, so serving needs
+neither transformers nor torch). Point LOCAL_ONNX_MODEL_PATH at <out>.onnx.
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+OPSET = 17
+WEIGHTS_ALIGNMENT = 64 * 1024  # >= the page / allocation granularity onnxruntime needs to mmap external data
+
+# Image processor fields the onnx backend reproduces (see LocalInferenceEngine._preprocess_onnx)
+PREPROCESSING_FIELDS = (
+    "do_resize", "size", "resample", "do_center_crop", "crop_size",
+    "do_rescale", "rescale_factor", "do_normalize", "image_mean", "image_std",
+)
+
+def _export_fp32(model, path: str, image_size):
+    import torch
+
+    class LogitsOnly(torch.nn.Module):
+        def __init__(self, wrapped):
+            super().__init__()
+            self.wrapped = wrapped
+
+        def forward(self, pixel_values):
+            return self.wrapped(pixel_values=pixel_values).logits
+
+    dummy = torch.zeros(1, 3, *image_size)
+    torch.onnx.export(
+        LogitsOnly(model).eval(), (dummy,), path,
+        input_names=["pixel_values"], output_names=["logits"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=OPSET, dynamo=False,
+    )
+
+def _write_aligned_external_data(model_path: str):
+    """Moves large initializers into <model>.data at WEIGHTS_ALIGNMENT offsets (mmap-able, shareable)."""
+    import onnx
+    from onnx.external_data_helper import set_external_data, uses_external_data
+
+    model = onnx.load(model_path)
+    location = os.path.basename(model_path) + ".data"
+    with open(os.path.join(os.path.dirname(model_path), location), "wb") as data:
+        for tensor in model.graph.initializer:
+            if uses_external_data(tensor) or len(tensor.raw_data) < WEIGHTS_ALIGNMENT:
+                continue  # biases / norms stay inline: padding them would cost more than sharing saves
+            offset = -data.tell() % WEIGHTS_ALIGNMENT + data.tell()
+            data.seek(offset)
+            data.write(tensor.raw_data)
+            set_external_data(tensor, location=location, offset=offset, length=len(tensor.raw_data))
+            tensor.ClearField("raw_data")
+            tensor.data_location = onnx.TensorProto.EXTERNAL
+    onnx.save(model, model_path)
+
+def export(model_id: str, out: str, keep_fp32: bool = False) -> dict:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoImageProcessor, AutoModelForImageClassification
+
+    processor = AutoImageProcessor.from_pretrained(model_id)
+    config = processor.to_dict()  # plain JSON types (sizes as dicts, resample as an int)
+    model = AutoModelForImageClassification.from_pretrained(model_id).eval()
+    size = config["crop_size"] if config.get("do_center_crop") else config["size"]
+    image_size = (size["height"], size["width"]) if "height" in size else (size["shortest_edge"],) * 2
+
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    model_path = out + ".onnx"
+    with tempfile.TemporaryDirectory() as scratch:
+        fp32_path = os.path.join(scratch, "fp32.onnx")
+        _export_fp32(model, fp32_path, image_size)
+        if keep_fp32:
+            import shutil
+
+            shutil.copy(fp32_path, out + "-fp32.onnx")
+        # int8 weights, activations quantized per batch at run time: no calibration set needed
+        quantize_dynamic(fp32_path, model_path, weight_type=QuantType.QInt8)
+    _write_aligned_external_data(model_path)
+
+    metadata = {
+        "model_id": model_id,
+        "quantization": "int8-dynamic",
+        "id2label": {str(k): v for k, v in model.config.id2label.items()},
+        "preprocessing": {field: config.get(field) for field in PREPROCESSING_FIELDS},
+    }
+    with open(out + ".json", "w") as sidecar:
+        json.dump(metadata, sidecar, indent=2)
+
+    sizes = {path: os.path.getsize(path) for path in (model_path, model_path + ".data", out + ".json")}
+    logger.info("Exported %s -> %s (%s)", model_id, model_path, ", ".join(f"{os.path.basename(p)} {n / 1e6:.1f} MB" for p, n in sizes.items()))
+    return metadata
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=settings.LOCAL_MODEL_ID, help="Hugging Face model id or local directory")
+    parser.add_argument("--out", required=True, help="output path prefix, e.g. models/detector")
+    parser.add_argument("--keep-fp32", action="store_true", help="also keep the unquantized <out>-fp32.onnx")
+    args = parser.parse_args()
+    export(args.model, args.out, args.keep_fp32)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import io
+import logging
+from typing import List, Optional
+
+from PIL import Image
+
+from app.config import settings
+from app.metrics import FRAME_DEDUPE
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 16     # 16x16 gradient bits (8x8 is too coarse: distinct frames collide)
+COLOR_LEVELS = 16  # mean colour per channel as a 16-step thermometer code
+HASH_BYTES = (HASH_SIZE * HASH_SIZE + 3 * COLOR_LEVELS) // 8
+
+def dhashes(frames: List[Image.Image]) -> List[int]:
+    """
+    Difference hashes, one 304-bit int per frame: is each pixel of the 17x16 grayscale thumbnail
+    brighter than its right neighbour, plus the thumbnail's mean colour as thermometer codes (so
+    Hamming distance also counts colour shifts, which gradients alone ignore: a black and a white
+    frame would otherwise match). Re-encoding and sensor noise move a frame by a few bits at most.
+    """
+    import numpy as np
+
+    if not frames:
+        return []
+    thumbnails = np.stack([
+        np.asarray(frame.convert("RGB").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX), dtype=np.int16)
+        for frame in frames
+    ])
+    gray = (thumbnails * np.array([299, 587, 114])).sum(axis=-1) // 1000
+    gradients = (gray[:, :, 1:] > gray[:, :, :-1]).reshape(len(frames), -1)
+    levels = thumbnails.mean(axis=(1, 2)) * COLOR_LEVELS // 256
+    colors = (np.arange(COLOR_LEVELS) < levels[:, :, None]).reshape(len(frames), -1)
+    packed = np.packbits(np.concatenate([gradients, colors], axis=1), axis=1)
+    return [int.from_bytes(row.tobytes(), "big") for row in packed]
+
+def dhash_bytes(data: bytes) -> int:
+    """dhash of an encoded image; JPEGs decode at reduced scale, which is all the hash needs."""
+    image = Image.open(io.BytesIO(data))
+    image.draft("RGB", (HASH_SIZE * 4, HASH_SIZE * 4))
+    return dhashes([image])[0]
+
+def distances(hashes: List[int], target: int):
+    """Hamming distance from target to every hash (NumPy array)."""
+    import numpy as np
+
+    packed = np.frombuffer(b"".join(h.to_bytes(HASH_BYTES, "big") for h in hashes), dtype=np.uint8).reshape(len(hashes), HASH_BYTES)
+    diff = np.bitwise_xor(packed, np.frombuffer(target.to_bytes(HASH_BYTES, "big"), dtype=np.uint8))
+    return np.unpackbits(diff, axis=1).sum(axis=1)
+
+class ScoreIndex:
+    """
+    Perceptual hashes of already-scored frames (one video, or one live session) with their scores.
+    A frame within PHASH_MAX_DISTANCE bits of one of them reuses that score instead of being
+    classified again. Only real scores are indexed, so reuse never drifts along a chain of
+    near-duplicates. Keeps the most recent `capacity` entries.
+    """
+
+    def __init__(self, kind: str, capacity: int = 256):
+        self.kind = kind
+        self.capacity = capacity
+        self._hashes: List[int] = []
+        self._scores: List[float] = []
+        self.scored = 0
+        self.reused = 0
+
+    def lookup(self, frame_hash: int) -> Optional[float]:
+        """Score of the nearest indexed frame within the threshold (counted as reused), else None."""
+        if not self._hashes:
+            return None
+        dist = distances(self._hashes, frame_hash)
+        nearest = int(dist.argmin())
+        if dist[nearest] > settings.PHASH_MAX_DISTANCE:
+            return None
+        self.reused += 1
+        FRAME_DEDUPE.labels(self.kind, "reused").inc()
+        return self._scores[nearest]
+
+    def remember(self, frame_hash: int, score: float):
+        """Indexes a score obtained elsewhere (e.g. the frame cache) without counting it as classified."""
+        self._hashes = self._hashes[-(self.capacity - 1):] + [frame_hash]
+        self._scores = self._scores[-(self.capacity - 1):] + [score]
+
+    def add(self, frame_hash: int, score: float):
+        """Indexes the score of a frame that was just classified."""
+        self.scored += 1
+        FRAME_DEDUPE.labels(self.kind, "scored").inc()
+        self.remember(frame_hash, score)
+
+    @property
+    def dedupe_ratio(self) -> float:
+        checked = self.scored + self.reused
+        return round(self.reused / checked, 4) if checked else 0.0
@@ -0,0 +1,89 @@
+import io
+import logging
+import threading
+from typing import Optional, Tuple
+
+from PIL import Image
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+class PreprocessStats:
+    """Payload accounting for the preprocessing stage (per worker)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.passthrough = 0
+        self.resized = 0
+        self.reencoded = 0
+        self.source_bytes = 0
+        self.payload_bytes = 0
+        self.bytes_saved = 0
+
+    def record(self, kind: str, payload_len: int, source_len: Optional[int]):
+        with self._lock:
+            setattr(self, kind, getattr(self, kind) + 1)
+            self.payload_bytes += payload_len
+            if source_len is not None:
+                self.source_bytes += source_len
+                self.bytes_saved += source_len - payload_len
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "passthrough": self.passthrough,
+                "resized": self.resized,
+                "reencoded": self.reencoded,
+                "source_bytes": self.source_bytes,
+                "payload_bytes": self.payload_bytes,
+                "bytes_saved": self.bytes_saved,
+            }
+
+preprocess_stats = PreprocessStats()
+
+def _target_size(size: Tuple[int, int]) -> Optional[Tuple[int, int]]:
+    """Shorter side scaled down to MODEL_INPUT_SIZE (aspect kept); None when already small enough."""
+    w, h = size
+    short = min(w, h)
+    if not settings.PREPROCESS_ENABLED or short <= settings.MODEL_INPUT_SIZE:
+        return None
+    scale = settings.MODEL_INPUT_SIZE / short
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+def downscale(image: Image.Image) -> Image.Image:
+    """
+    Model-resolution RGB image. JPEGs that are not decoded yet use draft() so
+    libjpeg decodes at 1/2, 1/4 or 1/8 scale instead of full resolution.
+    """
+    target = _target_size(image.size)
+    if target is not None and image.format == "JPEG":
+        image.draft("RGB", target)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if target is not None and image.size != target:
+        image = image.resize(target, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return image
+
+def prepare_image(image: Image.Image, source=None) -> Tuple[Image.Image, bytes]:
+    """
+    Returns (model-sized image, JPEG payload for upstream).
+    An already-small JPEG upload is forwarded byte-for-byte without re-encoding.
+    """
+    source_len = len(source) if source is not None else None
+    if (
+        source is not None
+        and image.format == "JPEG"
+        and image.mode in ("RGB", "L")
+        and _target_size(image.size) is None
+    ):
+        payload = bytes(source)
+        preprocess_stats.record("passthrough", len(payload), source_len)
+        return image, payload
+
+    resized = _target_size(image.size) is not None
+    small = downscale(image)
+    buffered = io.BytesIO()
+    small.save(buffered, format="JPEG", quality=settings.PREPROCESS_JPEG_QUALITY)
+    payload = buffered.getvalue()
+    preprocess_stats.record("resized" if resized else "reencoded", len(payload), source_len)
+    return small, payload
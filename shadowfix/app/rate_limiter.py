@@ -1,19 +1,301 @@
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request
 from fastapi.responses import JSONResponse
+from limits import parse
+
+from app.config import settings
+from app.metrics import RATE_LIMIT_DECISIONS, RATE_LIMIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# (storage key, allowed hits, window seconds)
+Check = Tuple[str, int, int]
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+
+def _sliding_window(current: int, previous: int, now: float, period: int, amount: int) -> Tuple[bool, float]:
+    """
+    Sliding-window counter: the previous fixed window is weighted by how much of it still overlaps.
+    Returns (allowed, retry_after seconds).
+    """
+    elapsed = now % period
+    weight = 1.0 - elapsed / period
+    if previous * weight + current + 1 <= amount:
+        return True, 0.0
+    if current + 1 > amount or previous == 0:
+        return False, period - elapsed
+    # Wait until enough of the previous window has slid out
+    needed_weight = (amount - current - 1) / previous
+    return False, max(0.0, (1.0 - needed_weight) * period - elapsed)
+
+def _roll(window: int, current: int, previous: int, now_window: int) -> Tuple[int, int]:
+    """Counts (current, previous) as seen from now_window."""
+    if window == now_window:
+        return current, previous
+    if window == now_window - 1:
+        return 0, current
+    return 0, 0
+
+class MemoryStore:
+    """Per-process counters. Only correct with a single worker (dev / tests)."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._windows: Dict[str, Tuple[int, int, int]] = {}
+
+    async def hit(self, checks: List[Check], now: float) -> Tuple[bool, float]:
+        with self._lock:
+            states = []
+            for key, amount, period in checks:
+                now_window = int(now // period)
+                current, previous = _roll(*self._windows.get(key, (now_window, 0, 0)), now_window)
+                states.append((now_window, current, previous))
+            allowed, retry_after = _evaluate(checks, states, now)
+            if allowed:
+                for (key, _, _), (now_window, current, previous) in zip(checks, states):
+                    self._windows[key] = (now_window, current + 1, previous)
+        return allowed, retry_after
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for key in [k for k, (window, _, _) in self._windows.items() if window < int(now // _period_of(k)) - 1]:
+                del self._windows[key]
+
+class SQLiteStore:
+    """
+    Counters in a WAL-mode SQLite file shared by every gunicorn worker on the host.
+    All keys of a request are read and updated in one IMMEDIATE transaction, so checks are atomic across workers.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS windows ("
+            "key TEXT PRIMARY KEY, window INTEGER NOT NULL, current INTEGER NOT NULL, "
+            "previous INTEGER NOT NULL, expires REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=0.5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    async def hit(self, checks: List[Check], now: float) -> Tuple[bool, float]:
+        # In a thread: uncontended the transaction takes microseconds, but while another worker holds the
+        # write lock it waits up to the busy timeout, which must not stall this worker's event loop
+        return await asyncio.to_thread(self._hit, checks, now)
+
+    def _hit(self, checks: List[Check], now: float) -> Tuple[bool, float]:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            keys = [key for key, _, _ in checks]
+            rows = {
+                row[0]: row[1:]
+                for row in conn.execute(
+                    f"SELECT key, window, current, previous FROM windows WHERE key IN ({','.join('?' * len(keys))})",
+                    keys,
+                )
+            }
+            states = []
+            for key, amount, period in checks:
+                now_window = int(now // period)
+                current, previous = _roll(*rows.get(key, (now_window, 0, 0)), now_window)
+                states.append((now_window, current, previous))
+            allowed, retry_after = _evaluate(checks, states, now)
+            if allowed:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO windows (key, window, current, previous, expires) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (key, now_window, current + 1, previous, (now_window + 2) * period)
+                        for (key, _, period), (now_window, current, previous) in zip(checks, states)
+                    ],
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, retry_after
+
+    def purge_expired(self):
+        try:
+            self._connect().execute("DELETE FROM windows WHERE expires < ?", (time.time(),))
+        except sqlite3.Error as e:
+            logger.warning("Rate limit purge failed: %s", e)
+
+# All keys evaluated and incremented by one script execution (single round trip, atomic on the server)
+_REDIS_SCRIPT = """
+local now = tonumber(ARGV[1])
+local states = {}
+local allowed = 1
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local amount = tonumber(ARGV[i * 2])
+    local period = tonumber(ARGV[i * 2 + 1])
+    local now_window = math.floor(now / period)
+    local stored = redis.call('HMGET', key, 'w', 'c', 'p')
+    local window, current, previous = tonumber(stored[1]), tonumber(stored[2]) or 0, tonumber(stored[3]) or 0
+    if window == nil or window < now_window - 1 then
+        current, previous = 0, 0
+    elseif window == now_window - 1 then
+        current, previous = 0, current
+    end
+    states[i] = {now_window, current, previous, period}
+    local elapsed = now % period
+    if previous * (1 - elapsed / period) + current + 1 > amount then
+        allowed = 0
+        local wait = period - elapsed
+        if current + 1 <= amount and previous > 0 then
+            wait = math.max(0, (1 - (amount - current - 1) / previous) * period - elapsed)
+        end
+        retry_after = math.max(retry_after, wait)
+    end
+end
+if allowed == 1 then
+    for i, key in ipairs(KEYS) do
+        local s = states[i]
+        redis.call('HSET', key, 'w', s[1], 'c', s[2] + 1, 'p', s[3])
+        redis.call('EXPIRE', key, s[4] * 2)
+    end
+end
+return {allowed, tostring(retry_after)}
+"""
+
+class RedisStore:
+    """Redis (or any RESP server with Lua) for multi-host deployments. Needs the optional `redis` package."""
+
+    name = "redis"
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis_asyncio
+
+        self._client = redis_asyncio.from_url(url)
+        self._script = self._client.register_script(_REDIS_SCRIPT)
+
+    async def hit(self, checks: List[Check], now: float) -> Tuple[bool, float]:
+        args = [now]
+        for _, amount, period in checks:
+            args.extend((amount, period))
+        allowed, retry_after = await self._script(keys=[key for key, _, _ in checks], args=args)
+        return bool(int(allowed)), float(retry_after)
+
+    def purge_expired(self):
+        pass  # keys carry their own EXPIRE
+
+def _evaluate(checks: List[Check], states, now: float) -> Tuple[bool, float]:
+    """All-or-nothing: a request is admitted only if every key has room; nothing is charged otherwise."""
+    allowed, retry_after = True, 0.0
+    for (_, amount, period), (_, current, previous) in zip(checks, states):
+        ok, wait = _sliding_window(current, previous, now, period, amount)
+        if not ok:
+            allowed, retry_after = False, max(retry_after, wait)
+    return allowed, retry_after
+
+def _period_of(key: str) -> int:
+    return int(key.split("/", 2)[1])
+
+def _create_store():
+    backend = settings.RATE_LIMIT_BACKEND
+    if backend == "redis":
+        try:
+            return RedisStore(settings.RATE_LIMIT_REDIS_URL)
+        except ImportError:
+            logger.error("RATE_LIMIT_BACKEND=redis but the redis package is not installed; using SQLite.")
+            backend = "sqlite"
+    if backend == "sqlite":
+        try:
+            return SQLiteStore(settings.RATE_LIMIT_SQLITE_PATH)
+        except (sqlite3.Error, OSError) as e:
+            logger.error("Rate limit SQLite store unavailable (%s): %s. Falling back to per-worker memory.", settings.RATE_LIMIT_SQLITE_PATH, e)
+    elif backend != "memory":
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+    return MemoryStore()
+
+# Global rate limiter storage (one per worker, state shared through the backend)
+store = _create_store()
+
+def client_ip(request) -> str:
+    return request.client.host if request.client else "127.0.0.1"
+
+def _check(scope: str, limit_string: str, identity: str) -> Check:
+    limit = parse(limit_string)
+    period = limit.get_expiry()
+    # Identities can be bearer tokens: only a digest is ever written to shared storage
+    digest = hashlib.sha256(identity.encode()).hexdigest()[:32]
+    return f"{scope}/{period}/{limit.amount}/{digest}", limit.amount, period
+
+async def _hit(checks: List[Check]) -> Tuple[bool, float]:
+    start = time.perf_counter()
+    try:
+        allowed, retry_after = await store.hit(checks, time.time())
+    except Exception as e:
+        # Fail open: a broken limiter store must not take the API down with it
+        logger.warning("Rate limit store error (%s): %s", store.name, e)
+        allowed, retry_after = True, 0.0
+    RATE_LIMIT_SECONDS.labels(store.name).observe(time.perf_counter() - start)
+    RATE_LIMIT_DECISIONS.labels("allowed" if allowed else "limited").inc()
+    return allowed, retry_after
+
+async def hit_limit(limit_string: str, *identifiers: str) -> bool:
+    """Charges one hit outside of routes (e.g. per WebSocket session). False when exhausted."""
+    allowed, _ = await _hit([_check(identifiers[0], limit_string, "/".join(identifiers[1:]))])
+    return allowed
+
+def rate_limit(scope: str, *rules: Tuple[str, Callable[[Request], Optional[str]]]):
+    """
+    Route dependency evaluating every (limit, key_func) rule in one storage round trip.
+    Rules whose key_func returns None are skipped (e.g. the guest limit for authenticated callers).
+    """
+
+    async def dependency(request: Request):
+        checks = []
+        for limit_string, key_func in rules:
+            identity = key_func(request)
+            if identity:
+                checks.append(_check(scope, limit_string, identity))
+        if not checks:
+            return
+        start = time.perf_counter()
+        allowed, retry_after = await _hit(checks)
+        # Per-request limiter overhead; the middleware reports it as a Server-Timing header
+        request.state.rate_limit_ms = (time.perf_counter() - start) * 1000
+        if not allowed:
+            raise RateLimitExceeded(retry_after)
 
-# Global rate limiter setup
-limiter = Limiter(key_func=get_remote_address)
+    return dependency
 
-def _custom_rate_limit_exceeded_handler(request, exc):
+def _custom_rate_limit_exceeded_handler(request, exc: RateLimitExceeded):
     """Returns structured JSON error for rate limiting."""
     return JSONResponse(
         status_code=429,
-        content={"error": "Too Many Requests"}
+        content={"error": "Too Many Requests"},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
     )
 
 def init_app_limiter(app):
     """Register limiter with the FastAPI app."""
-    app.state.limiter = limiter
+    store.purge_expired()
+    logger.info("Rate limiter storage: %s", store.name)
     app.add_exception_handler(RateLimitExceeded, _custom_rate_limit_exceeded_handler)
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict
+
+from PIL import Image
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+WARMUP_HOOKS = ("video", "local", "cloud", "face")
+
+class Readiness:
+    """
+    Startup state behind /ready (per worker). /health only says the process is up; /ready
+    passes once every required component (HTTP pool, local model when enabled) is initialized
+    and every optional one (warm-up hooks) has finished, successfully or not. It fails again
+    while the worker drains on shutdown.
+    """
+
+    def __init__(self):
+        self.components: Dict[str, dict] = {}
+        self.draining = False
+        self._started = time.monotonic()
+        self._tasks = []
+
+    def _component(self, name: str, required: bool) -> dict:
+        component = self.components[name] = {"state": "pending", "required": required}
+        return component
+
+    async def run(self, name: str, step: Callable[[], Awaitable[None]], required: bool = True):
+        """Runs one startup step and records its outcome (re-raising its error)."""
+        component = self._component(name, required)
+        started = time.perf_counter()
+        try:
+            await step()
+        except asyncio.CancelledError:
+            component["state"] = "cancelled"
+            raise
+        except Exception as e:
+            component["state"] = "failed"
+            component["error"] = str(e) or type(e).__name__
+            raise
+        else:
+            component["state"] = "ready"
+        finally:
+            component["seconds"] = round(time.perf_counter() - started, 3)
+
+    async def _run_logged(self, name: str, step: Callable[[], Awaitable[None]], required: bool):
+        try:
+            await self.run(name, step, required)
+        except Exception:
+            log = logger.error if required else logger.warning
+            log("Startup step %s failed: %s", name, self.components[name]["error"])
+
+    def start(self, name: str, step: Callable[[], Awaitable[None]], required: bool = True):
+        """Like run(), in the background: the server accepts traffic (and /health) meanwhile."""
+        self._component(name, required)
+        self._tasks.append(asyncio.create_task(self._run_logged(name, step, required)))
+
+    async def stop(self):
+        self.draining = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @property
+    def ready(self) -> bool:
+        return not self.draining and all(
+            component["state"] == "ready" if component["required"] else component["state"] != "pending"
+            for component in self.components.values()
+        )
+
+    def snapshot(self, detail: bool = True) -> dict:
+        """detail=False (public /ready) reports component states only, never error messages."""
+        if self.draining:
+            status = "draining"
+        elif self.ready:
+            status = "ready"
+        elif any(c["state"] == "failed" and c["required"] for c in self.components.values()):
+            status = "failed"
+        else:
+            status = "starting"
+        return {
+            "status": status,
+            "uptime_s": round(time.monotonic() - self._started, 1),
+            "components": self.components if detail else {name: c["state"] for name, c in self.components.items()},
+        }
+
+# --- Warm-up Hooks (WARMUP_HOOKS, all optional) ---
+
+async def _warm_video():
+    """Imports OpenCV and the video pipeline and round-trips one tiny frame through the codec."""
+
+    def warm():
+        import cv2
+        import numpy as np
+        import app.video_model  # noqa: F401
+
+        _, encoded = cv2.imencode(".jpg", np.zeros((64, 64, 3), dtype=np.uint8))
+        cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+
+    await asyncio.to_thread(warm)
+
+async def _warm_local():
+    """One forward pass so the first real request does not pay for lazy kernel initialization."""
+    from app.local_engine import local_engine
+
+    if not local_engine.available:
+        raise RuntimeError("LOCAL_ENGINE_ENABLED is off")
+    await asyncio.to_thread(local_engine.classify, [Image.new("RGB", (settings.MODEL_INPUT_SIZE,) * 2)])
+
+async def _warm_cloud():
+    """One probe call: opens the pooled (TLS / HTTP2) upstream connection before user traffic does."""
+    from app.model import probe_cloud
+
+    await probe_cloud()
+
+async def _warm_face():
+    """Imports OpenCV and loads the face detector model (FACE_CROP_ENABLED)."""
+    from app.face_crop import face_detector
+
+    def warm():
+        import numpy as np
+
+        face_detector.detect(np.zeros((64, 64, 3), dtype=np.uint8))
+
+    await asyncio.to_thread(warm)
+
+_HOOKS = {"video": _warm_video, "local": _warm_local, "cloud": _warm_cloud, "face": _warm_face}
+
+def warmup_hooks() -> Dict[str, Callable[[], Awaitable[None]]]:
+    """The hooks enabled by WARMUP_HOOKS (comma list), in a stable order."""
+    names = [name.strip() for name in settings.WARMUP_HOOKS.split(",") if name.strip()]
+    unknown = [name for name in names if name not in _HOOKS]
+    if unknown:
+        logger.warning("Unknown WARMUP_HOOKS ignored: %s (known: %s)", unknown, ", ".join(WARMUP_HOOKS))
+    return {name: _HOOKS[name] for name in WARMUP_HOOKS if name in names}
+
+# Global readiness state (per worker)
+readiness = Readiness()
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from app.config import settings
+from app.metrics import SCHEDULER_QUEUE_SECONDS, SCHEDULER_REJECTED
+
+logger = logging.getLogger(__name__)
+
+TIERS = ("admin", "mock_auth", "guest_auth", "anonymous")
+
+class SlotUnavailable(Exception):
+    """No inference slot freed up for this tier within SCHEDULER_QUEUE_TIMEOUT_S."""
+
+    def __init__(self, tier: str, retry_after: float):
+        self.tier = tier
+        self.retry_after = retry_after
+
+def tier_for(identity: Optional[dict]) -> str:
+    """Scheduling tier of a request_identity() / get_optional_user() result."""
+    if identity is None:
+        return "anonymous"
+    if identity["type"] == "mock_auth" and identity.get("role") == "admin":
+        return "admin"
+    return identity["type"]
+
+def _per_tier(spec: str, name: str) -> Dict[str, float]:
+    """'admin=8,mock_auth=4,...' -> {tier: value}; every tier must be listed."""
+    values = {}
+    for part in spec.split(","):
+        tier, _, value = part.partition("=")
+        values[tier.strip()] = float(value)
+    if set(values) != set(TIERS):
+        raise ValueError(f"{name} must set exactly the tiers {', '.join(TIERS)}: {spec!r}")
+    return values
+
+class _Tier:
+    __slots__ = ("name", "weight", "limit", "running", "waiters", "vtime")
+
+    def __init__(self, name: str, weight: float, limit: int):
+        self.name = name
+        self.weight = weight
+        self.limit = limit
+        self.running = 0
+        self.waiters = deque()  # futures, FIFO within the tier
+        self.vtime = 0.0
+
+class InferenceScheduler:
+    """
+    Inference slots shared by every analysis in this worker, handed out per caller tier
+    (admin, mock_auth, guest_auth, anonymous). Each tier has a concurrency cap, so guest bursts
+    can never hold every slot; when slots are contended they go to the waiting tier with the
+    lowest virtual time (weighted fair queuing: a tier with weight 4 gets 4x the slots of a
+    tier with weight 1 while both are backlogged, FIFO within a tier). Waiting is bounded by
+    SCHEDULER_QUEUE_TIMEOUT_S, after which the request gets 503 + Retry-After instead of
+    running into the inference timeout.
+    """
+
+    def __init__(self, slots: int, weights: Dict[str, float], limits: Dict[str, float]):
+        self.slots = max(1, slots)
+        self.running = 0
+        self._vclock = 0.0
+        self.tiers = {name: _Tier(name, max(weights[name], 0.001), max(1, int(limits[name]))) for name in TIERS}
+        self.admitted = dict.fromkeys(TIERS, 0)
+        self.rejected = dict.fromkeys(TIERS, 0)
+
+    def _can_run(self, tier: _Tier) -> bool:
+        return self.running < self.slots and tier.running < tier.limit
+
+    def _grant(self, tier: _Tier):
+        self.running += 1
+        tier.running += 1
+        self._vclock = tier.vtime
+        tier.vtime += 1.0 / tier.weight
+        self.admitted[tier.name] += 1
+
+    def _prune(self) -> bool:
+        """Drops timed-out / cancelled waiters; True if anyone is still waiting."""
+        for tier in self.tiers.values():
+            while tier.waiters and tier.waiters[0].done():
+                tier.waiters.popleft()
+        return any(tier.waiters for tier in self.tiers.values())
+
+    def _dispatch(self):
+        while self.running < self.slots and self._prune():
+            eligible = [tier for tier in self.tiers.values() if tier.waiters and tier.running < tier.limit]
+            if not eligible:
+                return
+            tier = min(eligible, key=lambda t: t.vtime)
+            self._grant(tier)
+            tier.waiters.popleft().set_result(None)
+
+    async def acquire(self, tier_name: str, timeout: Optional[float] = None):
+        """Waits up to `timeout` (default SCHEDULER_QUEUE_TIMEOUT_S) for a slot, else raises SlotUnavailable."""
+        tier = self.tiers[tier_name]
+        started = time.perf_counter()
+        if not self._prune() and self._can_run(tier):
+            tier.vtime = max(tier.vtime, self._vclock)
+            self._grant(tier)
+            SCHEDULER_QUEUE_SECONDS.labels(tier_name).observe(0.0)
+            return
+
+        if not tier.waiters:
+            # Idle tiers don't bank credit: a newly backlogged tier starts at the current virtual time
+            tier.vtime = max(tier.vtime, self._vclock)
+        waiter = asyncio.get_running_loop().create_future()
+        tier.waiters.append(waiter)
+        self._dispatch()  # a free slot may be usable right away (e.g. other tiers are capped)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=timeout or settings.SCHEDULER_QUEUE_TIMEOUT_S)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                self.release(tier_name)  # granted in the same tick we gave up
+            else:
+                waiter.cancel()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected[tier_name] += 1
+            SCHEDULER_REJECTED.labels(tier_name).inc()
+            logger.warning("Inference queue deadline: %s request rejected (%d/%d slots busy)", tier_name, self.running, self.slots)
+            raise SlotUnavailable(tier_name, settings.SCHEDULER_RETRY_AFTER_S)
+        finally:
+            SCHEDULER_QUEUE_SECONDS.labels(tier_name).observe(time.perf_counter() - started)
+
+    def release(self, tier_name: str):
+        self.running -= 1
+        self.tiers[tier_name].running -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tier_name: str, timeout: Optional[float] = None):
+        await self.acquire(tier_name, timeout)
+        try:
+            yield
+        finally:
+            self.release(tier_name)
+
+    def stats(self) -> dict:
+        return {
+            "slots": self.slots,
+            "running": self.running,
+            "tiers": {
+                tier.name: {
+                    "weight": tier.weight,
+                    "limit": tier.limit,
+                    "running": tier.running,
+                    "waiting": sum(1 for waiter in tier.waiters if not waiter.done()),
+                    "admitted": self.admitted[tier.name],
+                    "rejected": self.rejected[tier.name],
+                }
+                for tier in self.tiers.values()
+            },
+        }
+
+# Global inference scheduler (per worker)
+inference_scheduler = InferenceScheduler(
+    settings.SCHEDULER_SLOTS,
+    _per_tier(settings.SCHEDULER_TIER_WEIGHTS, "SCHEDULER_TIER_WEIGHTS"),
+    _per_tier(settings.SCHEDULER_TIER_LIMITS, "SCHEDULER_TIER_LIMITS"),
+)
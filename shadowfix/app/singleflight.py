@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, TypeVar
+
+from app.metrics import SINGLEFLIGHT_CALLS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Coalesces concurrent analyses of the same content (per worker). The first caller for a key
+    starts one shared task; callers arriving while it runs join it and all receive its result or
+    error. The task is shielded, so each caller keeps its own timeout and cancellation: one waiter
+    leaving never cancels work others still wait on. It is cancelled only once nobody is left.
+    Covers the window before a verdict exists; the verdict cache takes over once it does.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.joined = 0
+
+    async def do(self, key: str, start: Callable[[], Awaitable[T]]) -> T:
+        """
+        start() is called only by the leader, synchronously, and must not depend on the caller's
+        media staying open: the shared run can outlive the caller that started it.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.create_task(start()))
+            flight.task.add_done_callback(lambda task: self._finished(key, flight))
+            self.leaders += 1
+            SINGLEFLIGHT_CALLS.labels(self.kind, "leader").inc()
+        else:
+            self.joined += 1
+            SINGLEFLIGHT_CALLS.labels(self.kind, "joined").inc()
+            logger.debug("Joined in-flight %s analysis %s (%d waiting)", self.kind, key, flight.waiters + 1)
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Every caller timed out or went away. Forget the flight now, not when the cancellation
+                # lands, so a caller arriving in between starts a fresh run instead of joining a dead one
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    def _finished(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled():
+            flight.task.exception()  # delivered to the waiters; don't log it as unretrieved
+
+    def stats(self) -> dict:
+        calls = self.leaders + self.joined
+        return {
+            "in_flight": len(self._flights),
+            "waiting": sum(flight.waiters for flight in self._flights.values()),
+            "leaders": self.leaders,
+            "joined": self.joined,
+            "coalescing_ratio": round(self.joined / calls, 4) if calls else 0.0,
+        }
+
+# Global coalescing setup (per worker)
+image_flights = SingleFlight("image")
+video_flights = SingleFlight("video")
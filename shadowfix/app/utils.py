@@ -1,15 +1,22 @@
+import hashlib
 import io
 import logging
+import os
+import tempfile
+from typing import Optional
 from PIL import Image
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+SHM_DIR = "/dev/shm"
+
 # Strict Whitelists
 ALLOWED_IMAGE_TYPES = {"image/jpeg", "image/png"}
 ALLOWED_VIDEO_TYPES = {"video/mp4", "video/webm"}
+ALLOWED_ARCHIVE_TYPES = {"application/zip", "application/x-tar", "application/gzip"}
 
-def validate_image_file(filename: str, content_type: str, file_size: int):
+def validate_image_file(filename: str, content_type: str, file_size: Optional[int] = None):
     """Strictly validates image type (extension + MIME) and size."""
     # 1. Extension Check
     ext = f".{filename.split('.')[-1].lower()}" if "." in filename else ""
@@ -17,14 +24,14 @@ def validate_image_file(filename: str, content_type: str, file_size: int):
         raise ValueError("Invalid file extension. Only JPG, JPEG, PNG allowed.")
     
     # 2. MIME Check (Flexible for parameters like charset)
-    if not any(content_type.startswith(t) for t in ALLOWED_IMAGE_TYPES):
+    if not any((content_type or "").startswith(t) for t in ALLOWED_IMAGE_TYPES):
         raise ValueError(f"Invalid MIME type: {content_type}. Access denied.")
     
-    # 3. Size Check
-    if file_size > settings.MAX_IMAGE_SIZE_BYTES:
+    # 3. Size Check (client-declared sizes may be missing; streamed ingestion enforces the real size)
+    if file_size is not None and file_size > settings.MAX_IMAGE_SIZE_BYTES:
         raise ValueError("File size exceeds allowed limit")
 
-def validate_video_file(filename: str, content_type: str, file_size: int):
+def validate_video_file(filename: str, content_type: str, file_size: Optional[int] = None):
     """Strictly validates video type (extension + MIME) and size."""
     # 1. Extension Check
     ext = f".{filename.split('.')[-1].lower()}" if "." in filename else ""
@@ -32,11 +39,41 @@ def validate_video_file(filename: str, content_type: str, file_size: int):
         raise ValueError("Invalid file extension. Only MP4 and WebM allowed.")
     
     # 2. MIME Check (Flexible for parameters like codecs)
-    if not any(content_type.startswith(t) for t in ALLOWED_VIDEO_TYPES):
+    if not any((content_type or "").startswith(t) for t in ALLOWED_VIDEO_TYPES):
         raise ValueError(f"Invalid MIME type: {content_type}. Access denied.")
     
-    # 3. Size Check
-    if file_size > settings.MAX_VIDEO_SIZE_BYTES:
+    # 3. Size Check (client-declared sizes may be missing; streamed ingestion enforces the real size)
+    if file_size is not None and file_size > settings.MAX_VIDEO_SIZE_BYTES:
+        raise ValueError("File size exceeds allowed limit")
+
+def sniff_media_type(head: bytes) -> Optional[str]:
+    """Identifies the real container from magic bytes (tar needs the first 262 bytes)."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[4:8] == b"ftyp":
+        return "video/mp4"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "video/webm"
+    if head.startswith(b"PK\x03\x04"):
+        return "application/zip"
+    if head.startswith(b"\x1f\x8b"):
+        return "application/gzip"
+    if head[257:262] == b"ustar":
+        return "application/x-tar"
+    return None
+
+def content_digest(data: bytes) -> str:
+    """SHA-256 of the uploaded bytes (cache and dedupe key)."""
+    return hashlib.sha256(data).hexdigest()
+
+def validate_archive_file(filename: str, content_type: str, file_size: Optional[int] = None):
+    """Validates batch archives (ZIP, TAR, TAR.GZ). MIME is not checked: clients label archives inconsistently."""
+    name = filename.lower()
+    if not name.endswith((".zip", ".tar", ".tar.gz", ".tgz")):
+        raise ValueError("Invalid archive extension. Only ZIP, TAR and TAR.GZ allowed.")
+    if file_size is not None and file_size > settings.BATCH_MAX_ARCHIVE_BYTES:
         raise ValueError("File size exceeds allowed limit")
 
 def bytes_to_pil(data: bytes) -> Image.Image:
@@ -47,13 +84,103 @@ def bytes_to_pil(data: bytes) -> Image.Image:
         logger.error("Failed to decode image: %s", exc)
         raise ValueError("Corrupted or invalid image data.")
 
+# Label vocabulary shared by cloud and local classifiers
+FAKE_KEYWORDS = ("fake", "ai", "artificial", "generated")
+REAL_KEYWORDS = ("real", "human", "authentic", "natural")
+
+def label_fake_probability(results):
+    """Maps a classifier label list to a FAKE probability (None when no forensic label matches)."""
+    # Try to find an explicit FAKE label first
+    for item in results:
+        label = item.get("label", "").lower()
+        if any(kw in label for kw in FAKE_KEYWORDS):
+            return float(item["score"])
+    # If no fake label found, check for REAL label to calculate (1 - real_score)
+    for item in results:
+        label = item.get("label", "").lower()
+        if any(kw in label for kw in REAL_KEYWORDS):
+            return 1.0 - float(item["score"])
+    return None
+
+# Risk bands (the video sampler early-exits on HIGH and refines around MEDIUM)
+HIGH_RISK_THRESHOLD = 0.7
+MEDIUM_RISK_THRESHOLD = 0.5
+
 def classify_risk(prob: float):
     """
     Forensic Risk Classification.
     Tuned for high sensitivity (Forensic Expert Mode).
     """
-    if prob > 0.7:
+    if prob > HIGH_RISK_THRESHOLD:
         return "HIGH", True
-    if prob >= 0.5:
+    if prob >= MEDIUM_RISK_THRESHOLD:
         return "MEDIUM", True
     return "LOW", False
+
+class MediaBuffer:
+    """
+    Privacy-safe, RAM-backed video buffer that OpenCV can open by path.
+    Prefers an anonymous memfd (never linked into any filesystem), then a tmpfs
+    file in /dev/shm, then a regular temp file. Released on close.
+    """
+
+    def __init__(self, suffix: str = ".mp4"):
+        self.suffix = suffix
+        self.size = 0
+        self._fd: Optional[int] = None
+        self._tmp_path: Optional[str] = None
+        self.path = self._open()
+
+    def _open(self) -> str:
+        if hasattr(os, "memfd_create"):
+            try:
+                self._fd = os.memfd_create("shadowfix-media", os.MFD_CLOEXEC)
+                return f"/proc/self/fd/{self._fd}"
+            except OSError as e:
+                logger.debug("memfd_create unavailable: %s", e)
+        tmp_dir = SHM_DIR if os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK) else None
+        self._fd, self._tmp_path = tempfile.mkstemp(suffix=self.suffix, dir=tmp_dir)
+        return self._tmp_path
+
+    def write(self, data) -> int:
+        view = memoryview(data)
+        while view:
+            written = os.write(self._fd, view)
+            view = view[written:]
+        self.size += len(data)
+        return len(data)
+
+    @property
+    def process_path(self) -> str:
+        """Path other processes of the same user can open (a memfd's /proc/self path is per process)."""
+        if self._tmp_path is None:
+            return f"/proc/{os.getpid()}/fd/{self._fd}"
+        return self._tmp_path
+
+    def share(self) -> "MediaBuffer":
+        """Second handle on the same bytes with its own lifetime (no copy); both must be closed."""
+        other = MediaBuffer.__new__(MediaBuffer)
+        other.suffix, other.size = self.suffix, self.size
+        other._fd = os.dup(self._fd)
+        if self._tmp_path is None:
+            other._tmp_path = None
+            other.path = f"/proc/self/fd/{other._fd}"
+        else:
+            # A hard link keeps the file reachable after the original is unlinked
+            other._tmp_path = other.path = f"{os.path.splitext(self._tmp_path)[0]}-{other._fd}{self.suffix}"
+            os.link(self._tmp_path, other._tmp_path)
+        return other
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if self._tmp_path and os.path.exists(self._tmp_path):
+            os.unlink(self._tmp_path)
+        self._tmp_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
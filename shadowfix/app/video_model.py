@@ -1,177 +1,244 @@
-import requests
+import asyncio
 import logging
-import io
-import os
-import tempfile
-import gc
-import cv2
+from collections import deque
 from PIL import Image
 from app.config import settings
+from app.inference_client import post_jpeg
+from app.preprocess import prepare_image
+from app.metrics import observe_stage, VIDEO_FRAMES_CLASSIFIED
+from app.cache import frame_cache, cache_key
+from app.utils import content_digest, label_fake_probability, HIGH_RISK_THRESHOLD, MEDIUM_RISK_THRESHOLD
+from app.batcher import local_batcher
+from app.local_engine import local_engine
+from app.backend_router import cloud_router
+from app.admission import memory_budget
+from app.decode_pool import decode_pool
+from app.phash import ScoreIndex, dhashes, distances
 
 logger = logging.getLogger(__name__)
 
 # Model Configuration
 VIDEO_MODEL_ID = "umm-maybe/AI-image-detector"
-VIDEO_API_URL = f"https://router.huggingface.co/hf-inference/models/{VIDEO_MODEL_ID}"
+VIDEO_API_URL = f"{settings.HF_API_BASE_URL.rstrip('/')}/{VIDEO_MODEL_ID}"
 
-def query_hf_api(image: Image.Image):
-    """Internal helper for HF API frame classification using direct requests."""
-    
-    # Aggressive Token Sanitization
-    raw_token = settings.HF_API_TOKEN or ""
-    sanitized_token = "".join(raw_token.split()).replace('"', '').replace("'", "")
-    
-    try:
-        buffered = io.BytesIO()
-        image.save(buffered, format="JPEG")
-        
-        logger.info("Requesting video frame inference for %s via direct HTTP POST", VIDEO_MODEL_ID)
-        
-        headers = {
-            "Authorization": f"Bearer {sanitized_token}",
-            "Content-Type": "image/jpeg"
-        }
-        
-        response = requests.post(VIDEO_API_URL, headers=headers, data=buffered.getvalue())
-        
-        if response.status_code != 200:
-            logger.error("Video Frame API Failed (%d): %s", response.status_code, response.text)
-            return None
-            
-        results = response.json()
-        logger.info("Video frame inference success.")
-        return results
-            
-    except Exception as e:
-        logger.error("Video Inference Error: %s", str(e), exc_info=True)
+class FramePlan:
+    """
+    Which candidate frames to classify next, for one video.
+    Representatives go first in coarse-to-fine order; a MEDIUM-risk frame pulls its nearest
+    unvisited neighbours to the front (refinement). Stops when VIDEO_FRAME_BUDGET frames have been
+    sent, or at the first HIGH frame when VIDEO_EARLY_EXIT is on (the verdict is a max()).
+    """
+
+    def __init__(self, candidates: int, order, budget: int):
+        self.candidates = candidates
+        self._queue = deque(order)
+        self._visited = set()
+        self.remaining = budget
+        self.early_exit = False
+
+    def visit(self, i: int, score: float):
+        """Records a score (classified now, or already cached) and adapts the plan to it."""
+        self._visited.add(i)
+        if score > HIGH_RISK_THRESHOLD and settings.VIDEO_EARLY_EXIT:
+            self.early_exit = True
+        elif score >= MEDIUM_RISK_THRESHOLD:
+            for neighbour in (self._nearest_unvisited(i, 1), self._nearest_unvisited(i, -1)):
+                if neighbour is not None:
+                    self._queue.appendleft(neighbour)
+
+    def _nearest_unvisited(self, i: int, step: int):
+        j = i + step
+        while 0 <= j < self.candidates:
+            if j not in self._visited:
+                return j
+            j += step
         return None
 
-def temporary_video_file(video_bytes: bytes, suffix=".mp4"):
-    """Privacy safe temporary file creation."""
-    tmp_path = None
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(video_bytes)
-            tmp_path = tmp.name
-        yield tmp_path
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            os.unlink(tmp_path)
-
-def extract_frames(video_bytes: bytes, n=10, suffix=".mp4"):
-    """Extracts frames with sampling logic across the ENTIRE video."""
-    frames = []
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        tmp.write(video_bytes)
-        tmp_path = tmp.name
-    
-    try:
-        cap = cv2.VideoCapture(tmp_path)
-        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        if total <= 0: return []
-        
-        # Sample n frames across the WHOLE video
-        n = min(n, 12)
-        indices = [int(i * (total / n)) for i in range(n)]
-        
-        for idx in indices:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
-            ret, frame = cap.read()
-            if ret:
-                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                frames.append(Image.fromarray(rgb))
-        cap.release()
-    finally:
-        if os.path.exists(tmp_path): os.unlink(tmp_path)
-        
-    return frames
-
-def predict_video(video_bytes: bytes, suffix=".mp4"):
-    """Enhanced Video Analysis: Global sampling and inclusive label matching."""
-    frames = extract_frames(video_bytes, suffix=suffix)
+    def pending(self) -> int:
+        """Frames still planned (upper bound, for progress reporting)."""
+        if self.early_exit:
+            return 0
+        return min(self.remaining, len(set(self._queue) - self._visited))
+
+    def next_wave(self, size: int):
+        wave = []
+        while self._queue and not self.early_exit and len(wave) < min(size, self.remaining):
+            i = self._queue.popleft()
+            if i not in self._visited and i not in wave:
+                wave.append(i)
+        self._visited.update(wave)
+        self.remaining -= len(wave)
+        return wave
+
+async def query_hf_api(image: Image.Image):
+    """Internal helper for HF API frame classification over the shared pooled client. Raises on failure."""
+    # Its own stage: "preprocess" is the decode pool's per-video resize, and one histogram can't mix both
+    with observe_stage("video", "frame_encode"):
+        _, payload = await asyncio.to_thread(prepare_image, image)
+
+    logger.info("Requesting video frame inference for %s via pooled HTTP POST", VIDEO_MODEL_ID)
+
+    with observe_stage("video", "upstream"):
+        response = await post_jpeg(VIDEO_API_URL, payload, timeout=settings.HF_FRAME_TIMEOUT)
+
+    if response.status_code != 200:
+        logger.error("Video Frame API Failed (%d): %s", response.status_code, response.text)
+        raise ValueError(f"Hugging Face API Error ({response.status_code})")
+
+    results = response.json()
+    logger.info("Video frame inference success.")
+    return results
+
+async def _classify_frames(frames, on_frame=None):
+    """
+    Classifies frames concurrently, each routed to cloud or local by the shared backend router,
+    returning label lists (or the exception) in frame order. Frames routed locally while the
+    breaker is open reach the micro-batcher together and share forward passes.
+    """
+    request_limit = asyncio.Semaphore(max(1, settings.VIDEO_FRAME_CONCURRENCY))
+    # Same policy as predict_image: only a warm local engine is a fallback, never an inline model load
+    # (while it is still loading in the background, failed frames stay failed)
+    use_local = local_engine.ready
+
+    async def classify_local(frame):
+        with observe_stage("video", "local_inference"):
+            return await local_batcher.submit(frame)
+
+    async def classify(frame):
+        async with request_limit:
+            results = await cloud_router.run(lambda: query_hf_api(frame), (lambda: classify_local(frame)) if use_local else None)
+        if on_frame:
+            on_frame()
+        return results
+
+    return await asyncio.gather(*(classify(frame) for frame in frames), return_exceptions=True)
+
+def _frame_keys(frames):
+    """Content keys for decoded frames (per-frame score cache)."""
+    return [cache_key(VIDEO_MODEL_ID, content_digest(frame.tobytes())) for frame in frames]
+
+async def predict_video(video, suffix=".mp4", on_extracted=None, on_progress=None):
+    """
+    Enhanced Video Analysis: adaptive sampling with early exit and inclusive label matching (bytes or MediaBuffer).
+    on_extracted(total) fires once frames are decoded (the media is no longer needed after it);
+    on_progress(done, total) fires as each frame is scored.
+    """
+    frames, order = await decode_pool.extract(video, suffix)
     if not frames:
+        if on_extracted:
+            on_extracted(0)
         raise ValueError("Video forensic extraction failed.")
-        
-    scores = []
-    use_local = False
-    
-    # 1. Connectivity Check
-    try:
-        test_res = query_hf_api(frames[0])
-        if test_res is None: raise ConnectionError("Cloud API returned None")
-    except Exception as e:
-        logger.warning("Video Cloud API blocked, attempting local fallback... %s", e)
-        use_local = True
-
-    # 2. Forensic Loop
-    FAKE_KEYWORDS = ("fake", "ai", "artificial", "generated")
-    REAL_KEYWORDS = ("real", "human", "authentic", "natural")
-    
-    try:
-        if use_local:
-            from transformers import pipeline
-            if not hasattr(predict_video, "_local_pipe"):
-                predict_video._local_pipe = pipeline("image-classification", model=VIDEO_MODEL_ID)
-            
-            for i, frame in enumerate(frames):
-                results = predict_video._local_pipe(frame)
-                found = False
-                # Try FAKE keywords
-                for item in results:
-                    label = item["label"].lower()
-                    if any(kw in label for kw in FAKE_KEYWORDS):
-                        scores.append(item["score"])
-                        found = True
-                        break
-                # Try REAL keywords if no fake found
-                if not found:
-                    for item in results:
-                        label = item["label"].lower()
-                        if any(kw in label for kw in REAL_KEYWORDS):
-                            scores.append(1.0 - float(item["score"]))
-                            found = True
-                            break
-        else:
-            for i, frame in enumerate(frames):
-                try:
-                    results = query_hf_api(frame)
-                    if not results or not isinstance(results, list): continue
-                    
-                    logger.info("Frame %d Results: %s", i, results)
-                    FAKE_KEYWORDS = ("fake", "ai", "artificial", "generated")
-                    REAL_KEYWORDS = ("real", "human", "authentic", "natural")
-                    
-                    logger.info("Frame %d Results: %s", i, results)
-                    found = False
-                    # Try FAKE keywords
-                    for item in results:
-                        label = item.get("label", "").lower()
-                        if any(kw in label for kw in FAKE_KEYWORDS):
-                            scores.append(item["score"])
-                            found = True
-                            break
-                    # Try REAL keywords if no fake found
-                    if not found:
-                        for item in results:
-                            label = item.get("label", "").lower()
-                            if any(kw in label for kw in REAL_KEYWORDS):
-                                scores.append(1.0 - float(item["score"]))
-                                found = True
-                                break
-                except Exception as e:
-                    logger.error("Frame %d Error: %s", i, e)
+
+    plan = FramePlan(len(frames), order, settings.VIDEO_FRAME_BUDGET)
+    frame_scores = {}
+    frame_keys = []
+    if settings.VERDICT_CACHE_ENABLED:
+        frame_keys = await asyncio.to_thread(_frame_keys, frames)
+        for i, cached in enumerate(await frame_cache.get_many(frame_keys)):
+            if cached is not None:
+                frame_scores[i] = cached
+                plan.visit(i, cached)
+    if frame_scores:
+        logger.info("Frame cache: %d/%d candidate frames already scored", len(frame_scores), len(frames))
+    # Near-identical frames (talking heads, screen recordings) reuse one score instead of each going upstream
+    index = None
+    if settings.PHASH_DEDUPE_ENABLED:
+        index = ScoreIndex("video")
+        with observe_stage("video", "phash"):
+            hashes = await asyncio.to_thread(dhashes, frames)
+        for i, score in frame_scores.items():
+            index.remember(hashes[i], score)
+
+    done = len(frame_scores)
+    total = done + plan.pending()
+    if on_extracted:
+        on_extracted(total)
+
+    def frame_done(count=1):
+        nonlocal done
+        done += count
+        if on_progress:
+            on_progress(done, total)
+
+    if on_progress:
+        on_progress(done, total)
+
+    classified = 0
+    # Decoded frames count against the worker's memory budget until scored
+    with memory_budget.track(sum(frame.width * frame.height * len(frame.getbands()) for frame in frames)):
+        try:
+            # Forensic Loop: small waves so a HIGH frame stops the remaining upstream calls
+            while True:
+                wave = plan.next_wave(max(1, settings.VIDEO_FRAME_WAVE))
+                if not wave:
+                    break
+                total = done + len(wave) + plan.pending()
+                send, duplicates = wave, []
+                if index is not None:
+                    send = []
+                    for i in wave:
+                        score = index.lookup(hashes[i])
+                        if score is not None:
+                            frame_scores[i] = score
+                            plan.visit(i, score)
+                            frame_done()
+                            continue
+                        if send and distances([hashes[j] for j in send], hashes[i]).min() <= settings.PHASH_MAX_DISTANCE:
+                            duplicates.append(i)  # scored from its twin in this wave once that comes back
+                        else:
+                            send.append(i)
+                if not send:
                     continue
-    except ImportError:
-        raise ValueError("Forensic Engine Failure. Cloud API failed and Local model (transformers) missing.")
-    finally:
-        del frames
-        gc.collect()
-                 
+                classified += len(send)
+                frame_results = await _classify_frames([frames[i] for i in send], on_frame=frame_done)
+                if (
+                    not frame_scores
+                    and all(isinstance(r, Exception) for r in frame_results)
+                    and (not local_engine.ready or any(isinstance(r, ImportError) for r in frame_results))
+                ):
+                    raise ImportError("transformers")
+
+                with observe_stage("video", "parse"):
+                    for i, results in zip(send, frame_results):
+                        if isinstance(results, Exception):
+                            logger.error("Frame %d Error: %s", i, results)
+                            continue
+                        if not results or not isinstance(results, list): continue
+                        logger.info("Frame %d Results: %s", i, results)
+                        score = label_fake_probability(results)
+                        if score is not None:
+                            frame_scores[i] = score
+                            plan.visit(i, score)
+                            if frame_keys:
+                                await frame_cache.put(frame_keys[i], score)
+                            if index is not None:
+                                index.add(hashes[i], score)
+                    for i in duplicates:
+                        score = index.lookup(hashes[i])
+                        if score is not None:
+                            frame_scores[i] = score
+                            plan.visit(i, score)
+                        frame_done()
+        except ImportError:
+            raise ValueError("Forensic Engine Failure. Cloud API failed and Local model (transformers) missing.")
+
+    VIDEO_FRAMES_CLASSIFIED.labels("early_exit" if plan.early_exit else "complete").observe(classified)
+    if plan.early_exit:
+        logger.info("Early exit: HIGH-risk frame found after %d classified frames", classified)
+    if index is not None and index.reused:
+        logger.info("Frame dedupe: %d frames reused a near-identical frame's score (ratio %.2f)", index.reused, index.dedupe_ratio)
+    if on_progress and total != done:
+        total = done
+        on_progress(done, total)
+    del frames  # freed by refcount right here; leftover cycles are the background GC policy's job
+
+    scores = [frame_scores[i] for i in sorted(frame_scores)]
     if not scores: 
         logger.warning("No forensic labels matched in video. Defaulting to REAL.")
-        return {"overall_probability": 0.0}
+        return {"overall_probability": 0.0, "frames_analyzed": 0}
     
     # Aggregate: Use the MAXIMUM score (Any frame fake = Suspect video)
-    final_score = max(scores)
+    with observe_stage("video", "aggregate"):
+        final_score = max(scores)
     logger.info("Final Video Aggregated Score: %f (MAX from %d frames)", final_score, len(scores))
-    return {"overall_probability": float(final_score)}
+    return {"overall_probability": float(final_score), "frames_analyzed": len(scores)}
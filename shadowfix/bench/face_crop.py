@@ -0,0 +1,144 @@
+"""
+Face crop vs full frame: payload bytes, preprocessing latency, local inference latency and
+score agreement, on your own face images and/or a talking-head video.
+
+    python -m bench.face_crop --images ~/faces --video ~/talking_head.mp4 --json bench/results/face_crop.json
+    FACE_DETECTOR=yunet FACE_DETECTOR_MODEL=face_detection_yunet_2023mar.onnx python -m bench.face_crop --images ~/faces
+
+Scores come from the local engine (LOCAL_MODEL_ID, needs transformers + torch); without it only
+bytes and preprocessing latency are reported. The synthetic bench fixtures contain no faces, so
+running without --images/--video only exercises the full-frame fallback.
+"""
+import argparse
+import io
+import json
+import os
+import time
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from app.config import settings
+from app.face_crop import FaceTracker, crop_frame, crop_image, face_crop_stats
+from app.frames import sample_frames
+from app.local_engine import local_engine
+from app.preprocess import prepare_image
+from app.utils import classify_risk, label_fake_probability
+from bench.fixtures import ensure_fixtures
+from bench.loadgen import percentile
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+def _load_images(directory: Optional[str]) -> List[Tuple[str, bytes]]:
+    if directory is None:
+        fixtures = ensure_fixtures()
+        paths = [fixtures[name] for name in ("image_small.jpg", "image_large.jpg", "image.png")]
+    else:
+        directory = os.path.expanduser(directory)
+        paths = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+    return [(os.path.basename(path), open(path, "rb").read()) for path in paths]
+
+def _score(image: Image.Image) -> Tuple[Optional[float], float]:
+    """(fake probability, inference seconds); (None, 0) without a local engine."""
+    if not local_engine.ready:
+        return None, 0.0
+    started = time.perf_counter()
+    results = local_engine.classify([image])[0]
+    return label_fake_probability(results), time.perf_counter() - started
+
+def _run_images(images: List[Tuple[str, bytes]]) -> List[dict]:
+    rows = []
+    for name, data in images:
+        row = {"input": name}
+        for mode in ("full", "face"):
+            image = Image.open(io.BytesIO(data))
+            source = data
+            started = time.perf_counter()
+            if mode == "face":
+                face = crop_image(image, source)
+                row["face_found"] = face is not None
+                if face is not None:
+                    image, source = face, None
+            small, payload = prepare_image(image, source)
+            prep_s = time.perf_counter() - started
+            probability, infer_s = _score(small)
+            row[mode] = {"payload_bytes": len(payload), "prep_ms": prep_s * 1000, "infer_ms": infer_s * 1000, "probability": probability}
+        rows.append(row)
+    return rows
+
+def _run_video(path: str, frames_n: int) -> List[dict]:
+    frames = sample_frames(path, n=frames_n, mode="uniform")  # full frames (FACE_CROP_ENABLED is off here)
+    tracker = FaceTracker()
+    rows = []
+    for i, frame in enumerate(frames):
+        row = {"input": f"{os.path.basename(path)}#{i}"}
+        for mode in ("full", "face"):
+            started = time.perf_counter()
+            image = frame
+            if mode == "face":
+                bgr = cv2.cvtColor(np.asarray(frame), cv2.COLOR_RGB2BGR)
+                cropped = crop_frame(bgr, tracker)
+                row["face_found"] = cropped is not bgr
+                image = Image.fromarray(cv2.cvtColor(cropped, cv2.COLOR_BGR2RGB))
+            small, payload = prepare_image(image)
+            prep_s = time.perf_counter() - started
+            probability, infer_s = _score(small)
+            row[mode] = {"payload_bytes": len(payload), "prep_ms": prep_s * 1000, "infer_ms": infer_s * 1000, "probability": probability}
+        rows.append(row)
+    return rows
+
+def summarize(rows: List[dict]) -> dict:
+    summary = {"inputs": len(rows), "faces_found": sum(1 for row in rows if row.get("face_found"))}
+    for mode in ("full", "face"):
+        prep = sorted(row[mode]["prep_ms"] for row in rows)
+        infer = sorted(row[mode]["infer_ms"] for row in rows)
+        summary[mode] = {
+            "avg_payload_bytes": round(sum(row[mode]["payload_bytes"] for row in rows) / max(1, len(rows))),
+            "prep_p50_ms": round(percentile(prep, 0.5), 2),
+            "prep_p95_ms": round(percentile(prep, 0.95), 2),
+            "infer_p50_ms": round(percentile(infer, 0.5), 2),
+        }
+    scored = [row for row in rows if row["full"]["probability"] is not None and row["face"]["probability"] is not None]
+    if scored:
+        summary["score_mean_abs_diff"] = round(
+            sum(abs(row["full"]["probability"] - row["face"]["probability"]) for row in scored) / len(scored), 4
+        )
+        summary["risk_band_agreement"] = round(
+            sum(1 for row in scored if classify_risk(row["full"]["probability"]) == classify_risk(row["face"]["probability"])) / len(scored), 4
+        )
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default=None, help="directory of JPEG/PNG images (default: bench fixtures)")
+    parser.add_argument("--video", default=None, help="video file; sampled frames go through one face tracker")
+    parser.add_argument("--frames", type=int, default=12, help="frames sampled from --video")
+    parser.add_argument("--no-model", action="store_true", help="skip local inference (bytes and latency only)")
+    parser.add_argument("--json", default=None, help="also write per-input rows and the summary to this file")
+    args = parser.parse_args()
+
+    settings.FACE_CROP_ENABLED = False  # the bench crops explicitly; sample_frames must return full frames
+    if not args.no_model:
+        try:
+            local_engine.load()
+        except Exception as e:
+            print(f"Local engine unavailable ({e}); reporting bytes and latency only.")
+
+    rows = _run_images(_load_images(args.images)) if args.images or not args.video else []
+    if args.video:
+        rows += _run_video(os.path.expanduser(args.video), args.frames)
+
+    summary = summarize(rows)
+    summary["tracker"] = face_crop_stats.snapshot()
+    print(json.dumps(summary, indent=2))
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w") as out:
+            json.dump({"args": vars(args), "summary": summary, "rows": rows}, out, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Local stand-in for the Hugging Face inference router, so load tests never touch router.huggingface.co.
+
+    python -m bench.fake_hf --port 8765 --latency-ms 200 --jitter-ms 50 --error-rate 0.02 --labels artificial
+
+Point the app at it with HF_API_BASE_URL=http://127.0.0.1:8765/hf-inference/models
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# (fake label, real label) as emitted by different detector families
+LABEL_SCHEMAS = {
+    "artificial": ("artificial", "human"),  # umm-maybe/AI-image-detector
+    "fake": ("Fake", "Real"),
+    "deepfake": ("Deepfake", "Realism"),
+    "unknown": ("LABEL_0", "LABEL_1"),      # no forensic keyword: exercises the score fallback
+}
+
+def create_app(latency_ms: float = 200.0, jitter_ms: float = 0.0, error_rate: float = 0.0, labels: str = "artificial") -> FastAPI:
+    fake_label, real_label = LABEL_SCHEMAS[labels]
+    app = FastAPI(title="Fake HF Inference")
+    app.state.calls = 0
+
+    @app.post("/hf-inference/models/{model_id:path}")
+    async def infer(model_id: str, request: Request):
+        body = await request.body()
+        app.state.calls += 1
+        delay = max(0.0, random.gauss(latency_ms, jitter_ms)) / 1000.0
+        await asyncio.sleep(delay)
+        if random.random() < error_rate:
+            return JSONResponse(status_code=503, content={"error": f"Model {model_id} is currently loading"})
+        # Deterministic per payload so cache behaviour is reproducible
+        score = int.from_bytes(hashlib.sha256(body).digest()[:2], "big") / 65535
+        results = [{"label": fake_label, "score": score}, {"label": real_label, "score": 1.0 - score}]
+        return sorted(results, key=lambda r: r["score"], reverse=True)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "calls": app.state.calls}
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--labels", choices=sorted(LABEL_SCHEMAS), default="artificial")
+    args = parser.parse_args()
+    app = create_app(args.latency_ms, args.jitter_ms, args.error_rate, args.labels)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Synthetic, seeded media fixtures for the load tests (no real faces or user data).
+
+    python -m bench.fixtures [--out bench/fixtures]
+"""
+import argparse
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# name -> (width, height, format)
+IMAGES = {
+    "image_small.jpg": (640, 480, "JPEG"),
+    "image_large.jpg": (4000, 3000, "JPEG"),  # typical phone photo
+    "image.png": (1024, 768, "PNG"),
+}
+# name -> (width, height, fps, seconds)
+VIDEOS = {
+    "video.mp4": (640, 360, 24, 10),
+}
+
+def _gradient(width: int, height: int, rng: np.random.Generator) -> np.ndarray:
+    """Smooth gradients plus mild noise: compresses like a photo, unlike pure noise."""
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width)), (x + y) / 2], axis=-1)
+    noise = rng.normal(0, 6, size=(height, width, 3)).astype(np.float32)
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+def _write_video(path: str, width: int, height: int, fps: int, seconds: int, rng: np.random.Generator):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    background = _gradient(width, height, rng)
+    try:
+        for i in range(fps * seconds):
+            frame = background.copy()
+            cx = int((i * 7) % width)
+            cv2.circle(frame, (cx, height // 2), height // 6, (40, 200, 255), -1)
+            cv2.putText(frame, str(i), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+            writer.write(frame)
+    finally:
+        writer.release()
+
+def ensure_fixtures(directory: str = FIXTURES_DIR) -> dict:
+    """Generates missing fixtures; returns {name: path}."""
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(1234)
+    paths = {}
+    for name, (width, height, fmt) in IMAGES.items():
+        path = paths[name] = os.path.join(directory, name)
+        if not os.path.exists(path):
+            Image.fromarray(_gradient(width, height, rng)).save(path, format=fmt, quality=90)
+    for name, (width, height, fps, seconds) in VIDEOS.items():
+        path = paths[name] = os.path.join(directory, name)
+        if not os.path.exists(path):
+            _write_video(path, width, height, fps, seconds, rng)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=FIXTURES_DIR)
+    args = parser.parse_args()
+    for name, path in ensure_fixtures(args.out).items():
+        print(f"{name:20s} {os.path.getsize(path) / 1024:10.1f} KB  {path}")
+
+if __name__ == "__main__":
+    main()
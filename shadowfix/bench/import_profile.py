@@ -0,0 +1,87 @@
+"""
+Import-time profile of the app: runs `python -X importtime -c "import app.main"` in a fresh
+interpreter and reports total import time, the slowest modules and which heavy libraries
+(OpenCV, NumPy, torch, transformers, onnxruntime) load before the first request.
+
+    python -m bench.import_profile
+    python -m bench.import_profile --module app.video_model --top 15 --json bench/results/imports.json
+
+Heavy libraries should appear only behind the code paths (or WARMUP_HOOKS) that need them.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import List
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("cv2", "numpy", "torch", "transformers", "onnxruntime", "scipy")
+
+# "import time:       self [us] |  cumulative | imported package"
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+def profile(module: str) -> List[dict]:
+    """Per-module rows (self_ms, cumulative_ms, depth) in import order."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append({
+                "module": name,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": (len(indent) - 1) // 2,
+            })
+    return rows
+
+def summarize(rows: List[dict], module: str, top: int) -> dict:
+    top_level = [row for row in rows if row["depth"] == 0]
+    loaded = {row["module"]: row for row in rows}
+    return {
+        "module": module,
+        "total_ms": round(sum(row["cumulative_ms"] for row in top_level), 1),
+        "modules": len(rows),
+        "heavy_loaded": {
+            name: round(loaded[name]["cumulative_ms"], 1) for name in HEAVY_MODULES if name in loaded
+        },
+        "top_cumulative": [
+            {"module": row["module"], "ms": round(row["cumulative_ms"], 1)}
+            for row in sorted(top_level, key=lambda row: row["cumulative_ms"], reverse=True)[:top]
+        ],
+        "top_self": [
+            {"module": row["module"], "ms": round(row["self_ms"], 1)}
+            for row in sorted(rows, key=lambda row: row["self_ms"], reverse=True)[:top]
+        ],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main", help="module to import (default: app.main)")
+    parser.add_argument("--top", type=int, default=10, help="rows per ranking")
+    parser.add_argument("--json", default=None, help="also write the summary and raw rows to this file")
+    args = parser.parse_args()
+
+    rows = profile(args.module)
+    summary = summarize(rows, args.module, args.top)
+    print(f"import {args.module}: {summary['total_ms']:.1f} ms across {summary['modules']} modules")
+    print("heavy libraries at import:", ", ".join(f"{k} ({v} ms)" for k, v in summary["heavy_loaded"].items()) or "none")
+    for title, key in (("slowest top-level imports (cumulative)", "top_cumulative"), ("slowest modules (self)", "top_self")):
+        print(f"\n{title}:")
+        for row in summary[key]:
+            print(f"  {row['ms']:8.1f} ms  {row['module']}")
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w") as out:
+            json.dump({"args": vars(args), "summary": summary, "rows": rows}, out, indent=2)
+
+if __name__ == "__main__":
+    main()
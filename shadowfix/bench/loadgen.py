@@ -0,0 +1,255 @@
+"""
+Load generator for the production stack: boots the Procfile gunicorn/uvicorn command against
+bench/fake_hf.py, drives the API at a fixed concurrency and reports req/s, latency percentiles
+and peak RSS per worker.
+
+    python -m bench.loadgen --concurrency 16 --duration 20
+    python -m bench.loadgen --scenarios image_large,video --workers 2 --latency-ms 300 --json bench/results/run.json
+    python -m bench.loadgen --url http://127.0.0.1:8000   # an already running server (no RSS)
+
+Verdict caching is disabled in the spawned app unless --cache is given, so every request does full work.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shlex
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from bench.fixtures import ensure_fixtures
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN = {"username": "admin@shadowfix.ai", "password": "admin_secure_99"}
+UNLIMITED = "1000000 per minute"
+
+# scenario -> (endpoint, fixture, content type); None fixture = form login
+SCENARIOS = {
+    "image": ("/analyze-image", "image_small.jpg", "image/jpeg"),
+    "image_large": ("/analyze-image", "image_large.jpg", "image/jpeg"),
+    "image_png": ("/analyze-image", "image.png", "image/png"),
+    "video": ("/analyze-video", "video.mp4", "video/mp4"),
+    "login": ("/login", None, None),
+}
+
+def procfile_command(port: int, workers: Optional[int]) -> List[str]:
+    """The `web:` command from the Procfile, with $PORT substituted (and -w overridden if asked)."""
+    with open(os.path.join(APP_DIR, "Procfile")) as procfile:
+        line = next(l for l in procfile if l.startswith("web:"))
+    args = shlex.split(line.split(":", 1)[1].replace("$PORT", str(port)))
+    if workers is not None and "-w" in args:
+        args[args.index("-w") + 1] = str(workers)
+    return args
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+# --- RSS sampling (Linux /proc) ---
+
+def _children(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as children:
+            return [int(child) for child in children.read().split()]
+    except OSError:
+        return []
+
+def _rss_bytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+class RssSampler:
+    """Polls the gunicorn workers' RSS and keeps the peak per worker pid."""
+
+    def __init__(self, master_pid: Optional[int], interval_s: float = 0.25):
+        self.master_pid = master_pid
+        self.interval_s = interval_s
+        self.peaks: Dict[int, int] = {}
+
+    def sample(self):
+        for pid in _children(self.master_pid):
+            self.peaks[pid] = max(self.peaks.get(pid, 0), _rss_bytes(pid))
+
+    async def run(self):
+        if self.master_pid is None:
+            return
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval_s)
+
+# --- Load ---
+
+async def _login(client: httpx.AsyncClient) -> str:
+    response = await client.post("/login", data=ADMIN)
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+async def run_scenario(base_url: str, name: str, fixtures: dict, concurrency: int, duration_s: float, master_pid: Optional[int]) -> dict:
+    endpoint, fixture, content_type = SCENARIOS[name]
+    payload = open(fixtures[fixture], "rb").read() if fixture else None
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=180.0) as client:
+        headers = {"Authorization": f"Bearer {await _login(client)}"}
+        deadline = time.perf_counter() + duration_s
+
+        async def one_request():
+            if payload is None:
+                return await client.post(endpoint, data=ADMIN)
+            files = {"file": (fixture, payload, content_type)}
+            return await client.post(endpoint, files=files, headers=headers)
+
+        async def user():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    status = str((await one_request()).status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        sampler = RssSampler(master_pid)
+        sampler_task = asyncio.create_task(sampler.run())
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        sampler_task.cancel()
+        await asyncio.gather(sampler_task, return_exceptions=True)
+
+    latencies.sort()
+    ok = statuses.get("200", 0)
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "ok": ok,
+        "statuses": statuses,
+        "req_per_s": round(ok / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "peak_rss_mb_per_worker": {str(pid): round(rss / 2**20, 1) for pid, rss in sorted(sampler.peaks.items())},
+    }
+
+# --- Process Management ---
+
+def _spawn(args: List[str], env: dict) -> subprocess.Popen:
+    return subprocess.Popen(args, cwd=APP_DIR, env=env, start_new_session=True)
+
+def _stop(process: subprocess.Popen):
+    if process.poll() is None:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+
+def _wait_healthy(url: str, process: subprocess.Popen, timeout_s: float = 60.0):
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args[0]} exited with {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} not healthy after {timeout_s}s")
+
+def print_report(results: List[dict]):
+    header = f"{'scenario':12s} {'conc':>5s} {'reqs':>6s} {'ok':>6s} {'req/s':>8s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}  peak RSS/worker (MB)"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        rss = ", ".join(f"{mb:.0f}" for mb in r["peak_rss_mb_per_worker"].values()) or "n/a"
+        print(f"{r['scenario']:12s} {r['concurrency']:5d} {r['requests']:6d} {r['ok']:6d} {r['req_per_s']:8.2f} "
+              f"{r['p50_ms']:9.1f} {r['p95_ms']:9.1f} {r['p99_ms']:9.1f}  {rss}")
+        errors = {k: v for k, v in r["statuses"].items() if k != "200"}
+        if errors:
+            print(f"{'':12s} non-200: {errors}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="image,image_large,video,login", help=f"comma list of {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per scenario")
+    parser.add_argument("--workers", type=int, default=None, help="override the Procfile -w")
+    parser.add_argument("--port", type=int, default=8077)
+    parser.add_argument("--fake-port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="fake upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=30.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake upstream 503 ratio")
+    parser.add_argument("--labels", default="artificial", help="fake upstream label schema")
+    parser.add_argument("--cache", action="store_true", help="keep the verdict cache enabled")
+    parser.add_argument("--url", default=None, help="benchmark an already running server instead")
+    parser.add_argument("--json", default=None, help="also write results to this file")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {unknown}")
+    fixtures = ensure_fixtures()
+
+    processes = []
+    master_pid = None
+    base_url = args.url
+    try:
+        if base_url is None:
+            fake = _spawn([
+                sys.executable, "-m", "bench.fake_hf", "--port", str(args.fake_port),
+                "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+                "--error-rate", str(args.error_rate), "--labels", args.labels,
+            ], dict(os.environ))
+            processes.append(fake)
+            _wait_healthy(f"http://127.0.0.1:{args.fake_port}/health", fake)
+
+            env = dict(os.environ)
+            env.update({
+                "PORT": str(args.port),
+                "HF_API_BASE_URL": f"http://127.0.0.1:{args.fake_port}/hf-inference/models",
+                "HF_API_TOKEN": env.get("HF_API_TOKEN") or "bench-token",
+                "RATE_LIMIT_AUTH": UNLIMITED,
+                "RATE_LIMIT_GUEST": UNLIMITED,
+                "RATE_LIMIT_BATCH": UNLIMITED,
+                "VERDICT_CACHE_ENABLED": "true" if args.cache else "false",
+            })
+            app = _spawn(procfile_command(args.port, args.workers), env)
+            processes.append(app)
+            master_pid = app.pid
+            base_url = f"http://127.0.0.1:{args.port}"
+            _wait_healthy(f"{base_url}/health", app)
+
+        results = []
+        for name in scenarios:
+            print(f"Running {name} for {args.duration:.0f}s at concurrency {args.concurrency}...", flush=True)
+            results.append(asyncio.run(run_scenario(base_url, name, fixtures, args.concurrency, args.duration, master_pid)))
+        print()
+        print_report(results)
+        if args.json:
+            os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+            with open(args.json, "w") as out:
+                json.dump({"args": vars(args), "results": results}, out, indent=2)
+    finally:
+        for process in reversed(processes):
+            _stop(process)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Local engine backends side by side: fp32 transformers vs the int8 ONNX export
+(`python -m app.onnx_export`). Reports per-image latency, batched throughput, resident memory
+and how closely the ONNX scores agree with the fp32 pipeline on the same inputs.
+
+    python -m app.onnx_export --out models/detector
+    python -m bench.onnx_engine --onnx models/detector.onnx
+    python -m bench.onnx_engine --onnx models/detector.onnx --images ~/samples --rounds 5 --json bench/results/onnx.json
+
+Inputs are the bench fixture images plus frames sampled from the fixture video (or --images /
+--video), prepared exactly as the API prepares them. Each backend runs in a fresh interpreter,
+so RSS is not polluted by the other one; "shared_mb" is the file-backed part of RSS (the mmapped
+ONNX weights) that other workers on the host reuse instead of paying for again.
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+from PIL import Image
+
+from app.config import settings
+from app.utils import classify_risk, label_fake_probability
+from bench.fixtures import ensure_fixtures
+from bench.loadgen import percentile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+def _load_inputs(images_dir: Optional[str], video: Optional[str], frames_n: int) -> List[Image.Image]:
+    from app.frames import sample_frames
+    from app.preprocess import prepare_image
+
+    fixtures = ensure_fixtures()
+    if images_dir is None:
+        paths = [fixtures[name] for name in ("image_small.jpg", "image_large.jpg", "image.png")]
+    else:
+        images_dir = os.path.expanduser(images_dir)
+        paths = sorted(os.path.join(images_dir, name) for name in os.listdir(images_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+    inputs = []
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        inputs.append(prepare_image(Image.open(io.BytesIO(data)), data)[0])
+    for frame in sample_frames(os.path.expanduser(video or fixtures["video.mp4"]), n=frames_n, mode="uniform"):
+        inputs.append(prepare_image(frame)[0])
+    return inputs
+
+def _memory() -> dict:
+    """Current RSS split into file-backed (shareable) and anonymous (private) pages, plus peak RSS."""
+    fields = {}
+    with open("/proc/self/status") as status:
+        for line in status:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                fields[key] = int(value.split()[0]) / 1024
+    return {
+        "rss_mb": round(fields.get("VmRSS", 0.0), 1),
+        "shared_mb": round(fields.get("RssFile", 0.0), 1),
+        "private_mb": round(fields.get("RssAnon", 0.0), 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+def run_backend(args) -> dict:
+    """Runs in the child interpreter: load, time single images and batches, return scores."""
+    from app.local_engine import local_engine
+
+    inputs = _load_inputs(args.images, args.video, args.frames)
+    baseline = _memory()
+    started = time.perf_counter()
+    local_engine.load()
+    load_s = time.perf_counter() - started
+    local_engine.classify(inputs[:1])  # first-run allocations are not steady state
+
+    latencies, probabilities = [], []
+    for image in inputs:
+        started = time.perf_counter()
+        results = local_engine.classify([image])[0]
+        latencies.append((time.perf_counter() - started) * 1000)
+        probabilities.append(label_fake_probability(results))
+
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        local_engine.classify(inputs)
+    batch_s = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "backend": local_engine.backend,
+        "inputs": len(inputs),
+        "load_s": round(load_s, 2),
+        "latency_p50_ms": round(percentile(latencies, 0.5), 2),
+        "latency_p95_ms": round(percentile(latencies, 0.95), 2),
+        "throughput_ips": round(len(inputs) * args.rounds / batch_s, 2),
+        "memory_before_load": baseline,
+        "memory": _memory(),
+        "probabilities": probabilities,
+    }
+
+def _spawn(backend: str, args) -> dict:
+    env = dict(os.environ, LOCAL_ENGINE_BACKEND=backend)
+    if args.onnx:
+        env["LOCAL_ONNX_MODEL_PATH"] = os.path.abspath(os.path.expanduser(args.onnx))
+    command = [sys.executable, "-m", "bench.onnx_engine", "--child", "--rounds", str(args.rounds), "--frames", str(args.frames)]
+    for flag in ("images", "video"):
+        if getattr(args, flag):
+            command += [f"--{flag}", getattr(args, flag)]
+    result = subprocess.run(command, cwd=APP_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(f"{backend} run failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def agreement(reference: List[Optional[float]], candidate: List[Optional[float]]) -> dict:
+    pairs = [(a, b) for a, b in zip(reference, candidate) if a is not None and b is not None]
+    if not pairs:
+        return {}
+    diffs = sorted(abs(a - b) for a, b in pairs)
+    return {
+        "score_mean_abs_diff": round(sum(diffs) / len(diffs), 4),
+        "score_max_abs_diff": round(diffs[-1], 4),
+        "risk_band_agreement": round(sum(1 for a, b in pairs if classify_risk(a) == classify_risk(b)) / len(pairs), 4),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--onnx", default=settings.LOCAL_ONNX_MODEL_PATH or None, help="<out>.onnx from app.onnx_export")
+    parser.add_argument("--images", default=None, help="directory of JPEG/PNG images (default: bench fixtures)")
+    parser.add_argument("--video", default=None, help="video to sample frames from (default: fixture video)")
+    parser.add_argument("--frames", type=int, default=12, help="frames sampled from the video")
+    parser.add_argument("--rounds", type=int, default=3, help="batched passes over all inputs for throughput")
+    parser.add_argument("--json", default=None, help="also write both runs and the comparison to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_backend(args)))
+        return
+    if not args.onnx:
+        raise SystemExit("--onnx (or LOCAL_ONNX_MODEL_PATH) is required; export one with python -m app.onnx_export")
+
+    runs = {backend: _spawn(backend, args) for backend in ("transformers", "onnx")}
+    summary = {
+        backend: {key: value for key, value in run.items() if key != "probabilities"} for backend, run in runs.items()
+    }
+    summary["onnx_vs_fp32"] = agreement(runs["transformers"]["probabilities"], runs["onnx"]["probabilities"])
+    fp32, int8 = summary["transformers"], summary["onnx"]
+    summary["onnx_vs_fp32"]["latency_p50_speedup"] = round(fp32["latency_p50_ms"] / max(int8["latency_p50_ms"], 1e-6), 2)
+    summary["onnx_vs_fp32"]["throughput_speedup"] = round(int8["throughput_ips"] / max(fp32["throughput_ips"], 1e-6), 2)
+    print(json.dumps(summary, indent=2))
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w") as out:
+            json.dump({"args": vars(args), "summary": summary, "runs": runs}, out, indent=2)
+
+if __name__ == "__main__":
+    main()
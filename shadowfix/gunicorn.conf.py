@@ -0,0 +1,19 @@
+# Picked up automatically by `gunicorn` (see Procfile) from the working directory.
+import os
+import shutil
+import tempfile
+
+# Prometheus multiprocess mode: every worker writes its metrics to this directory and
+# /metrics + /admin/metrics aggregate across all of them. Must be set before workers import the app.
+_metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "shadowfix-metrics")
+)
+
+def on_starting(server):
+    # Stale files from a previous run would be summed into the new totals
+    shutil.rmtree(_metrics_dir, ignore_errors=True)
+    os.makedirs(_metrics_dir, exist_ok=True)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)